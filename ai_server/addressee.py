@@ -0,0 +1,158 @@
+"""
+Cheap local check of whether a chat line is meant for the AI.
+
+Every Minecraft chat line and Discord transcript used to trigger a think.
+AddresseeClassifier.score() gives a line a probability-like score in [0, 1]
+from three things:
+
+  names    the line names the AI or a bot -> 1.0, nothing else matters
+  cues     questions, requests / second person, werewolf-game terms, and
+           whether the AI itself spoke within the last `follow_up` lines (a
+           reply to it rarely repeats its name; call spoke() when it talks)
+  n-grams  character 2/3-gram naive Bayes trained on a small built-in set of
+           addressed / not-addressed lines, so it works for Japanese without
+           a tokenizer; train() adds examples at runtime
+
+Lines scoring at least `threshold` trigger a think; the rest only go into
+the chat history, where the next think still sees them.
+"""
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+# Seed examples: lines that want a reaction from the AI / game master, and table talk that does not
+ADDRESSED = [
+    "ねえ、どう思う?", "誰が人狼だと思う?", "教えて", "こっち来て", "手伝って", "ついてきて",
+    "占い結果は?", "投票どうする?", "誰を吊る?", "助けて!", "今何時?", "ルール教えて",
+    "あなたは人狼?", "怪しいのは誰?", "何してるの?", "一緒に行こう", "次どうすればいい?",
+    "can you help me", "what do you think", "who is the werewolf", "come here", "follow me",
+    "who should we vote for", "are you there?", "what should I do", "tell me the rules",
+]
+NOT_ADDRESSED = [
+    "トイレ行ってくる", "ちょっと待ってて", "ただいま", "おかえり", "まじか", "やばい",
+    "ラグい", "音小さい", "回線落ちた", "ご飯食べてくる", "おなかすいた", "眠い", "おつかれ",
+    "それな", "なるほど", "了解", "りょ", "あーね", "brb", "back", "nice", "lag", "my mic is broken",
+    "I'm hungry", "oops", "same",
+]
+
+# Cue patterns and their weights (log-odds added to the score)
+_QUESTION = re.compile(r"[?？]|(かな|ですか|ますか)$")
+_REQUEST = re.compile(r"(教えて|どう思う|して(くれ|ください|ほしい)?$|ください|ちょうだい|来て|きて|手伝|助けて|お願い|"
+                      r"あなた|きみ|君|お前|おまえ|\byou\b|\bplease\b|\bhelp\b|\bcan you\b|\btell me\b)",
+                      re.IGNORECASE)
+_GAME = re.compile(r"(人狼|占い|霊能|狩人|騎士|村人|役職|投票|吊|処刑|襲撃|護衛|怪し|COし|\bCO\b|"
+                   r"\bwerewolf\b|\bwolf\b|\bvote\b|\bseer\b)", re.IGNORECASE)
+CUE_WEIGHTS = {"question": 1.2, "request": 1.6, "game": 1.4, "follow_up": 1.8}
+BIAS = -1.6
+NGRAM_WEIGHT = 1.0
+
+
+def mentions(text: str, names: Iterable[str]) -> bool:
+    """Whether `text` names any of `names` (whole word for ASCII names, so "AI" does not match "said")"""
+    for name in names:
+        if re.search(rf"(?<![A-Za-z0-9_]){re.escape(name)}(?![A-Za-z0-9_])", text, re.IGNORECASE):
+            return True
+    return False
+
+
+def _ngrams(text: str) -> List[str]:
+    text = " ".join(text.lower().split())
+    padded = f"^{text}$"
+    return [padded[i:i + n] for n in (2, 3) for i in range(len(padded) - n + 1)]
+
+
+class AddresseeClassifier:
+    def __init__(self, threshold: float = 0.4, follow_up: int = 2):
+        self.threshold = threshold
+        self.follow_up = follow_up
+        self._since_spoke = follow_up  # chat lines since the AI last spoke
+        self._counts = {True: Counter(), False: Counter()}
+        self._totals = {True: 0, False: 0}
+        for text in ADDRESSED:
+            self.train(text, True)
+        for text in NOT_ADDRESSED:
+            self.train(text, False)
+        self.scored = 0
+        self.passed = 0
+        self.mentioned = 0
+
+    def train(self, text: str, addressed: bool):
+        grams = _ngrams(text)
+        self._counts[addressed].update(grams)
+        self._totals[addressed] += len(grams)
+
+    def ngram_log_odds(self, text: str) -> float:
+        """Mean per-n-gram log-odds addressed vs not (Laplace-smoothed), so long lines do not dominate"""
+        grams = _ngrams(text)
+        if not grams:
+            return 0.0
+        vocab = len(set(self._counts[True]) | set(self._counts[False])) + 1
+        pos, neg = self._counts[True], self._counts[False]
+        total = sum(math.log((pos[g] + 1) / (self._totals[True] + vocab))
+                    - math.log((neg[g] + 1) / (self._totals[False] + vocab)) for g in grams)
+        return total / len(grams)
+
+    def spoke(self):
+        """The AI just said something; the next `follow_up` lines are likely replies"""
+        self._since_spoke = 0
+
+    def features(self, text: str) -> Dict[str, float]:
+        return {
+            "question": float(bool(_QUESTION.search(text))),
+            "request": float(bool(_REQUEST.search(text))),
+            "game": float(bool(_GAME.search(text))),
+            "follow_up": float(self._since_spoke < self.follow_up),
+            "ngram": self.ngram_log_odds(text),
+        }
+
+    def score(self, text: str, names: Iterable[str] = ()) -> float:
+        """0..1; 1.0 when `text` names one of `names`"""
+        if mentions(text, names):
+            return 1.0
+        f = self.features(text)
+        z = BIAS + NGRAM_WEIGHT * f.pop("ngram") + sum(CUE_WEIGHTS[k] * v for k, v in f.items())
+        return 1 / (1 + math.exp(-z))
+
+    def should_think(self, text: str, names: Iterable[str] = ()) -> bool:
+        """score() >= threshold for a newly received line, counted for stats()"""
+        s = self.score(text, names)
+        self._since_spoke += 1
+        self.scored += 1
+        self.mentioned += s >= 1.0
+        passed = s >= self.threshold
+        self.passed += passed
+        return passed
+
+    def stats(self) -> Dict[str, Any]:
+        return {"threshold": self.threshold, "scored": self.scored, "passed": self.passed,
+                "mentioned": self.mentioned, "skipped": self.scored - self.passed,
+                "skip_rate": (self.scored - self.passed) / self.scored if self.scored else None}
+
+
+def replay(lines: List[Dict[str, Any]], classifier: AddresseeClassifier, names: Iterable[str]) -> Dict[str, Any]:
+    """
+    Run a recorded chat log ([{"sender", "message", optional "addressed": bool}])
+    through the classifier. Returns how many lines would have triggered a think
+    before (all of them) and now, and, for labelled lines, how many addressed
+    lines were missed and how many triggers were not addressed.
+    """
+    names = list(names)
+    total = triggered = missed = false_alarms = labelled = 0
+    for entry in lines:
+        if entry["sender"] in names:  # the AI's own lines are context, not triggers
+            classifier.spoke()
+            continue
+        think = classifier.should_think(entry["message"], names)
+        total += 1
+        triggered += think
+        label: Optional[bool] = entry.get("addressed")
+        if label is not None:
+            labelled += 1
+            missed += label and not think
+            false_alarms += think and not label
+    return {"lines": total, "calls_before": total, "calls_after": triggered,
+            "saved": total - triggered, "saved_rate": (total - triggered) / total if total else None,
+            "labelled": labelled, "missed_addressed": missed, "false_alarms": false_alarms}
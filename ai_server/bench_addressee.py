@@ -0,0 +1,67 @@
+"""
+Replay benchmark for the addressee classifier.
+
+    python bench_addressee.py [chat_log.jsonl] [threshold ...]
+
+Replays a chat log recorded by the server (CHAT_LOG=path, one
+{"sender", "message"} object per line; add "addressed": true/false to lines
+to count misses) and prints, per threshold, how many chat lines would have
+triggered an LLM think before (every line) and with the classifier. Without
+a log it replays a built-in labelled sample of a werewolf game session.
+"""
+import json
+import sys
+import time
+
+from addressee import AddresseeClassifier, replay
+
+NAMES = ["AI", "ボット"]
+
+# (sender, message, addressed); sender "AI" lines are the AI's own chat
+SAMPLE = [
+    ("Steve", "こんばんは", False), ("Alex", "おつかれ", False), ("Steve", "音小さい?", False),
+    ("Alex", "大丈夫", False), ("Steve", "AI、今日のルール教えて", True),
+    ("AI", "今日は 5 人村です。占い師と狩人が 1 人ずついます", None),
+    ("Alex", "狩人いるのか", True), ("Steve", "了解", False), ("Bob", "ちょっと待ってて", False),
+    ("Bob", "ただいま", False), ("Alex", "www", False), ("Steve", "草", False),
+    ("Alex", "誰が人狼だと思う?", True), ("Bob", "Steve 怪しくない?", True),
+    ("Steve", "いや俺村人だって", True), ("Alex", "なるほど", False), ("Bob", "それな", False),
+    ("Steve", "占いCOします", True), ("Alex", "まじか", False), ("Bob", "やばい", False),
+    ("Alex", "投票どうする?", True), ("Steve", "ボット どう思う?", True),
+    ("AI", "Bob さんの発言が少し怪しいと思います", None), ("Bob", "なんで?", True),
+    ("Alex", "ラグい", False), ("Steve", "回線落ちた", False), ("Steve", "戻った", False),
+    ("Alex", "おかえり", False), ("Bob", "眠い", False), ("Alex", "明日学校だ", False),
+    ("Steve", "ダイヤあった", False), ("Alex", "いいな", False), ("Bob", "こっちに来て", True),
+    ("Steve", "gg", False), ("Alex", "ggwp", False), ("Bob", "もう一回やる?", True),
+    ("Steve", "やろう", False), ("Alex", "ok", False), ("Bob", "brb", False), ("Steve", "nice", False),
+]
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    args = sys.argv[1:]
+    lines = None
+    if args and not args[0].replace(".", "", 1).isdigit():
+        lines = load(args.pop(0))
+    if lines is None:
+        lines = [{"sender": s, "message": m, **({} if a is None else {"addressed": a})} for s, m, a in SAMPLE]
+    thresholds = [float(a) for a in args] or [0.0, 0.3, 0.4, 0.5, 0.6]
+
+    print(f"{len(lines)} chat lines, AI names {NAMES}")
+    print(f"{'threshold':>9} {'before':>7} {'after':>6} {'saved':>7} {'missed':>7} {'false+':>7} {'us/line':>8}")
+    for threshold in thresholds:
+        t0 = time.perf_counter()
+        r = replay(lines, AddresseeClassifier(threshold=threshold), NAMES)
+        per_line = (time.perf_counter() - t0) / max(1, r["lines"]) * 1e6
+        missed = f"{r['missed_addressed']}" if r["labelled"] else "-"
+        false_pos = f"{r['false_alarms']}" if r["labelled"] else "-"
+        print(f"{threshold:>9.2f} {r['calls_before']:>7} {r['calls_after']:>6} {r['saved_rate']:>7.0%} "
+              f"{missed:>7} {false_pos:>7} {per_line:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
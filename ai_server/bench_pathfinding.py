@@ -0,0 +1,140 @@
+"""
+Planning latency benchmark for the /v1/mc/next_move path.
+
+    python bench_pathfinding.py [calls]
+
+Feeds a full 33x33x9 terrain snapshot to ParkourBrain, then times
+get_next_action() for random targets anywhere in the window (plus the
+per-snapshot NavGrid build and distance field) and prints p50 / p99 / max.
+
+Then a chase: the bot walks toward a slowly moving target with a new
+snapshot every other call (5 Hz snapshots vs 10 Hz next_move polling), planned
+with A* from scratch vs the incremental D* Lite planner.
+
+Last, 12 bots each taking a snapshot plus two next_move plans per round,
+through BrainRegistry pools of 1 / 2 / 4 / 8 workers (bot-ticks per second).
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from bench_voxel_ingest import make_world, window, RADIUS, HALF_HEIGHT
+from parkour_brain import BrainRegistry, ParkourBrain
+from pathfinding import IncrementalPlanner, NavGrid
+
+
+def percentiles(samples):
+    a = np.sort(np.asarray(samples)) * 1e3
+    return a[len(a) // 2], a[min(len(a) - 1, int(len(a) * 0.99))], a[-1]
+
+
+def snapshot(world, x, z):
+    grid = window(world, x, z)
+    return {"player": {"name": "Bot", "dimension": "minecraft:overworld"},
+            "origin": {"x": x, "y": 64, "z": z}, "radius": RADIUS, "halfHeight": HALF_HEIGHT,
+            "width": grid.shape[1], "height": grid.shape[0], "grid": grid}
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rng = random.Random(0)
+    world = make_world(size=160)
+    brain = ParkourBrain()
+
+    update_t, field_t, plan_t, expanded, found = [], [], [], [], 0
+    for i in range(calls):
+        if i % 10 == 0:
+            x, z = rng.randint(40, 120), rng.randint(40, 120)
+            t0 = time.perf_counter()
+            brain.update_state(snapshot(world, x, z))
+            update_t.append(time.perf_counter() - t0)
+            # Distance field + scoring 16 candidate players against it
+            t0 = time.perf_counter()
+            for _ in range(16):
+                brain.path_distance((rng.randint(-RADIUS, RADIUS), 0, rng.randint(-RADIUS, RADIUS)))
+            field_t.append(time.perf_counter() - t0)
+        target = (rng.randint(-RADIUS, RADIUS), rng.randint(-1, 1), rng.randint(-RADIUS, RADIUS))
+        t0 = time.perf_counter()
+        action = brain.get_next_action(target)
+        plan_t.append(time.perf_counter() - t0)
+        expanded.append(brain.nodes_expanded)
+        found += action["type"] == "move_to"
+
+    print(f"{calls} next_move plans on a {2 * RADIUS + 1}x{2 * RADIUS + 1}x{2 * HALF_HEIGHT + 1} grid "
+          f"({found} with a path)")
+    print("{:<22}{:>10}{:>10}{:>10}".format("ms", "p50", "p99", "max"))
+    print("{:<22}{:>10.2f}{:>10.2f}{:>10.2f}".format("update_state", *percentiles(update_t)))
+    print("{:<22}{:>10.2f}{:>10.2f}{:>10.2f}".format("field + 16 scores", *percentiles(field_t)))
+    print("{:<22}{:>10.2f}{:>10.2f}{:>10.2f}".format("get_next_action", *percentiles(plan_t)))
+    print(f"nodes expanded: mean {np.mean(expanded):.0f}, max {max(expanded)}")
+
+    chase(world, calls, rng)
+    bots(world)
+
+
+def chase(world, calls, rng):
+    planner = IncrementalPlanner()
+    bx, bz, tx, tz = 50, 50, 62, 58
+    times = {"astar": [], "incremental": []}
+    expanded = {"astar": [], "incremental": []}
+    nav = None
+    for i in range(calls):
+        if i % 2 == 0:
+            if i % 20 == 0:
+                tx += rng.choice((0, 1))
+                tz += rng.choice((-1, 0, 1))
+            nav = NavGrid(window(world, bx, bz))
+        start = nav.nearest_standable((HALF_HEIGHT, RADIUS, RADIUS), (2, 1, 1))
+        goal = nav.nearest_standable((HALF_HEIGHT, RADIUS + tz - bz, RADIUS + tx - bx))
+        if start is None or goal is None:
+            continue
+
+        t0 = time.perf_counter()
+        path = nav.astar(start, goal)
+        times["astar"].append(time.perf_counter() - t0)
+        expanded["astar"].append(nav.nodes_expanded)
+
+        t0 = time.perf_counter()
+        path = planner.plan(nav, (bx - RADIUS, 64 - HALF_HEIGHT, bz - RADIUS), start, goal)
+        times["incremental"].append(time.perf_counter() - t0)
+        expanded["incremental"].append(planner.nodes_expanded)
+
+        if i % 2 == 1 and path:
+            _, iz, ix = nav.coords(path[0][0])
+            bx, bz = bx + ix - RADIUS, bz + iz - RADIUS
+
+    print()
+    print(f"chase: {len(times['astar'])} plans, snapshot every 2nd call ({planner.resets} planner resets, "
+          f"{planner.capped} repairs capped, {planner.fallbacks} A* fallbacks)")
+    print("{:<22}{:>10}{:>10}{:>10}{:>10}".format("ms", "p50", "p99", "max", "expanded"))
+    for name in ("astar", "incremental"):
+        print("{:<22}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.0f}".format(
+            name, *percentiles(times[name]), np.mean(expanded[name])))
+
+
+def bots(world, count=12, rounds=20):
+    def tick(brain, x, z, rng):
+        brain.update_state(snapshot(world, x, z))
+        for _ in range(2):
+            brain.get_next_action((rng.randint(-12, 12), 0, rng.randint(-12, 12)))
+
+    print()
+    print(f"{count} bots, {rounds} rounds of snapshot + 2 plans")
+    names = [f"Bot{i}" for i in range(count)]
+    for workers in (1, 2, 4, 8):
+        registry = BrainRegistry(max_workers=workers)
+        t0 = time.perf_counter()
+        for r in range(rounds):
+            futures = [registry.submit(name, tick, 40 + 10 * (i % 10) + r % 3, 60 + 20 * (i // 10), random.Random(r))
+                       for i, name in enumerate(names)]
+            for f in futures:
+                f.result()
+        elapsed = time.perf_counter() - t0
+        registry.pool.shutdown()
+        print(f"{workers:>2} workers {count * rounds / elapsed:>10.1f} bot-ticks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Faster-than-real-time replay of a server journal.
+
+    python bench_replay.py [journal_dir] [speed]
+
+Replays every record of a journal written with JOURNAL_DIR (and
+JOURNAL_FRAMES=1 to include bot views) into a fresh GameMaster and a fresh
+BrainRegistry:
+
+  report  players join the GameMaster, chat goes into a ChatHistory
+  gm      the GameMaster state recorded after /v1/game/start
+  event   hits retarget the bots, as _handle_event does
+  frame   decoded and ingested, then a move is planned (server._tick_brain)
+
+Prints the recorded session length, the replay time and the speed-up, plus
+the mean cost of each record kind. Without a journal it first records a
+synthetic session: 4 bots walking across a bench_voxel_ingest world at 10
+ticks/s for 60 s, with chat every second and a game start. `speed` paces
+the replay at that multiple of real time; by default it runs flat out.
+"""
+import base64
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import parkour_brain
+import server
+import voxel_codec
+from bench_voxel_ingest import HALF_HEIGHT, RADIUS, make_world, window
+from game_master import GameMaster, GameState
+from journal import Journal, replay
+from parkour_brain import BrainRegistry
+from player_index import PlayerIndex
+from prompt_builder import ChatHistory
+
+BOTS = 4
+SECONDS = 60
+TICK_HZ = 10
+
+
+def record_session(directory):
+    """Write a synthetic session journal; returns its directory"""
+    rng = np.random.default_rng(0)
+    world = make_world(size=256)
+    j = Journal(directory, fsync_interval=0.05)
+    j.open()
+    t0 = time.time() - SECONDS
+    players = [{"name": f"Bot{b}", "location": {"x": 40.0, "y": 64.0, "z": 40.0 + 8 * b}, "tags": {}}
+               for b in range(BOTS)] + [{"name": "Steve", "location": {"x": 60.0, "y": 64.0, "z": 60.0}, "tags": {}}]
+    last = {}
+    for step in range(SECONDS * TICK_HZ):
+        t = t0 + step / TICK_HZ
+        if step % TICK_HZ == 0:
+            j.append("report", {"players": players, "chats": [{"sender": "Steve", "message": f"chat {step}"}]}, t)
+        if step == TICK_HZ:
+            gm = GameMaster()
+            for p in players:
+                gm.add_player(p["name"])
+            gm.start_game({"werewolf": 1})
+            j.append("gm", gm.state.dict(), t)
+        if step == 5 * TICK_HZ:
+            j.append("event", {"type": "hit", "victim": "Bot0", "attacker": "Steve", "timestamp": t}, t)
+        for b in range(BOTS):
+            name = f"Bot{b}"
+            x, z = 40 + step // 4 % 160, 40 + 8 * b
+            origin = (x - RADIUS, 64 - HALF_HEIGHT, z - RADIUS)
+            grid = window(world, x, z)
+            seq = step + 1
+            if name in last and rng.random() > 0.05:
+                prev_grid, prev_origin = last[name]
+                body = voxel_codec.encode_delta(*voxel_codec.diff_frames(prev_grid, prev_origin, grid, origin),
+                                                origin, RADIUS, HALF_HEIGHT, seq - 1, seq, name)
+            else:
+                body = voxel_codec.encode_frame(grid, origin, RADIUS, HALF_HEIGHT, name, seq=seq)
+            last[name] = (grid, origin)
+            j.append("frame", {"player": name, "frame": base64.b64encode(body).decode("ascii")}, t)
+    j.close()
+    return directory
+
+
+class Target:
+    """What the journal is replayed into"""
+
+    def __init__(self):
+        self.gm = GameMaster()
+        self.brains = BrainRegistry()
+        self.chat = ChatHistory()
+        self.index = PlayerIndex([])
+        self.cost = defaultdict(float)
+
+    def timed(self, kind, fn):
+        def handler(data):
+            t0 = time.perf_counter()
+            fn(data)
+            self.cost[kind] += time.perf_counter() - t0
+        return handler
+
+    def report(self, data):
+        for p in data["players"]:
+            self.gm.add_player(p["name"])
+        for chat in data["chats"]:
+            self.chat.append(chat)
+        self.index = PlayerIndex(data["players"])
+
+    def gm_state(self, data):
+        self.gm.state = GameState(**data)
+
+    def event(self, data):
+        if data["type"] == "hit" and self.brains.get(data["victim"], create=False):
+            self.brains.run(data["victim"], lambda brain: brain.set_target_player(data["attacker"]))
+
+    def frame(self, data):
+        frame = voxel_codec.decode_body(data["frame"].encode("ascii"), is_base64=True)
+        cells = voxel_codec.decode_delta(frame) if frame.kind == voxel_codec.FRAME_DELTA else voxel_codec.decode_cells(frame)
+        self.brains.run(data["player"], server._tick_brain, data["player"], frame, cells, None, self.index)
+
+    def handlers(self):
+        return {"report": self.timed("report", self.report), "gm": self.timed("gm", self.gm_state),
+                "event": self.timed("event", self.event), "frame": self.timed("frame", self.frame)}
+
+
+def main():
+    args = sys.argv[1:]
+    directory = args.pop(0) if args and not args[0].replace(".", "", 1).isdigit() else None
+    speed = float(args[0]) if args else None
+    if directory is None:
+        directory = record_session(tempfile.mkdtemp(prefix="journal-"))
+        print(f"recorded a synthetic session ({BOTS} bots, {SECONDS}s) in {directory}")
+    size = sum(os.path.getsize(os.path.join(directory, n)) for n in os.listdir(directory))
+    print(f"journal: {size / 1e6:.1f} MB")
+
+    target = Target()
+    parkour_brain.brains = target.brains  # _tick_brain's move planning looks bots up here
+    server._last_frame_seq.clear()
+    r = replay(Journal(directory).replay_records(), target.handlers(), speed=speed)
+    print(f"recorded {r['recorded_seconds']:.1f}s, replayed in {r['replay_seconds']:.2f}s "
+          f"-> {r['speedup']:.1f}x real time")
+    print(f"{'kind':>8} {'records':>8} {'ms/record':>10}")
+    for kind, n in sorted(r["records"].items()):
+        print(f"{kind:>8} {n:>8} {target.cost[kind] / n * 1e3:>10.3f}")
+    alive = sum(p.is_alive for p in target.gm.state.players.values())
+    print(f"GameMaster: phase={target.gm.state.phase}, {alive} players alive; "
+          f"brains: {sorted(target.brains.names())}; chat turns {len(target.chat)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+JSON vs packed voxel ingestion benchmark.
+
+    python bench_voxel_ingest.py [iterations]
+
+Measures body size, parse time (body -> uint8/int grid ready for the brain)
+and peak allocation per frame for a 33x33x9 snapshot, then the cost of a
+one-block move sent as a keyframe vs a delta frame applied to ParkourBrain.
+"""
+import base64
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import voxel_codec
+from parkour_brain import ParkourBrain
+from server import VoxelSnapshot
+
+RADIUS = 16
+HALF_HEIGHT = 4
+
+
+def make_world(seed=0, size=128):
+    """Terrain-ish heightmap world (Y, Z, X): solid below the feet with bumps, a pond, air above"""
+    rng = np.random.default_rng(seed)
+    h = 2 * HALF_HEIGHT + 1
+    world = np.zeros((h, size, size), dtype=np.uint8)
+    ground = HALF_HEIGHT + rng.integers(-1, 2, size=(size, size))
+    ys = np.arange(h)[:, None, None]
+    world[ys < ground[None]] = 1
+    world[HALF_HEIGHT - 1, 60:66, 44:50] = 2
+    return world
+
+
+def window(world, ox, oz):
+    """33x33x9 sensor window centred on (ox, oz) of a make_world() world"""
+    return np.ascontiguousarray(world[:, oz - RADIUS:oz + RADIUS + 1, ox - RADIUS:ox + RADIUS + 1])
+
+
+def make_grid(seed=0):
+    return window(make_world(seed), 40, 40)
+
+
+def json_body(grid):
+    return json.dumps({
+        "player": {"name": "Bot", "pos": {"x": 0.5, "y": 64.0, "z": 0.5}, "rot": {"x": 0, "y": 0},
+                   "dimension": "minecraft:overworld"},
+        "origin": {"x": 0, "y": 64, "z": 0},
+        "radius": RADIUS,
+        "halfHeight": HALF_HEIGHT,
+        "width": grid.shape[1],
+        "height": grid.shape[0],
+        "grid": grid.ravel().tolist(),
+    }).encode()
+
+
+def ingest_json(body):
+    snap = VoxelSnapshot(**json.loads(body))
+    return np.array(snap.grid).reshape((snap.height, snap.width, snap.width))
+
+
+def ingest_packed(body, is_b64):
+    frame = voxel_codec.decode_body(body, is_base64=is_b64)
+    return voxel_codec.decode_cells(frame).reshape((frame.height, frame.width, frame.width))
+
+
+def measure(fn, iterations):
+    fn()  # warm up
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call = (time.perf_counter() - t0) / iterations
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_call, peak
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    grid = make_grid()
+
+    cases = [("json", json_body(grid), lambda b: ingest_json(b))]
+    for enc_name, enc in (("raw", voxel_codec.ENC_RAW), ("packed2", voxel_codec.ENC_PACKED2),
+                          ("rle", voxel_codec.ENC_RLE)):
+        raw = voxel_codec.encode_frame(grid, (0, 64, 0), RADIUS, HALF_HEIGHT, "Bot", encoding=enc)
+        cases.append((f"{enc_name}", raw, lambda b: ingest_packed(b, False)))
+        cases.append((f"{enc_name}+b64", base64.b64encode(raw), lambda b: ingest_packed(b, True)))
+
+    print(f"grid {grid.shape}, {grid.size} cells, {iterations} iterations")
+    print(f"{'mode':<14}{'bytes':>10}{'parse us':>12}{'peak KiB':>12}")
+    for name, body, fn in cases:
+        assert np.array_equal(fn(body), grid), name
+        per_call, peak = measure(lambda: fn(body), iterations)
+        print(f"{name:<14}{len(body):>10}{per_call * 1e6:>12.1f}{peak / 1024:>12.1f}")
+
+    # One-block move back and forth: keyframes vs deltas into the brain's rolling buffer
+    world = make_world()
+    a, b = (40, 64, 40), (41, 64, 40)
+    ga, gb = window(world, 40, 40), window(world, 41, 40)
+    keys = [voxel_codec.encode_frame(g, o, RADIUS, HALF_HEIGHT, "Bot", seq=1) for g, o in ((ga, a), (gb, b))]
+    deltas = [
+        voxel_codec.encode_delta(*voxel_codec.diff_frames(ga, a, gb, b), b, RADIUS, HALF_HEIGHT, 1, 1, "Bot"),
+        voxel_codec.encode_delta(*voxel_codec.diff_frames(gb, b, ga, a), a, RADIUS, HALF_HEIGHT, 1, 1, "Bot"),
+    ]
+    brain = ParkourBrain()
+
+    def apply_keys():
+        for body in keys:
+            frame = voxel_codec.parse_frame(body)
+            brain.update_state(voxel_codec.frame_to_snapshot(frame, voxel_codec.decode_cells(frame)))
+
+    def apply_deltas():
+        for body in deltas:
+            frame = voxel_codec.parse_frame(body)
+            _, indices, values = voxel_codec.decode_delta(frame)
+            assert brain.apply_delta(frame.origin, indices, values, 1, 1)
+
+    apply_keys()
+    apply_deltas()
+    assert np.array_equal(brain.voxel_grid, ga)
+    key_t, key_peak = measure(apply_keys, iterations)
+    delta_t, delta_peak = measure(apply_deltas, iterations)
+
+    print()
+    print("one-block move into ParkourBrain (per frame)")
+    print(f"{'mode':<14}{'bytes':>10}{'apply us':>12}{'peak KiB':>12}")
+    print(f"{'keyframe':<14}{len(keys[1]):>10}{key_t / 2 * 1e6:>12.1f}{key_peak / 1024:>12.1f}")
+    print(f"{'delta':<14}{len(deltas[0]):>10}{delta_t / 2 * 1e6:>12.1f}{delta_peak / 1024:>12.1f}")
+
+if __name__ == "__main__":
+    main()
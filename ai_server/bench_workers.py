@@ -0,0 +1,147 @@
+"""
+Request throughput of the server at 1, 2 and 4 workers.
+
+    python bench_workers.py [seconds] [workers ...]
+
+Starts `WORKERS=N python server.py` on N free ports for each N, with
+STATE_BACKEND=sqlite on a fresh database (plus one run on the in-process
+backend with 1 worker, as the baseline). It then drives a request mix from
+an httpx client with 32 requests in flight:
+
+  tick      a 33x33x9 keyframe for one of 4 bots (decode, ingest, plan),
+            sent to that bot's worker as main.js does
+  report    player positions, no chat, so no LLM call
+  commands  a command_request followed by a /v1/mc/commands poll
+
+Reports and commands go to worker 0.
+
+Prints requests/s and p50/p99 latency per configuration. The speed-up is
+bounded by the cores on the machine, since the load generator runs on
+them too.
+"""
+import asyncio
+import base64
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+import voxel_codec
+from bench_voxel_ingest import HALF_HEIGHT, RADIUS, make_world, window
+from server import bot_worker
+
+IN_FLIGHT = 32
+BOTS = 4
+
+
+def free_ports(n):
+    """First of n consecutive free ports (worker i listens on base + i)"""
+    while True:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            base = s.getsockname()[1]
+        try:
+            for port in range(base, base + n):
+                with socket.socket() as s:
+                    s.bind(("127.0.0.1", port))
+            return base
+        except OSError:
+            continue
+
+
+def start_server(workers, backend, db):
+    port = free_ports(workers)
+    env = dict(os.environ, STATE_BACKEND=backend, STATE_DB=db, LLM_API_BASE="http://127.0.0.1:9/v1",
+               WORKERS=str(workers), PORT=str(port))
+    env.pop("JOURNAL_DIR", None)
+    proc = subprocess.Popen([sys.executable, "server.py"], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    for i in range(workers):
+        while True:
+            if time.monotonic() > deadline or proc.poll() is not None:
+                proc.kill()
+                raise RuntimeError(f"server with {workers} worker(s) did not start")
+            try:
+                httpx.get(f"http://127.0.0.1:{port + i}/v1/debug/bus", timeout=2).raise_for_status()
+                break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+    for i in range(workers):
+        httpx.post(f"http://127.0.0.1:{port + i}/v1/mc/bots", json={"bots": [f"Bot{b}" for b in range(BOTS)]},
+                   timeout=5).raise_for_status()
+    return proc, port
+
+
+def requests(port, workers):
+    world = make_world()
+    ticks = []  # (url of the bot's worker, body with a keyframe)
+    for b in range(BOTS):
+        name = f"Bot{b}"
+        body = voxel_codec.encode_frame(window(world, 40 + b, 40), (40 + b - RADIUS, 64 - HALF_HEIGHT, 40 - RADIUS),
+                                        RADIUS, HALF_HEIGHT, name, seq=1)
+        url = f"http://127.0.0.1:{port + bot_worker(name, workers)}/v1/mc/tick"
+        ticks.append((url, {"player": name, "frame": base64.b64encode(body).decode("ascii")}))
+    base = f"http://127.0.0.1:{port}"
+    players = [{"name": "Steve", "location": {"x": 44.0, "y": 64.0, "z": 44.0}, "tags": {}}]
+    n = 0
+    while True:
+        n += 1
+        url, tick = ticks[n % BOTS]
+        yield "tick", ("POST", url, {"json": tick})
+        yield "report", ("POST", base + "/v1/report", {"json": {"players": players, "chats": []}})
+        command = {"type": "camera_control", "player": "Steve", "target": "next"}
+        yield "commands", ("POST", base + "/v1/mc/command_request", {"json": command})
+        yield "commands", ("GET", base + "/v1/mc/commands", {})
+
+
+async def drive(port, workers, seconds):
+    latencies = []
+    errors = 0
+    source = requests(port, workers)
+    end = time.monotonic() + seconds
+
+    async def worker(client):
+        nonlocal errors
+        while time.monotonic() < end:
+            _, (method, path, kwargs) = next(source)
+            t0 = time.perf_counter()
+            resp = await client.request(method, path, **kwargs)
+            latencies.append(time.perf_counter() - t0)
+            errors += resp.status_code >= 400
+
+    limits = httpx.Limits(max_connections=IN_FLIGHT, max_keepalive_connections=IN_FLIGHT)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        t0 = time.monotonic()
+        await asyncio.gather(*(worker(client) for _ in range(IN_FLIGHT)))
+        elapsed = time.monotonic() - t0
+    latencies.sort()
+    return {"rps": len(latencies) / elapsed, "p50": latencies[len(latencies) // 2],
+            "p99": latencies[int(len(latencies) * 0.99)], "requests": len(latencies), "errors": errors}
+
+
+def main():
+    args = sys.argv[1:]
+    seconds = float(args.pop(0)) if args else 10.0
+    counts = [int(a) for a in args] or [1, 2, 4]
+    print(f"{os.cpu_count()} CPU(s), {IN_FLIGHT} requests in flight, {seconds:.0f}s per run")
+    print(f"{'backend':>8} {'workers':>7} {'req/s':>8} {'p50 ms':>7} {'p99 ms':>7} {'errors':>6}")
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = [("memory", 1)] + [("sqlite", n) for n in counts]
+        for i, (backend, workers) in enumerate(runs):
+            proc, port = start_server(workers, backend, os.path.join(tmp, f"state{i}.db"))
+            try:
+                r = asyncio.run(drive(port, workers, seconds))
+            finally:
+                proc.terminate()
+                proc.wait(30)
+            print(f"{backend:>8} {workers:>7} {r['rps']:>8.0f} {r['p50'] * 1e3:>7.1f} {r['p99'] * 1e3:>7.1f} "
+                  f"{r['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
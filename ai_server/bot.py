@@ -28,6 +28,7 @@ import asyncio
 import httpx
 
 POST_BASE = os.getenv("MC_API_BASE", "http://127.0.0.1:8082")
+PULL_WAIT = float(os.getenv("DISCORD_PULL_WAIT", "25"))  # /v1/discord/pull のロングポーリング秒数
 audio = AudioProcessor(post_url=POST_BASE)
 speaker = DiscordSpeaker()
 
@@ -202,97 +203,6 @@ class UnmuteView(discord.ui.View):
         except Exception as e:
             await interaction.followup.send(f"エラー: {e}", ephemeral=True)
 
-async def poll_server_for_speech():
-    """定期的にServerに聞きに行き、喋る内容があればVCで再生する"""
-    async with httpx.AsyncClient() as client:
-        while True:
-            try:
-                # 誰かがいるVCを探して再生対象にする (簡易ロジック: 最初のVoiceClient)
-                target_vc = None
-                if bot.voice_clients:
-                    target_vc = bot.voice_clients[0]
-
-                if target_vc and target_vc.is_connected():
-                    resp = await client.post(f"{POST_BASE}/v1/discord/pull")
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        for event in data.get("events", []):
-                            if event.get("type") == "speak":
-                                text = event.get("text", "")
-                                if text:
-                                    print(f"[Speaking] {text}")
-                                    try:
-                                        # VOICEVOXで生成して再生
-                                        wav = await voicevox_wav_bytes(text)
-                                        await speaker.speak_wav(target_vc, wav)
-                                    except Exception as e:
-                                        print(f"[TTS Error] {e}")
-
-                            elif event.get("type") == "mute":
-                                target_user_id = event.get("discord_id") 
-                                # If server sends discord_id directly (implied logic), logic works.
-                                # But if server sends "mc_name", we need mapping.
-                                mc_attrs = event.get("mc_name")
-                                if not target_user_id and mc_attrs:
-                                    # Reverse lookup or check mapping
-                                    # Mapping is Discord ID -> MC Name? Or MC Name -> Discord ID?
-                                    # id_mapping = { "discord_id_str": "mc_name" }
-                                    # So we need to iterate or create reverse map.
-                                    # Or store bidirectional.
-                                    for did, mcn in id_mapping.items():
-                                        if mcn == mc_attrs:
-                                            target_user_id = int(did)
-                                            break
-
-                                if target_user_id and target_vc and target_vc.guild:
-                                    member = target_vc.guild.get_member(int(target_user_id))
-                                    if member:
-                                        try:
-                                            await member.edit(mute=True, reason="Dead in Minecraft")
-                                            print(f"[Mute] Executed for {member.display_name}")
-                                        except Exception as e:
-                                            print(f"[Mute Error] {e}")
-
-                            elif event.get("type") == "unmute":
-                                # ... similar logic ...
-                                pass
-                                
-                            elif event.get("type") == "death_report":
-                                # Format: { "type": "death_report", "victim": "Steve", "killer": "Zombie" }
-                                victim_name = event.get("victim")
-                                killer_name = event.get("killer", "Unknown")
-                                
-                                # Find Discord User
-                                target_uid = None
-                                for did, mcn in id_mapping.items():
-                                    if mcn == victim_name:
-                                        target_uid = int(did)
-                                        break
-                                
-                                if target_uid:
-                                    # Mute First
-                                    if target_vc and target_vc.guild:
-                                        member = target_vc.guild.get_member(target_uid)
-                                        if member:
-                                            await member.edit(mute=True, reason="Died in MC")
-                                            
-                                            # Send DM
-                                            try:
-                                                view = UnmuteView()
-                                                await member.send(
-                                                    f"💀 **あなたは死亡しました！**\n死因/キラー: {killer_name}\n\n発言したい場合は下のボタンを押してください（30秒間ミュート解除）。",
-                                                    view=view
-                                                )
-                                                print(f"[DM Sent] to {member.display_name}")
-                                            except Exception as e:
-                                                print(f"[DM Error] {e}")
-
-            except Exception as e:
-                # 接続エラーなどは無視してリトライ
-                pass
-            
-            await asyncio.sleep(1.0)
-
 # PCM受信用のSink
 class PcmSink(voice_recv.AudioSink):
     def wants_opus(self) -> bool:
@@ -414,10 +324,26 @@ async def set_result_channel(interaction: discord.Interaction, channel: discord.
     save_bot_config()
     await interaction.response.send_message(f"試合結果の送信先を {channel.mention} に設定しました。", ephemeral=True)
 
+async def _timed_unmute(member: discord.Member, seconds: int = 30):
+    """ゴーストからのミュート解除要求: seconds 秒だけ解除して再ミュートする"""
+    try:
+        await member.edit(mute=False, reason="Dead player Unmute Request (in game)")
+        await asyncio.sleep(seconds)
+        await member.edit(mute=True, reason="Dead player Auto Re-mute")
+    except Exception as e:
+        print(f"[Unmute Error] {e}")
+
 async def poll_server_for_speech():
-    """定期的にServerに聞きに行き、喋る内容があればVCで再生する"""
-    async with httpx.AsyncClient() as client:
+    """定期的にServerに聞きに行き、喋る内容があればVCで再生する
+
+    カーソル方式で受け取る: 処理し終えたイベントの id を次の pull で ack する。
+    ack 前に落ちても、再起動後に未処理のイベントから受け取り直せる。
+    ロングポーリング: サーバーはイベントが積まれた瞬間に応答するので、待たずに次の pull を出す。
+    """
+    cursor = None
+    async with httpx.AsyncClient(timeout=PULL_WAIT + 10.0) as client:
         while True:
+            delivered = False
             try:
                 # 誰かがいるVCを探して再生対象にする (簡易ロジック: 最初のVoiceClient)
                 target_vc = None
@@ -425,10 +351,14 @@ async def poll_server_for_speech():
                     target_vc = bot.voice_clients[0]
 
                 if target_vc and target_vc.is_connected():
-                    resp = await client.post(f"{POST_BASE}/v1/discord/pull")
+                    resp = await client.post(f"{POST_BASE}/v1/discord/pull",
+                                             json={"consumer": "voice", "ack": cursor, "wait": PULL_WAIT})
                     if resp.status_code == 200:
+                        delivered = True
                         data = resp.json()
                         for event in data.get("events", []):
+                            # 処理済みとして扱う (1 件の失敗で後続が止まらないように、失敗しても進める)
+                            cursor = event.get("id", cursor)
                             if event.get("type") == "speak":
                                 text = event.get("text", "")
                                 if text:
@@ -461,6 +391,16 @@ async def poll_server_for_speech():
                             elif event.get("type") == "unmute":
                                 # ... similar logic ...
                                 pass
+
+                            elif event.get("type") == "unmute_request":
+                                # ゴーストがアメジストで送ったミュート解除要求
+                                mc_name = event.get("mc_name")
+                                for did, mcn in id_mapping.items():
+                                    if mcn == mc_name and target_vc.guild:
+                                        member = target_vc.guild.get_member(int(did))
+                                        if member:
+                                            asyncio.create_task(_timed_unmute(member))
+                                        break
                                 
                             elif event.get("type") == "death_report":
                                 victim_name = event.get("victim")
@@ -516,7 +456,8 @@ async def poll_server_for_speech():
                 # 接続エラーなどは無視してリトライ
                 pass
             
-            await asyncio.sleep(1.0)
+            if not delivered:  # VC 未接続 / サーバーに繋がらない間だけ間隔を空ける
+                await asyncio.sleep(1.0)
 
 @bot.tree.command(name="join", description="あなたのいるVCに参加", guild=discord.Object(id=GUILD_ID) if GUILD_ID else None)
 async def join(interaction: discord.Interaction):
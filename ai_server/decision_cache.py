@@ -0,0 +1,69 @@
+"""
+LRU + TTL cache of LLM decisions keyed on a normalized game situation.
+
+fingerprint() reduces what a think prompt is built from to a stable key:
+the mode, each player's name, tags and position quantized to `quantum`
+blocks, and the last `recent` chat lines with case and whitespace
+normalized. Two thinks whose situation differs only by players shuffling
+within a block or two get the same key, and the second reuses the first
+decision instead of calling the model.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from prompt_builder import ChatHistory
+
+
+def fingerprint(mode: str, players: List[Dict[str, Any]], history: ChatHistory,
+                quantum: int = 4, recent: int = 5) -> str:
+    norm_players = sorted(
+        (p["name"],
+         [int(p["location"][a] // quantum) for a in ("x", "y", "z")],
+         sorted(t for ts in p.get("tags", {}).values() for t in ts))
+        for p in players)
+    norm_chat = [(c["sender"], " ".join(c["message"].lower().split())) for c in history.recent(recent)]
+    raw = json.dumps([mode, norm_players, norm_chat], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class DecisionCache:
+    def __init__(self, max_entries: int = 256, ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """A copy of the cached decision, or None"""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] > self.ttl:
+            del self._entries[key]
+            self.expired += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry[1])
+
+    def put(self, key: str, decision: Dict[str, Any]):
+        self._entries[key] = (time.monotonic(), dict(decision))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "expired": self.expired, "evictions": self.evictions}
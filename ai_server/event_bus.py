@@ -0,0 +1,242 @@
+"""
+In-process event bus with sequenced, bounded topics and per-consumer cursors.
+
+Producers publish() dicts to a named topic ("mc", "mc/Bot1", "discord", ...).
+Each topic numbers its events 1, 2, 3, ... and keeps at most `max_events` of
+them in a deque, so publishing is O(1) and memory is bounded. When a topic
+overflows, its oldest events are dropped and counted.
+
+Consumers pull() by name and get the events after their cursor:
+
+  cursor mode   pull(topic, consumer, ack=n) first acknowledges everything up
+                to id n, then returns what follows. Events are delivered
+                again until acknowledged, so a consumer that crashes
+                mid-batch gets them again after it restarts.
+  auto-ack      pull(topic, consumer) with auto_ack=True acknowledges the
+                events as it returns them. This matches the old
+                copy-and-clear lists, for clients that send no cursor.
+
+Events acknowledged by every consumer that has pulled the topic are
+released right away. A lock around every operation makes the bus safe for
+FastAPI's sync handlers, which run in a thread pool, and for async handlers
+on the event loop.
+
+pull_wait() is the long-poll form. When nothing is pending it parks a
+future in the topics' waiter lists and returns as soon as a publish wakes
+it, or with nothing once `timeout` passes. Publishers from any thread wake
+waiters through their own loop's call_soon_threadsafe.
+
+With a `journal` (anything with append(kind, data)), every publish and every
+cursor advance is recorded as a "publish" / "ack" record while the lock is
+held, so the records are in bus order. After a restart, load() a dump() and
+restore() the records that follow it to get back the undelivered events.
+restore() is idempotent, so a record that is also in the dump does no harm.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+
+class _Topic:
+    def __init__(self, max_events: int):
+        self.events: Deque[Tuple[int, Dict[str, Any]]] = deque()
+        self.max_events = max_events
+        self.last_seq = 0
+        self.cursors: Dict[str, int] = {}  # consumer -> last acknowledged id
+        self.published = 0
+        self.dropped = 0  # overflowed before every consumer acknowledged them
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def first_seq(self) -> int:
+        return self.events[0][0] if self.events else self.last_seq + 1
+
+    def release(self):
+        """Drop events every consumer has acknowledged"""
+        if not self.cursors:
+            return
+        done = min(self.cursors.values())
+        while self.events and self.events[0][0] <= done:
+            self.events.popleft()
+
+
+class EventBus:
+    def __init__(self, max_events: int = 1024, journal: Any = None):
+        self.max_events = max_events
+        self.journal = journal
+        self._topics: Dict[str, _Topic] = {}
+        self._lock = threading.RLock()  # re-entered when a journal append takes a checkpoint via dump()
+        self.waits = 0  # long polls that had to park
+        self.wakeups = 0  # ... and were woken by a publish (the rest timed out)
+
+    def _topic(self, name: str) -> _Topic:
+        topic = self._topics.get(name)
+        if topic is None:
+            topic = self._topics[name] = _Topic(self.max_events)
+        return topic
+
+    def publish(self, topic: str, event: Dict[str, Any]) -> int:
+        """Append `event` to `topic`; returns its id"""
+        with self._lock:
+            t = self._topic(topic)
+            t.last_seq += 1
+            seq = t.last_seq
+            t.events.append((seq, event))
+            t.published += 1
+            if len(t.events) > t.max_events:
+                t.events.popleft()
+                t.dropped += 1
+            if self.journal is not None:
+                self.journal.append("publish", {"topic": topic, "id": seq, "event": event})
+            waiters, t.waiters = t.waiters, []
+        for loop, fut in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, fut)
+            except RuntimeError:  # that loop is closed
+                pass
+        return seq
+
+    def pull(self, topic: str, consumer: str, ack: Optional[int] = None, limit: int = 100,
+             auto_ack: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        (events, cursor): up to `limit` events after the consumer's cursor,
+        each a copy with its "id", and the id of the last one (or the current
+        cursor when there is nothing new).
+        """
+        with self._lock:
+            t = self._topic(topic)
+            cursor = t.cursors.get(consumer, t.first_seq() - 1)
+            if ack is not None:
+                cursor = max(cursor, min(ack, t.last_seq))
+            start = max(0, cursor + 1 - t.first_seq())  # ids are contiguous within the deque
+            batch = list(itertools.islice(t.events, start, start + limit))
+            events = [dict(event, id=seq) for seq, event in batch]
+            if events:
+                last = events[-1]["id"]
+                if auto_ack:
+                    cursor = last
+            else:
+                last = cursor
+            if self.journal is not None and cursor != t.cursors.get(consumer):
+                self.journal.append("ack", {"topic": topic, "consumer": consumer, "cursor": cursor})
+            t.cursors[consumer] = cursor
+            t.release()
+            return events, last
+
+    def _park(self, topics: Sequence[str], consumer: str, cursors: Dict[str, int]) -> Optional[asyncio.Future]:
+        """A future woken by the next publish to `topics`, or None if one of them already has news"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            ts = [self._topic(name) for name in topics]
+            if any(t.last_seq > cursors[name] for name, t in zip(topics, ts)):
+                return None
+            fut = loop.create_future()
+            for t in ts:
+                t.waiters.append((loop, fut))
+            return fut
+
+    def _unpark(self, topics: Sequence[str], fut: asyncio.Future):
+        with self._lock:
+            for name in topics:
+                t = self._topics[name]
+                t.waiters = [w for w in t.waiters if w[1] is not fut]
+
+    async def pull_wait(self, topics: Sequence[str], consumer: str, timeout: float,
+                        ack: Optional[Dict[str, int]] = None, limit: int = 100,
+                        auto_ack: bool = False) -> Dict[str, Tuple[List[Dict[str, Any]], int]]:
+        """
+        Long-poll pull() over several topics: {topic: (events, cursor)} as
+        soon as any of them has events for `consumer`, or all empty after
+        `timeout` seconds. `ack` maps topic -> id, as in pull().
+        """
+        ack = ack or {}
+        end = time.monotonic() + timeout
+        parked = False
+        while True:
+            result = {name: self.pull(name, consumer, ack=ack.get(name), limit=limit, auto_ack=auto_ack)
+                      for name in topics}
+            remaining = end - time.monotonic()
+            if any(events for events, _ in result.values()) or remaining <= 0:
+                return result
+            ack = {name: cursor for name, (_, cursor) in result.items()}
+            fut = self._park(topics, consumer, ack)
+            if fut is None:
+                continue
+            if not parked:
+                parked = True
+                self.waits += 1
+            try:
+                await asyncio.wait_for(fut, remaining)
+                self.wakeups += 1
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._unpark(topics, fut)
+
+    def drain(self, topic: str, consumer: str) -> List[Dict[str, Any]]:
+        """Every pending event, acknowledged on return (the old copy-and-clear)"""
+        events: List[Dict[str, Any]] = []
+        while True:
+            batch, _ = self.pull(topic, consumer, auto_ack=True)
+            events += batch
+            if not batch:
+                return events
+
+    def topics(self, prefix: str = "") -> List[str]:
+        with self._lock:
+            return [name for name in self._topics if name.startswith(prefix)]
+
+    def pending(self, topic: str) -> List[Dict[str, Any]]:
+        """Events still held for `topic`, without ids (for tests and debugging)"""
+        with self._lock:
+            t = self._topics.get(topic)
+            return [event for _, event in t.events] if t else []
+
+    def dump(self) -> Dict[str, Any]:
+        """JSON-able state of every topic: held events, last id and cursors"""
+        with self._lock:
+            return {name: {"last_id": t.last_seq, "cursors": dict(t.cursors),
+                           "events": [[seq, event] for seq, event in t.events]}
+                    for name, t in self._topics.items()}
+
+    def load(self, state: Dict[str, Any]):
+        """Replace the topics with a dump() (waiters are not kept)"""
+        with self._lock:
+            self._topics = {}
+            for name, d in state.items():
+                t = self._topic(name)
+                t.last_seq = d["last_id"]
+                t.cursors = dict(d["cursors"])
+                t.events.extend((seq, event) for seq, event in d["events"])
+
+    def restore(self, kind: str, data: Dict[str, Any]):
+        """Apply a journalled "publish" or "ack" record; already-applied ones are skipped"""
+        with self._lock:
+            t = self._topic(data["topic"])
+            if kind == "publish":
+                if data["id"] <= t.last_seq:
+                    return
+                t.last_seq = data["id"]
+                t.events.append((data["id"], data["event"]))
+                t.published += 1
+                if len(t.events) > t.max_events:
+                    t.events.popleft()
+                    t.dropped += 1
+            elif kind == "ack":
+                t.cursors[data["consumer"]] = max(data["cursor"], t.cursors.get(data["consumer"], 0))
+                t.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: {"last_id": t.last_seq, "held": len(t.events), "published": t.published,
+                           "dropped": t.dropped, "waiting": len(t.waiters), "cursors": dict(t.cursors)}
+                    for name, t in self._topics.items()}
+
+
+def _wake(fut: asyncio.Future):
+    if not fut.done():
+        fut.set_result(None)
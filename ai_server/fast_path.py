@@ -0,0 +1,86 @@
+"""
+Deterministic policy in front of the LLM for decisions that need no model.
+
+decide() looks at a Situation (what think() would prompt with, reduced to
+the few facts the rules need) and either returns a decision or sends it on
+to the LLM. Rules, in order:
+
+  llm        the chat addresses the AI directly -> always the model
+  retaliate  a bot was hit a moment ago and has not answered yet (player
+             mode) -> attack that player, once per hit
+  noise      the newest chat line carries no content ("w", "草", "...", emoji)
+             -> stay silent
+  alone      no human within `near_radius` of any bot (player mode) -> idle
+
+Silent / idle decisions are None: nothing is queued. Every decision is
+counted per path, including the "cache" and "llm" paths think() takes after
+this layer, so stats() shows what share of thinking the model really does.
+"""
+from __future__ import annotations
+
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+RETALIATE = "retaliate"
+NOISE = "noise"
+ALONE = "alone"
+CACHE = "cache"
+LLM = "llm"
+
+# Laughter, fillers and acknowledgements that need no reply
+_NOISE_WORDS = {"w", "ｗ", "草", "笑", "lol", "lmao", "xd", "gg", "ok", "k", "hmm", "えー", "へー", "ふーん", "おk"}
+_NO_CONTENT = re.compile(r"^[\W_]*$")  # punctuation, symbols and emoji only
+# "wwww", "草草", "gg gg": noise words, possibly repeated, and nothing else
+_NOISE_ONLY = re.compile("(?:%s)+" % "|".join(map(re.escape, sorted(_NOISE_WORDS, key=len, reverse=True))))
+
+
+@dataclass
+class Situation:
+    mode: str
+    last_chat: Optional[Dict[str, str]] = None
+    mentioned: bool = False
+    attackers: List[Tuple[str, str]] = field(default_factory=list)  # (bot, player who just hit it)
+    nearby_players: Optional[int] = None  # humans near any bot; None when no bot position is known
+
+
+def is_noise(message: str) -> bool:
+    text = message.strip().lower()
+    if _NO_CONTENT.match(text):
+        return True
+    return _NOISE_ONLY.fullmatch(re.sub(r"[\s!?.。、！？ー〜~]+", "", text)) is not None
+
+
+class FastPath:
+    def __init__(self, near_radius: float = 24.0):
+        self.near_radius = near_radius
+        self.paths: Counter = Counter()
+
+    def decide(self, sit: Situation) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """(path, action) when a rule decides, (None, None) when the model should"""
+        path, action = self._decide(sit)
+        if path is not None:
+            self.paths[path] += 1
+        return path, action
+
+    def _decide(self, sit: Situation):
+        if sit.mentioned:
+            return None, None
+        if sit.mode == "player" and sit.attackers:
+            bot, target = sit.attackers[0]
+            return RETALIATE, {"action": "attack", "target": target, "reason": f"{target} に攻撃されたので反撃 ({bot})"}
+        if sit.last_chat is not None and is_noise(sit.last_chat["message"]):
+            return NOISE, None
+        if sit.mode == "player" and sit.nearby_players == 0:
+            return ALONE, None
+        return None, None
+
+    def record(self, path: str):
+        """Count a decision made after the fast path (CACHE or LLM)"""
+        self.paths[path] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.paths.values())
+        return {"decisions": total, "paths": dict(self.paths),
+                "share": {p: n / total for p, n in self.paths.items()} if total else {}}
@@ -0,0 +1,285 @@
+"""
+Append-only, segmented journal of what the server ingests and emits.
+
+Each record is length-prefixed and checksummed:
+
+    <u32 length> <u32 crc32 of payload> <payload: JSON {"t", "kind", "data"}>
+
+Records are appended to journal-00000001.log, journal-00000002.log, ...
+A segment is closed once it grows past `segment_bytes`. Every segment
+starts with a "checkpoint" record: the full state from the `checkpoint`
+callback. Recovery therefore reads only the newest segment, via mmap, from
+that checkpoint forward (or the one before it, if a crash left the newest
+without an intact checkpoint). Older segments stay on disk for replay, up to
+`keep_segments`.
+
+append() writes to the OS right away under a lock. fsync is batched: a
+background thread syncs at most every `fsync_interval` seconds while
+there are unsynced records, on a duplicate of the fd and without the
+lock, so a slow disk never holds up append() (or the event bus, which
+appends under its own lock). A crash loses at most that window. A torn
+last record (short or bad CRC) ends the segment on read and is cut off
+when the journal reopens it.
+
+replay() feeds records to per-kind handlers, as fast as possible or at a
+multiple of the recorded pace, for regression and load tests.
+
+Enable with JOURNAL_DIR=journal.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+_HEADER = struct.Struct("<II")
+CHECKPOINT = "checkpoint"
+
+Record = Tuple[float, str, Any]  # (t, kind, data)
+
+
+def encode(kind: str, data: Any, t: Optional[float] = None) -> bytes:
+    payload = json.dumps({"t": time.time() if t is None else t, "kind": kind, "data": data},
+                         ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _scan(buf) -> Iterator[Tuple[int, Record]]:
+    """(end offset, record) for each intact record in `buf`; stops at the first torn one"""
+    off, size = 0, len(buf)
+    while off + _HEADER.size <= size:
+        length, crc = _HEADER.unpack_from(buf, off)
+        start = off + _HEADER.size
+        if start + length > size:
+            return
+        payload = buf[start:start + length]
+        if zlib.crc32(payload) != crc:
+            return
+        obj = json.loads(payload)
+        off = start + length
+        yield off, (obj["t"], obj["kind"], obj["data"])
+
+
+def read_segment(path: str) -> Iterator[Record]:
+    """Records of one segment file, read through mmap"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for _, record in _scan(buf):
+                yield record
+
+
+def _valid_length(path: str) -> int:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            end = 0
+            for end, _ in _scan(buf):
+                pass
+            return end
+
+
+class Journal:
+    def __init__(self, directory: str, segment_bytes: int = 8 << 20, fsync_interval: float = 0.2,
+                 keep_segments: int = 16, checkpoint: Optional[Callable[[], Any]] = None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.keep_segments = keep_segments
+        self.checkpoint = checkpoint
+        os.makedirs(directory, exist_ok=True)
+        self.records = 0
+        self.bytes = 0
+        self.fsyncs = 0
+        self.rotations = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()  # one fsync at a time, so close() waits for one in flight
+        self._dirty = threading.Event()
+        self._closed = False
+        self._fd: Optional[int] = None
+        self._size = 0
+        self._index = 0
+        self._thread = threading.Thread(target=self._sync_loop, name="journal-fsync", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, checkpoint: Optional[Callable[[], Any]] = None) -> Optional["Journal"]:
+        directory = os.getenv("JOURNAL_DIR")
+        if not directory:
+            return None
+        return cls(directory, segment_bytes=int(os.getenv("JOURNAL_SEGMENT_BYTES", str(8 << 20))),
+                   fsync_interval=float(os.getenv("JOURNAL_FSYNC_INTERVAL", "0.2")), checkpoint=checkpoint)
+
+    def segments(self) -> List[str]:
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith("journal-") and n.endswith(".log"))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.directory, f"journal-{index:08d}.log")
+
+    def _recovery_segment(self) -> Optional[str]:
+        """
+        The newest segment that starts with an intact checkpoint. After a crash
+        in the middle of a roll, the newest file may be empty or hold a torn
+        checkpoint; the segment before it is then the latest complete state.
+        """
+        for path in reversed(self.segments()):
+            first = next(read_segment(path), None)
+            if first is not None and first[1] == CHECKPOINT:
+                return path
+        return None
+
+    def recover(self) -> Iterator[Record]:
+        """Records of the newest segment that starts with a checkpoint"""
+        path = self._recovery_segment()
+        if path is not None:
+            yield from read_segment(path)
+
+    def replay_records(self) -> Iterator[Record]:
+        """Every record still on disk, oldest first"""
+        for path in self.segments():
+            yield from read_segment(path)
+
+    def open(self):
+        """
+        Start appending: continue the newest segment after cutting off a torn
+        tail, or start segment 1. A newest segment without an intact
+        checkpoint (a crash while rolling) is written again from scratch.
+        Call after recover(), so a new checkpoint sees the recovered state.
+        """
+        segments = self.segments()
+        if not segments:
+            self._roll()
+            return
+        path = segments[-1]
+        index = int(os.path.basename(path)[8:16])
+        if path != self._recovery_segment():
+            os.remove(path)
+            self._index = index - 1
+            self._roll()
+            return
+        valid = _valid_length(path)
+        with self._lock:
+            self._index = index
+            self._fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+            if valid < os.fstat(self._fd).st_size:
+                os.ftruncate(self._fd, valid)
+            self._size = valid
+
+    def _roll(self, attempts: int = 3):
+        """
+        Start the next segment with a checkpoint. The checkpoint callback runs
+        without our lock held (it may need locks whose holders append to us);
+        if other records land while it runs, it is taken again, so the new
+        segment's checkpoint is not older than the old segment's tail.
+        """
+        index = self._index
+        old = None
+        for attempt in range(attempts):
+            seen = self.records
+            state = self.checkpoint() if self.checkpoint else None
+            with self._lock:
+                if self._index != index and self._size > 0:
+                    return  # another thread rolled meanwhile
+                if self.records != seen and attempt < attempts - 1:
+                    continue
+                if self._fd is not None:
+                    old = self._fd  # synced and closed below, outside the lock
+                    self.rotations += 1
+                self._index += 1
+                self._fd = os.open(self._segment_path(self._index), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                self._size = 0
+                self._write(encode(CHECKPOINT, state))
+            if old is not None:
+                os.fsync(old)
+                os.close(old)
+            for path in self.segments()[:-self.keep_segments]:
+                os.remove(path)
+            return
+
+    def _write(self, record: bytes):
+        os.write(self._fd, record)
+        self._size += len(record)
+        self.records += 1
+        self.bytes += len(record)
+        self._dirty.set()
+
+    def append(self, kind: str, data: Any, t: Optional[float] = None):
+        """Write one record, stamped now or at `t` (dropped until open() and after close())"""
+        record = encode(kind, data, t)
+        if self._fd is not None and self._size + len(record) > self.segment_bytes:
+            self._roll()
+        with self._lock:
+            if self._fd is None:
+                return
+            self._write(record)
+
+    def _sync_loop(self):
+        while not self._closed:
+            self._dirty.wait()
+            time.sleep(self.fsync_interval)  # batch what arrives meanwhile into one fsync
+            self.sync()
+
+    def sync(self):
+        """fsync what has been written so far; only dup() and the flag happen under the append lock"""
+        with self._sync_lock:
+            with self._lock:
+                if self._fd is None or not self._dirty.is_set():
+                    return
+                self._dirty.clear()
+                fd = os.dup(self._fd)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.fsyncs += 1
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            self._closed = True
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+        self._dirty.set()  # let the sync thread see _closed
+
+    def stats(self) -> Dict[str, Any]:
+        return {"directory": self.directory, "segment": self._index, "segment_bytes": self._size,
+                "records": self.records, "bytes": self.bytes, "fsyncs": self.fsyncs, "rotations": self.rotations}
+
+
+def replay(records: Iterator[Record], handlers: Dict[str, Callable[[Any], None]],
+           speed: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Call handlers[kind](data) for each record (kinds without a handler are
+    skipped, and do not count towards the recorded duration). speed=None
+    replays as fast as possible; speed=k keeps k times the recorded pace.
+    Returns counts and recorded vs replay duration.
+    """
+    counts: Dict[str, int] = {}
+    first_t = last_t = None
+    t0 = time.monotonic()
+    for t, kind, data in records:
+        handler = handlers.get(kind)
+        if handler is None:
+            continue
+        if first_t is None:
+            first_t = t
+        last_t = t
+        if speed:
+            lag = (t - first_t) / speed - (time.monotonic() - t0)
+            if lag > 0:
+                time.sleep(lag)
+        handler(data)
+        counts[kind] = counts.get(kind, 0) + 1
+    elapsed = time.monotonic() - t0
+    recorded = (last_t - first_t) if first_t is not None else 0.0
+    return {"records": counts, "recorded_seconds": recorded, "replay_seconds": elapsed,
+            "speedup": recorded / elapsed if elapsed > 0 else None}
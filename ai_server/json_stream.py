@@ -0,0 +1,99 @@
+"""
+Incremental parser for the one JSON object an LLM reply contains.
+
+feed() takes streamed text in arbitrary pieces and returns the top-level
+fields whose values completed in that piece. This lets a caller act on
+"action" and "message" while "reason" is still being generated. Text before
+the opening brace (a ```json fence, prose) is skipped, and so is anything
+after the closing brace.
+
+Values are decoded with json.loads once complete. Nested objects and arrays
+are returned whole when their closing bracket arrives.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Optional
+
+_INVALID = object()
+
+
+class JsonFieldStream:
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.done = False  # closing brace of the top-level object seen
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0  # 1 = directly inside the top-level object
+        self._in_str = False
+        self._esc = False
+        self._expect = "key"  # at depth 1: key | colon | value | in_value | after
+        self._key: Optional[str] = None
+        self._start = 0  # where the current key/value token began
+
+    def feed(self, text: str) -> Dict[str, Any]:
+        """Fields completed by this piece of text"""
+        self._buf += text
+        buf, new = self._buf, {}
+        i = self._pos
+        while i < len(buf) and not self.done:
+            c = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._depth == 1 and self._expect == "key":
+                        key = self._decode(buf[self._start:i + 1])
+                        self._key = None if key is _INVALID else key
+                        self._expect = "colon"
+                    elif self._depth == 1:
+                        self._emit(new, buf[self._start:i + 1])
+            elif self._depth == 0:
+                if c == "{":
+                    self._depth = 1
+            elif c == '"':
+                self._in_str = True
+                if self._depth == 1 and self._expect in ("key", "value"):
+                    self._start = i
+                    if self._expect == "value":
+                        self._expect = "in_value"
+            elif c in "{[":
+                if self._depth == 1 and self._expect == "value":
+                    self._start, self._expect = i, "in_value"
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._emit(new, buf[self._start:i + 1])  # nested value closed
+                elif self._depth == 0:
+                    if self._expect == "in_value":
+                        self._emit(new, buf[self._start:i])  # scalar ended by the brace
+                    self.done = True
+            elif self._depth == 1:
+                if c == ":" and self._expect == "colon":
+                    self._expect = "value"
+                elif c == ",":
+                    if self._expect == "in_value":
+                        self._emit(new, buf[self._start:i])  # number / true / false / null
+                    self._expect = "key"
+                elif not c.isspace() and self._expect == "value":
+                    self._start, self._expect = i, "in_value"
+            i += 1
+        self._pos = i
+        return new
+
+    def _emit(self, new: Dict[str, Any], raw: str):
+        self._expect = "after"
+        value = self._decode(raw.strip())
+        if self._key is not None and value is not _INVALID:
+            self.fields[self._key] = new[self._key] = value
+
+    @staticmethod
+    def _decode(raw: str):
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return _INVALID
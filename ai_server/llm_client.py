@@ -0,0 +1,176 @@
+"""
+Async client for the OpenAI-compatible chat endpoint (LM Studio etc.).
+
+One pooled httpx.AsyncClient keeps connections to the model server alive
+between calls. A semaphore caps how many completions are in flight, and each
+call has a deadline that covers both waiting for a slot and the request
+itself. Calls never raise: failures and timeouts return None (or end the
+stream) and are counted.
+
+The pool and semaphore belong to the event loop that first used them. If a
+call comes from another loop (e.g. the test client), they are rebuilt for
+that loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+DEFAULT_API_BASE = "http://127.0.0.1:1234/v1"
+DEFAULT_MODEL = "local-model"  # LM Studio often ignores model name or uses loaded model
+
+
+class LLMClient:
+    def __init__(self, api_base: str = DEFAULT_API_BASE, model: str = DEFAULT_MODEL,
+                 max_concurrency: int = 2, timeout: float = 10.0, max_connections: int = 8,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.api_base = api_base.rstrip("/")
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.total_latency = 0.0
+
+    @classmethod
+    def from_env(cls) -> "LLMClient":
+        return cls(api_base=os.getenv("LLM_API_BASE", DEFAULT_API_BASE),
+                   model=os.getenv("LLM_MODEL", DEFAULT_MODEL),
+                   max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "2")),
+                   timeout=float(os.getenv("LLM_TIMEOUT", "10")))
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Connections from a closed loop are unusable; just drop them
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                base_url=self.api_base, timeout=self.timeout, transport=self._transport,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections))
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._client, self._slots
+
+    async def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7,
+                   max_tokens: int = 300, deadline: Optional[float] = None) -> Optional[str]:
+        """
+        Message content of the first choice, or None on error / timeout.
+        `deadline` is seconds from now (default: the client timeout).
+        """
+        client, slots = self._bind()
+        body = {"model": self.model, "messages": messages,
+                "temperature": temperature, "max_tokens": max_tokens}
+        budget = self.timeout if deadline is None else deadline
+        t0 = time.monotonic()
+        try:
+            return await asyncio.wait_for(self._post(client, slots, body), budget)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            print(f"LLM Timeout after {time.monotonic() - t0:.1f}s")
+        except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+            self.errors += 1
+            print(f"LLM Exception: {e!r}")
+        return None
+
+    async def _acquire(self, slots: asyncio.Semaphore):
+        self.waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    async def _post(self, client: httpx.AsyncClient, slots: asyncio.Semaphore, body: Dict[str, Any]):
+        await self._acquire(slots)
+        t0 = time.monotonic()
+        try:
+            resp = await client.post("/chat/completions", json=body)
+            if resp.status_code != 200:
+                self.errors += 1
+                print(f"LLM Error: {resp.status_code} {resp.text}")
+                return None
+            content = resp.json()["choices"][0]["message"]["content"]
+            self.completed += 1
+            self.total_latency += time.monotonic() - t0
+            return content
+        finally:
+            self.in_flight -= 1
+            slots.release()
+
+    async def stream_chat(self, messages: List[Dict[str, str]], temperature: float = 0.7,
+                          max_tokens: int = 300, deadline: Optional[float] = None,
+                          outcome: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """
+        Content deltas of the first choice as the server streams them (SSE,
+        "stream": true). Ends early on error / timeout; `deadline` covers the
+        whole stream. If given, `outcome["ok"]` is set once the stream has
+        completed, which tells an empty reply apart from a failed call.
+        """
+        client, slots = self._bind()
+        body = {"model": self.model, "messages": messages,
+                "temperature": temperature, "max_tokens": max_tokens, "stream": True}
+        end = time.monotonic() + (self.timeout if deadline is None else deadline)
+        try:
+            await asyncio.wait_for(self._acquire(slots), end - time.monotonic())
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            print("LLM Timeout waiting for a slot")
+            return
+        t0 = time.monotonic()
+        try:
+            async with client.stream("POST", "/chat/completions", json=body) as resp:
+                if resp.status_code != 200:
+                    self.errors += 1
+                    print(f"LLM Error: {resp.status_code} {(await resp.aread()).decode(errors='replace')}")
+                    return
+                lines = resp.aiter_lines()
+                while True:
+                    try:
+                        line = await asyncio.wait_for(lines.__anext__(), max(0.0, end - time.monotonic()))
+                    except StopAsyncIteration:
+                        break
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        break
+                    delta = json.loads(payload)["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+            self.completed += 1
+            self.total_latency += time.monotonic() - t0
+            if outcome is not None:
+                outcome["ok"] = True
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            print(f"LLM Timeout after {time.monotonic() - t0:.1f}s (streaming)")
+        except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+            self.errors += 1
+            print(f"LLM Exception: {e!r}")
+        finally:
+            self.in_flight -= 1
+            slots.release()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": self.in_flight, "waiting": self.waiting, "completed": self.completed,
+                "timeouts": self.timeouts, "errors": self.errors,
+                "avg_latency": self.total_latency / self.completed if self.completed else None}
@@ -0,0 +1,253 @@
+"""
+Router over several OpenAI-compatible endpoints (one LLMClient each).
+
+Each endpoint keeps an EWMA of its latency (time to the full reply for
+chat(), to the first delta for stream_chat()). A call goes to the endpoint
+with the lowest expected wait, ewma * (in_flight + 1); endpoints with no
+samples yet count as 0 so they get tried.
+
+chat() hedges: if the chosen endpoint has not answered by its observed p90,
+the same request also goes to the next best endpoint, the first answer wins,
+and the other request is cancelled. stream_chat() hedges the same way on
+the time to the first delta (with its own p90): the first stream to send
+something is the one that is read to the end, the other is closed. A failed
+call (error or timeout) puts the endpoint in a short cooldown and fails over
+to the next one while the deadline allows. A stream that completes without
+any delta is an empty reply, not a failure.
+
+The router has the same interface as LLMClient (chat, stream_chat, aclose,
+stats), so server.py does not care which one it holds.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from llm_client import DEFAULT_API_BASE, DEFAULT_MODEL, LLMClient
+
+
+class Endpoint:
+    def __init__(self, client: LLMClient, alpha: float, window: int):
+        self.client = client
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+        self.recent: Deque[float] = deque(maxlen=window)  # chat() latencies, for p90
+        self.recent_first: Deque[float] = deque(maxlen=window)  # stream_chat() first deltas, for p90
+        self.in_flight = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def observe(self, latency: float, first_delta: bool = False):
+        self.ewma = latency if self.ewma is None else self.alpha * latency + (1 - self.alpha) * self.ewma
+        (self.recent_first if first_delta else self.recent).append(latency)
+
+    def samples(self, first_delta: bool = False) -> Deque[float]:
+        return self.recent_first if first_delta else self.recent
+
+    def p90(self, first_delta: bool = False) -> Optional[float]:
+        recent = self.samples(first_delta)
+        if not recent:
+            return None
+        ordered = sorted(recent)
+        return ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))]
+
+    def expected_wait(self) -> float:
+        return (self.ewma or 0.0) * (self.in_flight + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"api_base": self.client.api_base, "model": self.client.model, "ewma": self.ewma,
+                "p90": self.p90(), "p90_first_delta": self.p90(first_delta=True), "in_flight": self.in_flight, "failures": self.failures,
+                "cooling_down": self.cooldown_until > time.monotonic()}
+
+
+class LLMRouter:
+    def __init__(self, clients: List[LLMClient], alpha: float = 0.2, window: int = 50,
+                 min_samples: int = 5, hedge_after: float = 2.0, min_hedge: float = 0.05,
+                 cooldown: float = 5.0):
+        self.endpoints = [Endpoint(c, alpha, window) for c in clients]
+        self.timeout = max(c.timeout for c in clients)
+        self.min_samples = min_samples
+        self.hedge_after = hedge_after  # hedge delay until an endpoint has min_samples
+        self.min_hedge = min_hedge
+        self.cooldown = cooldown
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    @classmethod
+    def from_env(cls) -> "LLMRouter":
+        """
+        LLM_ENDPOINTS="http://host-a:1234/v1|model-a,http://host-b:1234/v1" (model optional).
+        Without it, the single LLM_API_BASE / LLM_MODEL endpoint.
+        """
+        spec = os.getenv("LLM_ENDPOINTS", "")
+        pairs = [item.split("|", 1) for item in spec.split(",") if item.strip()]
+        if not pairs:
+            pairs = [[os.getenv("LLM_API_BASE", DEFAULT_API_BASE), os.getenv("LLM_MODEL", DEFAULT_MODEL)]]
+        clients = [LLMClient(api_base=p[0].strip(),
+                             model=p[1].strip() if len(p) > 1 else os.getenv("LLM_MODEL", DEFAULT_MODEL),
+                             max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "2")),
+                             timeout=float(os.getenv("LLM_TIMEOUT", "10")))
+                   for p in pairs]
+        return cls(clients, hedge_after=float(os.getenv("LLM_HEDGE_AFTER", "2.0")))
+
+    def _ranked(self, exclude=()) -> List[Endpoint]:
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude]
+        return sorted(candidates, key=lambda e: (e.cooldown_until > now, e.expected_wait()))
+
+    def _hedge_delay(self, ep: Endpoint, first_delta: bool = False) -> float:
+        if len(ep.samples(first_delta)) < self.min_samples:
+            return self.hedge_after
+        return max(self.min_hedge, ep.p90(first_delta))
+
+    def _failed(self, ep: Endpoint):
+        ep.failures += 1
+        ep.cooldown_until = time.monotonic() + self.cooldown
+
+    async def _call(self, ep: Endpoint, messages, temperature, max_tokens, deadline) -> Optional[str]:
+        ep.in_flight += 1
+        t0 = time.monotonic()
+        try:
+            result = await ep.client.chat(messages, temperature=temperature, max_tokens=max_tokens,
+                                          deadline=deadline)
+        finally:
+            ep.in_flight -= 1
+        if result is None:
+            self._failed(ep)
+        else:
+            ep.observe(time.monotonic() - t0)
+        return result
+
+    async def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7,
+                   max_tokens: int = 300, deadline: Optional[float] = None) -> Optional[str]:
+        end = time.monotonic() + (self.timeout if deadline is None else deadline)
+        tried: List[Endpoint] = []
+        while True:
+            ranked = self._ranked(exclude=tried)
+            if not ranked or time.monotonic() >= end:
+                return None
+            primary = ranked[0]
+            tried.append(primary)
+            args = (messages, temperature, max_tokens)
+            tasks = {asyncio.ensure_future(self._call(primary, *args, end - time.monotonic())): primary}
+            done, _ = await asyncio.wait(tasks, timeout=min(self._hedge_delay(primary), end - time.monotonic()))
+            if not done and len(ranked) > 1:
+                backup = ranked[1]
+                tried.append(backup)
+                self.hedges += 1
+                tasks[asyncio.ensure_future(self._call(backup, *args, end - time.monotonic()))] = backup
+            result = None
+            try:
+                # First non-empty answer wins; a failed one leaves the other running
+                while tasks and result is None:
+                    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        ep = tasks.pop(task)
+                        if result is None and task.result() is not None:
+                            result = task.result()
+                            self.hedge_wins += ep is not primary
+            finally:
+                for task in tasks:
+                    task.cancel()
+            if result is not None:
+                return result
+            self.failovers += 1
+
+    async def stream_chat(self, messages: List[Dict[str, str]], temperature: float = 0.7,
+                          max_tokens: int = 300, deadline: Optional[float] = None) -> AsyncIterator[str]:
+        end = time.monotonic() + (self.timeout if deadline is None else deadline)
+        tried: List[Endpoint] = []
+        while True:
+            ranked = self._ranked(exclude=tried)
+            if not ranked or time.monotonic() >= end:
+                return
+            primary = ranked[0]
+            tried.append(primary)
+            args = (messages, temperature, max_tokens, end)
+            streams = {}
+            stream = _Stream(primary, *args)
+            streams[stream.first] = stream
+            done, _ = await asyncio.wait(streams, timeout=min(self._hedge_delay(primary, first_delta=True),
+                                                              end - time.monotonic()))
+            if not done and len(ranked) > 1:
+                backup = ranked[1]
+                tried.append(backup)
+                self.hedges += 1
+                stream = _Stream(backup, *args)
+                streams[stream.first] = stream
+            winner = None
+            empty = False
+            try:
+                # The first stream to send a delta wins; one that fails leaves the other running
+                while streams and winner is None and not empty:
+                    done, _ = await asyncio.wait(streams, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        stream = streams.pop(task)
+                        if winner is not None or empty:
+                            await stream.close()
+                        elif task.result() is not None:
+                            winner = stream
+                            stream.ep.observe(time.monotonic() - stream.t0, first_delta=True)
+                            self.hedge_wins += stream.ep is not primary
+                        else:
+                            await stream.close()
+                            if stream.outcome.get("ok"):
+                                empty = True  # completed with nothing to say
+                                stream.ep.observe(time.monotonic() - stream.t0, first_delta=True)
+                            else:
+                                self._failed(stream.ep)
+            finally:
+                for stream in streams.values():
+                    await stream.close()
+            if empty:
+                return
+            if winner is not None:
+                try:
+                    yield winner.first.result()
+                    async for delta in winner.gen:
+                        yield delta
+                finally:
+                    await winner.close()
+                return
+            self.failovers += 1
+
+    async def aclose(self):
+        for ep in self.endpoints:
+            await ep.client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hedges": self.hedges, "hedge_wins": self.hedge_wins, "failovers": self.failovers,
+                "endpoints": [dict(ep.stats(), client=ep.client.stats()) for ep in self.endpoints]}
+
+
+class _Stream:
+    """A stream_chat() call on one endpoint, with its first delta awaited in a task"""
+
+    def __init__(self, ep: Endpoint, messages, temperature, max_tokens, end: float):
+        self.ep = ep
+        self.outcome: Dict[str, Any] = {}
+        self.t0 = time.monotonic()
+        self.closed = False
+        ep.in_flight += 1
+        self.gen = ep.client.stream_chat(messages, temperature=temperature, max_tokens=max_tokens,
+                                         deadline=end - self.t0, outcome=self.outcome)
+        self.first = asyncio.ensure_future(self._first())
+
+    async def _first(self) -> Optional[str]:
+        try:
+            return await self.gen.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.first.cancel()
+        await asyncio.gather(self.first, return_exceptions=True)  # the generator must be idle to close it
+        await self.gen.aclose()
+        self.ep.in_flight -= 1
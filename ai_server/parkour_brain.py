@@ -1,6 +1,14 @@
-import heapq
 import numpy as np
 import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from pathfinding import IncrementalPlanner, NavGrid
+from world_memory import WorldMemory
 
 class ParkourBrain:
     def __init__(self):
@@ -10,10 +18,19 @@ class ParkourBrain:
         self.radius = 0
         self.half_height = 0
         self.origin = (0, 0, 0)
+        self.frame_seq = None # seq of the last applied packed frame (delta base)
+        self.dimension = "minecraft:overworld"
+        self.memory = WorldMemory() # Everything seen so far, outside the current window too
+        self.nav = None # NavGrid of the current window, rebuilt once per snapshot
+        self._region_nav = None # (key, NavGrid, lo) for targets outside the window
+        self.planner = IncrementalPlanner() # D* Lite, kept between calls while CHASING
+        self.nodes_expanded = 0 # last calculate_path
+        self._field = None # DistanceField from the feet, built on first use per snapshot
         self.player_pos_relative = (0, 0, 0) # Usually 0 unless offset
         self.target_player = None # Name of player to chase
         self.target_pos = None # (x,y,z) relative debug
         self.path = [] # Debug path
+        self.snapshot = None # Last snapshot dict (grid = voxel_grid) for next_move / the visualizer
         
         # --- Advanced Search Logic ---
         self.last_known_target_pos = None
@@ -28,7 +45,7 @@ class ParkourBrain:
         self.target_player = name
 
     def update_state(self, snapshot_data):
-        """Update the internal voxel state from the snapshot"""
+        """Update the internal voxel state from the snapshot (keyframe)"""
         self.width = snapshot_data["width"]
         self.height = snapshot_data["height"]
         self.radius = snapshot_data["radius"]
@@ -38,14 +55,236 @@ class ParkourBrain:
             snapshot_data["origin"]["y"],
             snapshot_data["origin"]["z"]
         )
+        self.frame_seq = snapshot_data.get("seq")
+        self.dimension = (snapshot_data.get("player") or {}).get("dimension", self.dimension)
         
         # Reshape grid
         # JS Loop: dy (outer), dz, dx (inner)
         # Flattened: [y0z0x0, y0z0x1... ]
         # Numpy reshape (H, W, W) matches this C-order filling
+        # grid is a JSON list or an already-decoded uint8 ndarray (packed endpoint)
         flat = snapshot_data["grid"]
-        self.voxel_grid = np.array(flat).reshape((self.height, self.width, self.width))
+        if flat is not self.voxel_grid:
+            shape = (self.height, self.width, self.width)
+            if self.voxel_grid is None or self.voxel_grid.shape != shape:
+                self.voxel_grid = np.empty(shape, dtype=np.uint8)
+            # Copy into the rolling buffer instead of reallocating it
+            np.copyto(self.voxel_grid, np.asarray(flat, dtype=np.uint8).reshape(shape))
+        self.snapshot = dict(snapshot_data, grid=self.voxel_grid)
+        self._on_grid_changed()
+        
+        self._tick_search()
+
+    def apply_delta(self, origin, indices, values, seq, base_seq):
+        """
+        Apply a delta frame: shift the grid by the origin change, then patch changed cells.
+        Cells shifted in from outside the old window start as air (0); the client
+        diffs against the same shifted grid, so anything else arrives in `values`.
+        Returns False if the delta does not follow our current frame (caller asks for a keyframe).
+        """
+        if self.voxel_grid is None or self.frame_seq is None or base_seq != self.frame_seq:
+            return False
+        
+        shift = (origin[1] - self.origin[1], origin[2] - self.origin[2], origin[0] - self.origin[0])
+        self._shift_grid(shift)
+        self.origin = tuple(origin)
+        self.frame_seq = seq
         
+        flat = self.voxel_grid.reshape(-1)
+        if len(indices):
+            flat[indices] = values
+        if self.snapshot is not None:
+            ox, oy, oz = self.origin
+            self.snapshot = dict(self.snapshot, origin={"x": ox, "y": oy, "z": oz}, seq=seq)
+        self._on_grid_changed()
+        
+        self._tick_search()
+        return True
+
+    def _shift_grid(self, shift):
+        """
+        In-place roll of the (Y, Z, X) buffer: new[i] = old[i + shift], exposed cells -> 0.
+        A 3D shift is a single flat memmove by (dy*W + dz)*W + dx; cells whose 3D source
+        is outside the window pick up wrapped values and are exactly the ones zeroed below.
+        """
+        if not any(shift):
+            return
+        grid = self.voxel_grid
+        if any(abs(d) >= n for d, n in zip(shift, grid.shape)):
+            grid.fill(0)
+            return
+        _, nz, nx = grid.shape
+        offset = (shift[0] * nz + shift[1]) * nx + shift[2]
+        flat = grid.reshape(-1)
+        if offset > 0:
+            flat[:-offset] = flat[offset:]
+        elif offset < 0:
+            flat[-offset:] = flat[:offset]
+        for axis, (d, n) in enumerate(zip(shift, grid.shape)):
+            if d == 0:
+                continue
+            exposed = [slice(None)] * 3
+            exposed[axis] = slice(n - d, n) if d > 0 else slice(0, -d)
+            grid[tuple(exposed)] = 0
+
+    def _on_grid_changed(self):
+        self.memory.merge(self.dimension, self._window_lo(), self.voxel_grid)
+        self.nav = NavGrid(self.voxel_grid)
+        self._region_nav = None
+        self._field = None
+
+    def _window_lo(self):
+        """World coords of voxel_grid[0, 0, 0]"""
+        return (self.origin[0] - self.radius, self.origin[1] - self.half_height, self.origin[2] - self.radius)
+
+    # --- Voxel queries (relative to origin = feet) ---
+    # Inside the sensor window we read the live grid, outside it we fall back
+    # to world memory, so targets beyond VOXEL_RADIUS can still be checked.
+
+    def _voxel(self, x, y, z):
+        ix, iy, iz = x + self.radius, y + self.half_height, z + self.radius
+        if self.voxel_grid is not None and 0 <= iy < self.height and 0 <= iz < self.width and 0 <= ix < self.width:
+            return int(self.voxel_grid[iy, iz, ix])
+        return self.memory.get(self.dimension, self.origin[0] + x, self.origin[1] + y, self.origin[2] + z)
+
+    def _is_solid(self, x, y, z):
+        return self._voxel(x, y, z) == 1
+
+    def _is_passable(self, x, y, z):
+        return self._voxel(x, y, z) == 0
+
+    def _is_standable(self, x, y, z):
+        """Solid block below, air at feet and head. Unknown cells are never standable."""
+        return self._is_solid(x, y - 1, z) and self._is_passable(x, y, z) and self._is_passable(x, y + 1, z)
+
+    # --- Planning ---
+    # Nav grids are indexed (iy, iz, ix) from their world-space corner `lo`.
+
+    REGION_MARGIN = 4
+    REGION_MAX_SPAN = (96, 24, 96) # (x, y, z) cap on the planning box read from world memory
+
+    def _to_grid(self, rel, lo):
+        return (self.origin[1] + rel[1] - lo[1], self.origin[2] + rel[2] - lo[2], self.origin[0] + rel[0] - lo[0])
+
+    def _to_rel(self, cell, lo):
+        iy, iz, ix = cell
+        return (lo[0] + ix - self.origin[0], lo[1] + iy - self.origin[1], lo[2] + iz - self.origin[2])
+
+    def _in_window(self, rel):
+        return abs(rel[0]) <= self.radius and abs(rel[2]) <= self.radius and abs(rel[1]) <= self.half_height
+
+    def _nav_for(self, target):
+        """NavGrid covering feet and target: the window, or a box read from world memory"""
+        if self._in_window(target):
+            return self.nav, self._window_lo()
+        
+        m = self.REGION_MARGIN
+        wlo = self._window_lo()
+        whi = (wlo[0] + self.width, wlo[1] + self.height, wlo[2] + self.width)
+        t = (self.origin[0] + target[0], self.origin[1] + target[1], self.origin[2] + target[2])
+        lo = [min(wlo[i], t[i] - m) for i in range(3)]
+        hi = [max(whi[i], t[i] + m + 1) for i in range(3)]
+        for i, span in enumerate(self.REGION_MAX_SPAN):
+            # Very far target: keep the window and extend toward the target as far as allowed
+            if hi[i] - lo[i] > span:
+                if t[i] < wlo[i]:
+                    lo[i] = whi[i] - span
+                    hi[i] = whi[i]
+                else:
+                    lo[i] = wlo[i]
+                    hi[i] = wlo[i] + span
+        lo = tuple(lo)
+        shape = (hi[1] - lo[1], hi[2] - lo[2], hi[0] - lo[0])
+        key = (lo, shape)
+        if self._region_nav is None or self._region_nav[0] != key:
+            grid = self.memory.read_region(self.dimension, lo, shape)
+            self._region_nav = (key, NavGrid(grid), lo)
+        return self._region_nav[1], lo
+
+    def _snap_target(self, target):
+        """Nearest standable cell (relative) to target, or None"""
+        nav, lo = self._nav_for(target)
+        # Targets beyond the planning box: head for the closest point on its edge
+        p = tuple(min(max(v, 0), n - 1) for v, n in zip(self._to_grid(target, lo), nav.shape))
+        goal = nav.nearest_standable(p, reach=(2, 2, 2))
+        if goal is None and nav is not self.nav:
+            # Never seen that far: at least walk toward it inside the window
+            lo = self._window_lo()
+            p = tuple(min(max(v, 0), n - 1) for v, n in zip(self._to_grid(target, lo), self.nav.shape))
+            goal = self.nav.nearest_standable(p, reach=(2, 2, 2))
+            nav = self.nav
+        return self._to_rel(goal, lo) if goal is not None else None
+
+    def _feet_cell(self, nav, lo):
+        """Standable grid cell the bot stands on (or the closest one: mid-jump / in water)"""
+        start = self._to_grid((0, 0, 0), lo)
+        if nav.is_standable(start):
+            return start
+        return nav.nearest_standable(start, reach=(1, 1, 1))
+
+    def distance_field(self):
+        """Path costs from the feet to every cell of the window; one Dijkstra per snapshot"""
+        if self._field is None and self.nav is not None:
+            start = self._feet_cell(self.nav, self._window_lo())
+            if start is not None:
+                self._field = self.nav.distance_field(start)
+        return self._field
+
+    def path_distance(self, rel):
+        """
+        Walking cost to a relative position (e.g. a player's feet).
+        None if it is outside the window (caller falls back to straight-line), inf if unreachable.
+        """
+        if self.nav is None or not self._in_window(rel):
+            return None
+        field = self.distance_field()
+        if field is None:
+            return math.inf
+        cost, _ = field.cost_near(self._to_grid(rel, self._window_lo()))
+        return cost
+
+    def _random_wander_target(self, reach=5):
+        """Random reachable cell at feet level within +-reach blocks"""
+        field = self.distance_field()
+        if field is None:
+            return None
+        iy, iz, ix = self.half_height, self.radius, self.radius
+        sub = field.dist[iy, iz - reach:iz + reach + 1, ix - reach:ix + reach + 1]
+        cells = np.argwhere(np.isfinite(sub))
+        if cells.size == 0:
+            return None
+        dz, dx = cells[random.randrange(len(cells))] - reach
+        return (int(dx), 0, int(dz))
+
+    def calculate_path(self, target, incremental=False):
+        """
+        Path from the feet to `target` (relative, standable).
+        Window targets are read off the per-snapshot distance field (or repaired by
+        the D* Lite planner with incremental=True); targets beyond it use A* on world memory.
+        Returns [{"node": (x, y, z) relative, "type": method}, ...] starting at the first move.
+        """
+        if self.nav is None:
+            return []
+        nav, lo = self._nav_for(target)
+        start = self._feet_cell(nav, lo)
+        if start is None:
+            return []
+        
+        goal = self._to_grid(target, lo)
+        if incremental and nav is self.nav:
+            steps = self.planner.plan(nav, lo, start, goal, self.dimension)
+            self.nodes_expanded = self.planner.nodes_expanded
+        elif nav is self.nav:
+            steps = self.distance_field().path_to(goal)
+            self.nodes_expanded = 0
+        else:
+            steps = nav.astar(start, goal)
+            self.nodes_expanded = nav.nodes_expanded
+        if not steps:
+            return []
+        return [{"node": self._to_rel(nav.coords(i), lo), "type": method} for i, method in steps]
+
+    def _tick_search(self):
         # Auto-decrement scan tick
         if self.search_state == "SCANNING":
             self.scan_tick -= 1
@@ -91,7 +330,6 @@ class ParkourBrain:
             # Rotate view: Send a specific look command?
             # Or just idle with head rotation?
             # For simplicity, we assume "idle" but we can send a "look_at" offset rotating.
-            import math
             angle = self.scan_tick * (2 * math.pi / 15)
             look_x = 5 * math.sin(angle)
             look_z = 5 * math.cos(angle)
@@ -103,39 +341,20 @@ class ParkourBrain:
 
         # 4. Fallback: Wander or Idle
         if target is None:
-            # Try 5 times
-            import random
-            for _ in range(5):
-                rx = random.randint(-5, 5)
-                rz = random.randint(-5, 5)
-                if self._is_standable(rx, 0, rz):
-                    target = (rx, 0, rz)
-                    break 
+            target = self._random_wander_target()
         
         if target is None:
             return {"type": "idle", "msg": "No target/path"}
             
         # Check if target is valid standable, if not, scan vicinity
-        if not self._is_standable(target[0], target[1], target[2]):
-            # Spiral search for nearest standable block to target
-            best_t = None
-            min_d = 999
-            for dy in [0, 1, -1, 2, -2]:
-                for dx in range(-2, 3):
-                    for dz in range(-2, 3):
-                        tx, ty, tz = target[0]+dx, target[1]+dy, target[2]+dz
-                        if self._is_standable(tx, ty, tz):
-                            d = dx*dx + dy*dy + dz*dz
-                            if d < min_d:
-                                min_d = d
-                                best_t = (tx, ty, tz)
-            if best_t:
-                target = best_t
-            else:
-                 return {"type": "idle", "msg": "Target unreachable"}
+        goal = self._snap_target(target)
+        if goal is None:
+            return {"type": "idle", "msg": "Target unreachable"}
+        target = goal
 
         # 2. Calculate Pth
-        self.path = self.calculate_path(target) # Store for debug
+        # Chasing: the target moves a little every poll, so repair the previous search
+        self.path = self.calculate_path(target, incremental=self.search_state == "CHASING") # Store for debug
         path = self.path
         
         if not path:
@@ -194,4 +413,100 @@ class ParkourBrain:
             "method": move_type # walk, jump, etc.
         }
 
-brain = ParkourBrain()
+DEFAULT_WORKERS = int(os.getenv("BRAIN_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+# Each brain's WorldMemory may grow to 64 MB: keep at most MAX_BRAINS, and drop
+# brains that have not been used for BRAIN_IDLE_TTL seconds
+MAX_BRAINS = int(os.getenv("MAX_BRAINS", "64"))
+BRAIN_IDLE_TTL = float(os.getenv("BRAIN_IDLE_TTL", "600"))
+
+
+class _Entry:
+    __slots__ = ("brain", "lock", "seen")
+
+    def __init__(self):
+        self.brain = ParkourBrain()
+        self.lock = threading.Lock()
+        self.seen = time.monotonic()
+
+
+class BrainRegistry:
+    """
+    One ParkourBrain per AI bot, keyed by player name.
+
+    Every call for a bot runs while holding that bot's lock, so snapshots and
+    next_move polls for one bot stay ordered, while different bots are planned
+    in parallel on a shared thread pool (NavGrid / distance field / world
+    memory work is numpy and scipy, which release the GIL).
+
+    The registry is bounded. A brain that no call has used for `idle_ttl`
+    seconds is dropped, and creating one past `max_brains` drops the least
+    recently used. remove(name) drops a bot that left the game. A call that
+    is running keeps its brain until it returns; a bot that comes back later
+    starts with a fresh brain.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, max_brains: int = MAX_BRAINS,
+                 idle_ttl: float = BRAIN_IDLE_TTL):
+        self._entries: Dict[str, _Entry] = {}
+        self._guard = threading.Lock()
+        self.max_brains = max_brains
+        self.idle_ttl = idle_ttl
+        self.evicted = 0
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="brain")
+
+    def _entry(self, name: str, create: bool) -> Optional[_Entry]:
+        entry = self._entries.get(name)
+        if entry is None and create:
+            with self._guard:
+                entry = self._entries.get(name)
+                if entry is None:
+                    self._evict(room=1)
+                    entry = self._entries[name] = _Entry()
+        return entry
+
+    def get(self, name: str, create: bool = True) -> Optional[ParkourBrain]:
+        """The bot's brain (looking it up does not count as use)"""
+        entry = self._entry(name, create)
+        return entry.brain if entry is not None else None
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def run(self, name: str, fn: Callable, *args):
+        """fn(brain, *args) in the calling thread, holding the bot's lock"""
+        entry = self._entry(name, True)
+        entry.seen = time.monotonic()
+        with entry.lock:
+            return fn(entry.brain, *args)
+
+    def submit(self, name: str, fn: Callable, *args) -> Future:
+        """fn(brain, *args) on the worker pool, holding the bot's lock"""
+        return self.pool.submit(self.run, name, fn, *args)
+
+    def remove(self, name: str) -> bool:
+        """Drop the bot's brain (it left the game); False if there was none"""
+        with self._guard:
+            return self._entries.pop(name, None) is not None
+
+    def evict_idle(self) -> List[str]:
+        """Drop brains idle for longer than idle_ttl; returns their names"""
+        with self._guard:
+            return self._evict()
+
+    def _evict(self, room: int = 0) -> List[str]:
+        # Caller holds _guard
+        now = time.monotonic()
+        by_age = sorted(self._entries.items(), key=lambda item: item[1].seen)
+        over = len(by_age) + room - self.max_brains
+        gone = [name for i, (name, entry) in enumerate(by_age) if i < over or now - entry.seen > self.idle_ttl]
+        for name in gone:
+            del self._entries[name]
+        self.evicted += len(gone)
+        return gone
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker pool (after the queued calls when `wait`)"""
+        self.pool.shutdown(wait=wait)
+
+
+brains = BrainRegistry()
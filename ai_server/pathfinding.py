@@ -0,0 +1,618 @@
+"""
+Grid navigation for ParkourBrain.
+
+NavGrid turns a (Y, Z, X) voxel array into per-cell move bitmasks in one
+vectorized pass: for every move type (walk / jump_up / drop / long_jump) a
+boolean array says from which cells that move is legal. A* then only does
+integer bit tests per expansion instead of probing voxels in Python.
+
+DistanceField runs one Dijkstra (scipy, in C) from the bot's feet over the
+same move graph, so any number of candidate targets can be costed and
+routed from a single search per snapshot.
+
+Cell values: 0 air / 1 solid / 2 liquid / 3 unknown (world_memory.UNKNOWN).
+Coordinates inside this module are grid indices (iy, iz, ix); callers convert
+from feet-relative or world coordinates.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+SQRT2 = math.sqrt(2.0)
+MAX_DROP = 3
+
+# (method, dx, dy, dz, cost). method names match executeBotAction in main.js
+MOVES: List[Tuple[str, int, int, int, float]] = []
+for _dx, _dz in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+    MOVES.append(("walk", _dx, 0, _dz, 1.0))
+for _dx, _dz in ((1, 1), (1, -1), (-1, 1), (-1, -1)):
+    MOVES.append(("walk", _dx, 0, _dz, SQRT2))
+for _dx, _dz in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+    MOVES.append(("jump_up", _dx, 1, _dz, 2.0))
+    for _k in range(1, MAX_DROP + 1):
+        MOVES.append(("drop", _dx, -_k, _dz, 1.0 + 0.5 * _k))
+    MOVES.append(("long_jump", 2 * _dx, 0, 2 * _dz, 3.0))
+
+
+PAD = MAX_DROP  # largest offset any move looks at
+
+
+class NavGrid:
+    """
+    Internally every mask lives in a flat array of the grid padded by PAD
+    cells of False on each side. A 3D neighbour offset is then a constant flat
+    offset, so "mask shifted by (dy, dz, dx)" is a contiguous slice.
+    """
+
+    def __init__(self, grid: np.ndarray):
+        self.shape = grid.shape
+        h, d, w = grid.shape
+        ph, pd, pw = h + 2 * PAD, d + 2 * PAD, w + 2 * PAD
+        self.strides = (pd * pw, pw, 1)
+        n = ph * pd * pw
+        self._base = PAD * (self.strides[0] + self.strides[1] + 1)
+        lo, hi = self._base, n - self._base  # every cell of the real grid lies in [lo, hi)
+
+        def padded(mask):
+            out = np.zeros((ph, pd, pw), dtype=bool)
+            out[PAD:PAD + h, PAD:PAD + d, PAD:PAD + w] = mask
+            return out.ravel()
+
+        def off(dy, dz, dx):
+            return dy * self.strides[0] + dz * self.strides[1] + dx
+
+        def at(mask, dy, dz, dx):
+            o = off(dy, dz, dx)
+            return mask[lo + o:hi + o]
+
+        air = padded(grid == 0)
+        solid = padded(grid == 1)
+        # Feet and head free; the block above the head matters for jumps
+        clear = np.zeros(n, dtype=bool)
+        clear[lo:hi] = at(air, 0, 0, 0) & at(air, 1, 0, 0)
+        standable = np.zeros(n, dtype=bool)
+        standable[lo:hi] = clear[lo:hi] & at(solid, -1, 0, 0)
+        here = standable[lo:hi]
+        head = at(air, 2, 0, 0)
+
+        # One byte of move bits per 8 moves, combined into int64 at the end.
+        # rev_groups holds the same bits at the landing cell (for predecessor lookups).
+        groups = [np.zeros(hi - lo, dtype=np.uint8) for _ in range((len(MOVES) + 7) // 8)]
+        rev_groups = [np.zeros(n, dtype=np.uint8) for _ in groups]
+        for m, (method, dx, dy, dz, _) in enumerate(MOVES):
+            ok = here & at(standable, dy, dz, dx)
+            if method == "walk" and dx and dz:
+                # No corner cutting
+                ok &= at(clear, 0, 0, dx) & at(clear, 0, dz, 0)
+            elif method == "jump_up":
+                ok &= head
+            elif method == "drop":
+                # Falling column in front of us must be empty down to the landing cell
+                for j in range(-1, -dy):
+                    ok &= at(air, -j, dz, dx)
+            elif method == "long_jump":
+                mx, mz = dx // 2, dz // 2
+                ok &= at(clear, 0, mz, mx) & ~at(standable, 0, mz, mx) & head
+            byte = ok.view(np.uint8) << (m % 8)
+            groups[m // 8] |= byte
+            o = off(dy, dz, dx)
+            rev_groups[m // 8][lo + o:hi + o] |= byte
+
+        bits = np.zeros(n, dtype=np.int64)
+        rev = np.zeros(n, dtype=np.int64)
+        for k, (grp, rgrp) in enumerate(zip(groups, rev_groups)):
+            bits[lo:hi] |= grp.astype(np.int64) << (8 * k)
+            rev |= rgrp.astype(np.int64) << (8 * k)
+
+        self._standable = standable
+        self.standable = standable.reshape(ph, pd, pw)[PAD:PAD + h, PAD:PAD + d, PAD:PAD + w]
+        self.bits = bits.reshape(ph, pd, pw)[PAD:PAD + h, PAD:PAD + d, PAD:PAD + w]  # move bitmask per cell
+        self.edges = bits.tolist()
+        self.rev_edges = rev.tolist()
+        self.flat_bits = bits
+        self.offsets = [off(dy, dz, dx) for _, dx, dy, dz, _ in MOVES]
+        self.costs = [c for *_, c in MOVES]
+        self.nodes_expanded = 0
+        self._graph = None
+
+    def inside(self, p) -> bool:
+        return all(0 <= v < n for v, n in zip(p, self.shape))
+
+    def index(self, p) -> int:
+        return self._base + p[0] * self.strides[0] + p[1] * self.strides[1] + p[2]
+
+    def coords(self, i: int):
+        iy, rem = divmod(i - self._base, self.strides[0])
+        iz, ix = divmod(rem, self.strides[1])
+        return iy, iz, ix
+
+    def is_standable(self, p) -> bool:
+        return self.inside(p) and bool(self.standable[p])
+
+    def nearest_standable(self, p, reach=(2, 2, 2)) -> Optional[tuple]:
+        """Closest standable cell within +-reach (dy, dz, dx) of p (p may be outside the grid)"""
+        lo = [max(0, v - r) for v, r in zip(p, reach)]
+        hi = [min(n, v + r + 1) for v, r, n in zip(p, reach, self.shape)]
+        if any(a >= b for a, b in zip(lo, hi)):
+            return None
+        sub = self.standable[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+        cand = np.argwhere(sub)
+        if cand.size == 0:
+            return None
+        cand += lo
+        d2 = ((cand - np.asarray(p)) ** 2).sum(axis=1)
+        return tuple(int(v) for v in cand[int(d2.argmin())])
+
+    def graph(self):
+        """(node cells, cell -> node id, sparse move graph) over standable cells; built once"""
+        if self._graph is None:
+            nodes = np.flatnonzero(self._standable)
+            node_of = np.full(self._standable.size, -1, dtype=np.int64)
+            node_of[nodes] = np.arange(nodes.size)
+            # (node, move) pairs for every set move bit
+            has = (self.flat_bits[nodes][:, None] >> np.arange(len(MOVES))) & 1
+            src, m = np.nonzero(has)
+            dst = node_of[nodes[src] + np.asarray(self.offsets)[m]]
+            mat = csr_matrix((np.asarray(self.costs)[m], (src, dst)), shape=(nodes.size, nodes.size))
+            self._graph = (nodes, node_of, mat)
+        return self._graph
+
+    def distance_field(self, start) -> Optional["DistanceField"]:
+        if not self.is_standable(start):
+            return None
+        return DistanceField(self, start)
+
+    def astar(self, start, goal, max_expansions: int = 20000) -> Optional[List[Tuple[int, str]]]:
+        """
+        Shortest path from start to goal (grid coords, both standable).
+        Returns [(cell index, method), ...] excluding the start, or None.
+        """
+        if not (self.is_standable(start) and self.is_standable(goal)):
+            return None
+        s, g = self.index(start), self.index(goal)
+        if s == g:
+            return []
+
+        edges, offsets, costs = self.edges, self.offsets, self.costs
+        base, s0, s1 = self._base, self.strides[0], self.strides[1]
+        gz, gx = divmod((g - base) % s0, s1)
+        diag = SQRT2 - 2
+
+        def h(v):
+            # Octile distance in XZ; every move costs at least 1 per horizontal block
+            vz, vx = divmod((v - base) % s0, s1)
+            dx = vx - gx if vx > gx else gx - vx
+            dz = vz - gz if vz > gz else gz - vz
+            return dx + dz + diag * (dx if dx < dz else dz)
+
+        g_score = {s: 0.0}
+        came = {s: (None, None)}
+        open_heap = [(h(s), 0.0, s)]
+        closed = set()
+        expanded = 0
+
+        while open_heap:
+            _, gc, u = heapq.heappop(open_heap)
+            if u in closed:
+                continue
+            if u == g:
+                break
+            closed.add(u)
+            expanded += 1
+            if expanded > max_expansions:
+                break
+            bits = edges[u]
+            while bits:
+                low = bits & -bits
+                bits ^= low
+                m = low.bit_length() - 1
+                v = u + offsets[m]
+                nc = gc + costs[m]
+                if nc < g_score.get(v, math.inf):
+                    g_score[v] = nc
+                    came[v] = (u, m)
+                    heapq.heappush(open_heap, (nc + h(v), nc, v))
+        self.nodes_expanded = expanded
+
+        if g not in came:
+            return None
+        path = []
+        v = g
+        while v != s:
+            u, m = came[v]
+            path.append((v, MOVES[m][0]))
+            v = u
+        path.reverse()
+        return path
+
+
+class DistanceField:
+    """
+    Path cost from one start cell to every cell of a NavGrid.
+    `dist` is a (Y, Z, X) float array (inf = unreachable / not standable).
+    """
+
+    def __init__(self, nav: NavGrid, start):
+        self.nav = nav
+        self.start = tuple(start)
+        nodes, node_of, mat = nav.graph()
+        self._nodes, self._node_of = nodes, node_of
+        sid = int(node_of[nav.index(start)])
+        d, self._pred = dijkstra(mat, directed=True, indices=sid, return_predecessors=True)
+        flat = np.full(node_of.size, np.inf)
+        flat[nodes] = d
+        h, dd, w = nav.shape
+        pw, pd = w + 2 * PAD, dd + 2 * PAD
+        self.dist = flat.reshape(-1, pd, pw)[PAD:PAD + h, PAD:PAD + dd, PAD:PAD + w]
+        self.reachable = int(np.isfinite(d).sum())
+
+    def cost(self, p) -> float:
+        return float(self.dist[p]) if self.nav.inside(p) else math.inf
+
+    def cost_near(self, p, reach: int = 1):
+        """
+        Cost of p itself if reachable, else of the closest reachable cell within +-reach
+        of it (cheapest on ties), as (cost, cell); (inf, None) if there is none.
+        Players are often mid-jump or on a slab, so their floored feet cell may not be standable.
+        """
+        c = self.cost(p)
+        if c != math.inf:
+            return c, tuple(p)
+        lo = [max(0, v - reach) for v in p]
+        hi = [min(n, v + reach + 1) for v, n in zip(p, self.nav.shape)]
+        if any(a >= b for a, b in zip(lo, hi)):
+            return math.inf, None
+        sub = self.dist[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+        cand = np.argwhere(np.isfinite(sub))
+        if cand.size == 0:
+            return math.inf, None
+        costs = sub[tuple(cand.T)]
+        cand += lo
+        d2 = ((cand - np.asarray(p)) ** 2).sum(axis=1)
+        i = int(np.lexsort((costs, d2))[0])
+        return float(costs[i]), tuple(int(v) for v in cand[i])
+
+    def path_to(self, goal) -> Optional[List[Tuple[int, str]]]:
+        """[(cell index, method), ...] from the start to goal (excluding start), or None"""
+        if self.cost(goal) == math.inf:
+            return None
+        nav = self.nav
+        nodes, pred = self._nodes, self._pred
+        move_of = {o: m for m, o in enumerate(nav.offsets)}
+        path = []
+        n = int(self._node_of[nav.index(goal)])
+        while True:
+            p = int(pred[n])
+            if p < 0:
+                break
+            cell = int(nodes[n])
+            path.append((cell, MOVES[move_of[cell - int(nodes[p])]][0]))
+            n = p
+        path.reverse()
+        return path
+
+
+class IncrementalPlanner:
+    """
+    D* Lite over the NavGrid move graph, for chasing a moving target.
+
+    The search runs backward from a virtual goal node (one past the last cell
+    index, with a 0-cost edge from the real goal cell): the bot moving only
+    bumps km, a moved goal is "edge old-goal -> virtual removed, edge
+    new-goal -> virtual added", and a new snapshot only re-evaluates cells
+    whose move bitmask changed (including cells entering/leaving the window).
+
+    State is keyed by the nav grid's flat cell index. When the window slides
+    by (dx, dy, dz) every index moves by one constant, so g/rhs/open are
+    re-keyed instead of rebuilt; slides larger than PAD (teleports) restart.
+
+    Each call expands at most repair_factor times the nodes of the last search
+    from scratch (the first build, then each A* fallback), and at least
+    min_repair. A D* Lite expansion also re-evaluates
+    predecessors, so it costs several A* expansions. A repair that hits the
+    cap would cost more than searching again: the tree is dropped and the call
+    is answered by NavGrid A*. A new tree is built in capped slices too, the
+    search resuming where the last call stopped, and calls are answered by A*
+    until it is complete. So no call pays for a whole rebuild, except the very
+    first one, which has no count to go by.
+    """
+
+    def __init__(self, max_goal_move: float = 4.0, repair_factor: float = 0.25, min_repair: int = 16):
+        self.max_goal_move = max_goal_move  # goal moves farther than this (blocks) restart the search
+        self.repair_factor = repair_factor
+        self.min_repair = min_repair
+        self.full_search: Optional[int] = None  # nodes expanded by the last search from scratch
+        self.calls = 0
+        self.resets = 0
+        self.capped = 0  # repairs stopped at the cap (tree dropped)
+        self.fallbacks = 0  # calls answered by NavGrid A*
+        self.nodes_expanded = 0  # last call
+        self.nodes_expanded_total = 0
+        self.cells_updated = 0  # last call: rhs re-evaluations
+        self._shape = None
+        self.reset()
+
+    def reset(self):
+        self.g = {}
+        self.rhs = {}
+        self.open = []  # heap of (k1, k2, cell); entries not matching open_keys are stale
+        self.open_keys = {}
+        self.building = False  # the tree's search has not converged since the last restart
+        self.km = 0.0
+        self.start = None
+        self.goal = None
+        self.nav = None
+        self.lo = None
+        self.dimension = None
+
+    def _prepare(self, nav: NavGrid):
+        # X/Z of every padded cell index, for the heuristic. Depends only on the shape.
+        if nav.shape == self._shape:
+            return
+        n = nav.flat_bits.size
+        s0, s1 = nav.strides[0], nav.strides[1]
+        i = np.arange(n + 1)
+        self._cx = (i % s1).tolist()
+        self._cz = (i % s0 // s1).tolist()
+        self.virtual = n
+        self._shape = nav.shape
+
+    def _set_goal(self, g):
+        self.goal = g
+        self._cx[self.virtual] = self._cx[g]
+        self._cz[self.virtual] = self._cz[g]
+
+    def _search(self, changed, max_expansions):
+        """Re-evaluate `changed` cells, then expand until the start is consistent"""
+        g, rhs, open_heap, open_keys = self.g, self.rhs, self.open, self.open_keys
+        edges, rev_edges, offsets, costs = self.nav.edges, self.nav.rev_edges, self.nav.offsets, self.nav.costs
+        cx, cz = self._cx, self._cz
+        goal, virtual, km, start = self.goal, self.virtual, self.km, self.start
+        sx, sz = cx[start], cz[start]
+        inf = math.inf
+        push, pop = heapq.heappush, heapq.heappop
+        diag = SQRT2 - 2
+        updated = 0
+
+        def key(c):
+            v = g.get(c, inf)
+            r = rhs.get(c, inf)
+            if r < v:
+                v = r
+            dx = cx[c] - sx
+            dz = cz[c] - sz
+            if dx < 0:
+                dx = -dx
+            if dz < 0:
+                dz = -dz
+            return (v + dx + dz + diag * (dx if dx < dz else dz) + km, v)
+
+        def queue(c):
+            if g.get(c, inf) != rhs.get(c, inf):
+                k = key(c)
+                open_keys[c] = k
+                push(open_heap, (k[0], k[1], c))
+            else:
+                open_keys.pop(c, None)
+
+        def recompute(c):
+            # rhs = min over successors (cost + g)
+            nonlocal updated
+            updated += 1
+            if c != virtual:
+                best = g.get(virtual, inf) if c == goal else inf
+                bits = edges[c]
+                while bits:
+                    low = bits & -bits
+                    bits ^= low
+                    m = low.bit_length() - 1
+                    v = costs[m] + g.get(c + offsets[m], inf)
+                    if v < best:
+                        best = v
+                rhs[c] = best
+            queue(c)
+
+        def lowered(u, gu):
+            # g(u) dropped to gu: predecessors can only improve through u
+            nonlocal updated
+            if u == virtual:
+                preds = ((goal, 0.0),)
+            else:
+                preds = []
+                bits = rev_edges[u]
+                while bits:
+                    low = bits & -bits
+                    bits ^= low
+                    m = low.bit_length() - 1
+                    preds.append((u - offsets[m], costs[m]))
+            for p, cost in preds:
+                updated += 1
+                v = cost + gu
+                if v < rhs.get(p, inf):
+                    rhs[p] = v
+                    queue(p)
+
+        def raised(u, g_old):
+            # g(u) went up from g_old: predecessors whose rhs came through u need a full recompute
+            if u == virtual:
+                preds = ((goal, 0.0),)
+            else:
+                preds = []
+                bits = rev_edges[u]
+                while bits:
+                    low = bits & -bits
+                    bits ^= low
+                    m = low.bit_length() - 1
+                    preds.append((u - offsets[m], costs[m]))
+            for p, cost in preds:
+                if rhs.get(p, inf) == cost + g_old:
+                    recompute(p)
+
+        for c in changed:
+            recompute(c)
+
+        expanded = 0
+        self.converged = True
+        while open_heap:
+            k1, k2, u = open_heap[0]
+            if open_keys.get(u) != (k1, k2):
+                pop(open_heap)  # stale entry
+                continue
+            top = (k1, k2)
+            if not (top < key(start) or rhs.get(start, inf) > g.get(start, inf)):
+                break
+            if expanded >= max_expansions:
+                self.converged = False
+                break
+            pop(open_heap)
+            del open_keys[u]
+            k_new = key(u)
+            if top < k_new:
+                open_keys[u] = k_new
+                push(open_heap, (k_new[0], k_new[1], u))
+                continue
+            expanded += 1
+            g_old = g.get(u, inf)
+            if g_old > rhs.get(u, inf):
+                g[u] = rhs[u]
+                lowered(u, rhs[u])
+            else:
+                g[u] = inf
+                recompute(u)
+                raised(u, g_old)
+        self.cells_updated = updated
+        return expanded
+
+    def _slide(self, nav: NavGrid, lo):
+        """Re-key all state for a window whose corner moved from self.lo to lo; returns changed cells"""
+        old = self.nav
+        s0, s1 = nav.strides[0], nav.strides[1]
+        dx, dy, dz = lo[0] - self.lo[0], lo[1] - self.lo[1], lo[2] - self.lo[2]
+        delta = dy * s0 + dz * s1 + dx
+        if delta:
+            virtual = self.virtual
+            move = lambda c: c if c == virtual else c - delta
+            self.g = {move(c): v for c, v in self.g.items()}
+            self.rhs = {move(c): v for c, v in self.rhs.items()}
+            self.open_keys = {move(c): k for c, k in self.open_keys.items()}
+            self.open = [(k1, k2, move(c)) for k1, k2, c in self.open]
+            heapq.heapify(self.open)
+            self.start = move(self.start)
+            self._set_goal(move(self.goal))
+
+        # Old bitmasks moved into the new frame vs new bitmasks
+        n = nav.flat_bits.size
+        shifted = np.zeros(n, dtype=np.int64)
+        if delta >= 0:
+            shifted[:n - delta] = old.flat_bits[delta:]
+        else:
+            shifted[-delta:] = old.flat_bits[:delta]
+        self.nav, self.lo = nav, lo
+        return np.flatnonzero(shifted != nav.flat_bits).tolist()
+
+    def plan(self, nav: NavGrid, lo, start, goal, dimension=None, max_expansions: int = 20000):
+        """
+        Path from start to goal (grid coords (iy, iz, ix) of nav, whose corner is world `lo`).
+        Returns [(cell index, method), ...] excluding start, or None.
+        """
+        self.calls += 1
+        lo = tuple(lo)
+        s, g = nav.index(start), nav.index(goal)
+        if self.nav is None or dimension != self.dimension or nav.shape != self.nav.shape \
+                or max(abs(a - b) for a, b in zip(lo, self.lo)) > PAD:
+            # First call, other dimension or teleport: start over
+            changed = self._restart(nav, lo, s, g, dimension)
+        else:
+            changed = self._slide(nav, lo) if nav is not self.nav else []
+            if s != self.start:
+                self.km += self._octile(self.start, s)
+                self.start = s
+            if g != self.goal and self._octile(g, self.goal) > self.max_goal_move:
+                # Target jumped: repairing every g-value costs more than a fresh search
+                changed = self._restart(nav, lo, s, g, dimension)
+            elif g != self.goal:
+                old_goal = self.goal
+                self._set_goal(g)
+                changed += [old_goal, g]
+
+        cap = max_expansions
+        if self.full_search is not None:
+            cap = min(cap, max(self.min_repair, int(self.repair_factor * self.full_search)))
+        self.nodes_expanded = self._search(changed, cap)
+        self.nodes_expanded_total += self.nodes_expanded
+        if self.converged:
+            if self.full_search is None:
+                self.full_search = self.nodes_expanded
+            self.building = False
+            return self._extract_path()
+        if not self.building:
+            self.capped += 1
+            self.reset()  # the next call starts a new tree
+        return self._astar(nav, start, goal, max_expansions)
+
+    def _astar(self, nav, start, goal, max_expansions):
+        """Answer this call with NavGrid A* from scratch (the tree is incomplete or was dropped)"""
+        self.fallbacks += 1
+        path = nav.astar(start, goal, max_expansions)
+        self.nodes_expanded += nav.nodes_expanded
+        self.nodes_expanded_total += nav.nodes_expanded
+        self.full_search = nav.nodes_expanded
+        return path
+
+    def _restart(self, nav, lo, s, g, dimension):
+        """Seed a new tree at the virtual goal; plan() expands it (returns the cells to re-evaluate)"""
+        if self.nav is not None:
+            self.resets += 1
+        self.reset()
+        self._prepare(nav)
+        self.dimension = dimension
+        self.nav, self.lo = nav, lo
+        self.start = s
+        self._set_goal(g)
+        self.rhs[self.virtual] = 0.0
+        self.building = True
+        return [self.virtual]
+
+    def _octile(self, a, b):
+        dx = abs(self._cx[a] - self._cx[b])
+        dz = abs(self._cz[a] - self._cz[b])
+        return dx + dz + (SQRT2 - 2) * min(dx, dz)
+
+    def _extract_path(self, max_len: int = 512):
+        if self.rhs.get(self.start, math.inf) == math.inf:
+            return None
+        nav, g = self.nav, self.g
+        path = []
+        c = self.start
+        while c != self.goal:
+            best, best_v, best_m = None, math.inf, None
+            bits = nav.edges[c]
+            while bits:
+                low = bits & -bits
+                bits ^= low
+                m = low.bit_length() - 1
+                v = nav.costs[m] + g.get(c + nav.offsets[m], math.inf)
+                if v < best_v:
+                    best, best_v, best_m = c + nav.offsets[m], v, m
+            if best_v == math.inf or len(path) >= max_len:
+                return None
+            path.append((best, MOVES[best_m][0]))
+            c = best
+        return path
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "resets": self.resets,
+            "capped": self.capped,
+            "fallbacks": self.fallbacks,
+            "nodes_expanded": self.nodes_expanded,
+            "nodes_expanded_total": self.nodes_expanded_total,
+            "cells_updated": self.cells_updated,
+        }
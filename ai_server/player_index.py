@@ -0,0 +1,105 @@
+"""
+Spatial index over the reported player list (/v1/report).
+
+Positions, yaw view vectors and a uniform XZ grid hash are built once per
+report, so next_move's "nearest player" and "who is looking at me" checks are
+numpy queries over the few grid cells around the bot instead of a Python loop
+with trig over every player on every poll. Below GRID_MIN_PLAYERS the hash
+costs more than it saves, so small lists skip it and scan the plain arrays.
+
+Distances are horizontal (XZ) like the rest of next_move.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+CELL = 16.0  # grid hash cell size in blocks
+GRID_MIN_PLAYERS = 64  # fewer players than this: no grid hash, scan the arrays
+
+
+class PlayerIndex:
+    def __init__(self, players: List[Dict[str, Any]], cell: float = CELL, grid_min: int = GRID_MIN_PLAYERS):
+        self.players = players
+        self.cell = cell
+        n = len(players)
+        self.pos = np.array([[p["location"]["x"], p["location"]["y"], p["location"]["z"]] for p in players],
+                            dtype=np.float64).reshape(n, 3)
+        self.x, self.z = self.pos[:, 0].copy(), self.pos[:, 2].copy()  # contiguous XZ columns
+        self.by_name = {p["name"]: i for i, p in enumerate(players)}
+
+        # View direction on the XZ plane; NaN for players reported without rotation.
+        # Yaw in MC: 0=South(+Z), 90=West(-X), 180=North(-Z), -90=East(+X)
+        yaw = np.array([(p.get("rotation") or {}).get("y", math.nan) for p in players], dtype=np.float64)
+        yaw_rad = np.radians(yaw + 90)
+        self.look_x, self.look_z = np.cos(yaw_rad), np.sin(yaw_rad)
+
+        # Grid hash: cell -> indices of the players in it (None: scan everyone)
+        self.cells: Optional[Dict[Tuple[int, int], np.ndarray]] = None
+        if n >= grid_min:
+            self.cells = {}
+            keys = np.floor(self.pos[:, [0, 2]] / cell).astype(np.int64)
+            uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+            order = np.argsort(inverse.ravel(), kind="stable")
+            bounds = np.searchsorted(inverse.ravel()[order], np.arange(len(uniq) + 1))
+            for k, (cx, cz) in enumerate(uniq.tolist()):
+                self.cells[(cx, cz)] = order[bounds[k]:bounds[k + 1]]
+
+    def __len__(self):
+        return len(self.players)
+
+    def find(self, name: str) -> Optional[int]:
+        return self.by_name.get(name)
+
+    def _candidates(self, center, radius: float) -> Optional[np.ndarray]:
+        """Indices whose grid cells overlap the query box; None means every player"""
+        if self.cells is None or not math.isfinite(radius):
+            return None
+        x, z = center["x"], center["z"]
+        cx0, cx1 = math.floor((x - radius) / self.cell), math.floor((x + radius) / self.cell)
+        cz0, cz1 = math.floor((z - radius) / self.cell), math.floor((z + radius) / self.cell)
+        if (cx1 - cx0 + 1) * (cz1 - cz0 + 1) > len(self.cells):
+            return None  # box covers more cells than are occupied
+        parts = [self.cells[(cx, cz)] for cx in range(cx0, cx1 + 1) for cz in range(cz0, cz1 + 1)
+                 if (cx, cz) in self.cells]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def within(self, center, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(indices, distances) of players within `radius` of center, nearest first"""
+        idx = self._candidates(center, radius)
+        if idx is None:
+            dist = np.hypot(self.x - center["x"], self.z - center["z"])
+            idx = np.flatnonzero(dist < radius)
+            dist = dist[idx]
+        else:
+            dist = np.hypot(self.x[idx] - center["x"], self.z[idx] - center["z"])
+            keep = dist < radius
+            idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist, kind="stable")
+        return idx[order], dist[order]
+
+    def nearest(self, center, radius: float = math.inf, exclude: str = None) -> Optional[int]:
+        idx, _ = self.within(center, radius)
+        skip = self.by_name.get(exclude)
+        for i in idx.tolist():
+            if i != skip:
+                return i
+        return None
+
+    def watchers(self, center, radius: float = 20.0, min_dot: float = 0.9) -> np.ndarray:
+        """
+        Players within `radius` whose view points at center: the cosine between
+        their look vector and the direction to center is above min_dot
+        (0.9 ~ a 25 degree cone). Nearest first.
+        """
+        idx, dist = self.within(center, radius)
+        dx = center["x"] - self.x[idx]
+        dz = center["z"] - self.z[idx]
+        # cos > min_dot without dividing by dist (0 for a player standing on center)
+        dot = dx * self.look_x[idx] + dz * self.look_z[idx]
+        return idx[(dist > 0) & (dot > min_dot * dist)]  # NaN yaw never passes
+
+    def location(self, i: int) -> Dict[str, float]:
+        return self.players[i]["location"]
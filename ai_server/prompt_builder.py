@@ -0,0 +1,153 @@
+"""
+Bounded chat history and a token-budgeted prompt context for think().
+
+ChatHistory keeps the last `max_turns` chat lines. Older lines are folded
+into a rolling per-sender summary (message count and last message), which
+is itself capped, so memory stays flat over a long session.
+
+PromptBuilder fills the "現在の状況" block of a prompt within a token budget.
+Players come first: one compact line each, with rounded coordinates and only
+the tags that differ from the tags every player shares (the shared ones are
+listed once). Recent chat goes in newest first while it fits, then the
+summary of older chat. Token counts are estimated (about 4 ASCII characters
+or 1 CJK character per token), since the model's tokenizer is not available here.
+"""
+from __future__ import annotations
+
+import math
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List
+
+SLOT = "\x00context\x00"  # placeholder for the context block in a prompt template
+
+
+def estimate_tokens(text: str) -> int:
+    ascii_chars = sum(1 for c in text if c < "\x80")
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def _clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+class ChatHistory:
+    def __init__(self, max_turns: int = 40, max_summary_senders: int = 8):
+        self.max_turns = max_turns
+        self.max_summary_senders = max_summary_senders
+        self.turns: Deque[Dict[str, str]] = deque()
+        self._summary: "OrderedDict[str, List[Any]]" = OrderedDict()  # sender -> [count, last message]
+        self.summarized = 0
+
+    def __len__(self):
+        return len(self.turns)
+
+    def append(self, entry: Dict[str, str]):
+        """entry: {"sender": ..., "message": ...}"""
+        self.turns.append(entry)
+        while len(self.turns) > self.max_turns:
+            self._fold(self.turns.popleft())
+
+    def _fold(self, entry: Dict[str, str]):
+        self.summarized += 1
+        sender = entry["sender"]
+        count = self._summary.pop(sender, [0, ""])[0]
+        self._summary[sender] = [count + 1, entry["message"]]
+        while len(self._summary) > self.max_summary_senders:
+            self._summary.popitem(last=False)
+
+    def dump(self) -> Dict[str, Any]:
+        """JSON-able state, for load() after a restart"""
+        return {"turns": list(self.turns), "summarized": self.summarized,
+                "summary": [[sender, count, last] for sender, (count, last) in self._summary.items()]}
+
+    def load(self, state: Dict[str, Any]):
+        self.turns = deque(state["turns"])
+        self.summarized = state["summarized"]
+        self._summary = OrderedDict((sender, [count, last]) for sender, count, last in state["summary"])
+
+    def recent(self, n: int) -> List[Dict[str, str]]:
+        return list(self.turns)[-n:] if n > 0 else []
+
+    def summary(self) -> str:
+        """Older chat, most recently active sender first; "" until something was folded"""
+        parts = [f"{sender}({count}件, 最後「{_clip(last, 30)}」)"
+                 for sender, (count, last) in reversed(self._summary.items())]
+        return ", ".join(parts)
+
+
+class PromptBuilder:
+    def __init__(self, budget_tokens: int = 1200, max_chats: int = 10):
+        self.budget_tokens = budget_tokens
+        self.max_chats = max_chats
+        self.builds = 0
+        self.last_tokens = 0
+        self.max_tokens = 0
+        self.total_tokens = 0
+        self.dropped_chats = 0  # recent chat lines that did not fit the budget
+
+    @staticmethod
+    def player_lines(players: List[Dict[str, Any]]) -> List[str]:
+        """Shared tags line (if any) followed by one line per player"""
+        tag_sets = [[t for ts in p.get("tags", {}).values() for t in ts] for p in players]
+        common = set(tag_sets[0]).intersection(*tag_sets[1:]) if len(tag_sets) > 1 else set()
+        lines = [f"全員共通タグ: {' '.join(sorted(common))}"] if common else []
+        for p, tags in zip(players, tag_sets):
+            loc = p["location"]
+            own = " ".join(t for t in tags if t not in common)
+            line = f"{p['name']} ({round(loc['x'])},{round(loc['y'])},{round(loc['z'])})"
+            lines.append(f"{line} {own}" if own else line)
+        return lines
+
+    def context(self, players: List[Dict[str, Any]], history: ChatHistory, budget: int) -> str:
+        """The 現在の状況 block, at most `budget` tokens (players are never cut below one line)"""
+        lines = ["現在の状況:", "- プレイヤー一覧:"]
+        # Reserve the chat header and a possible "omitted" line up front
+        used = estimate_tokens("\n".join(lines + ["- 直近のチャット:", "  (なし)"])) + 2
+        omitted = estimate_tokens("  (ほか 999 行省略)") + 1
+        player_lines = self.player_lines(players) if players else ["(なし)"]
+        for k, line in enumerate(player_lines):
+            line = f"  {line}"
+            cost = estimate_tokens(line) + 1
+            if k > 0 and used + cost + omitted > budget:
+                lines.append(f"  (ほか {len(player_lines) - k} 行省略)")
+                used += omitted
+                break
+            lines.append(line)
+            used += cost
+
+        chats = history.recent(self.max_chats)
+        fitted: List[str] = []
+        for c in reversed(chats):
+            line = f"  {c['sender']}: {_clip(c['message'], 200)}"
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                self.dropped_chats += len(chats) - len(fitted)
+                break
+            fitted.append(line)
+            used += cost
+        lines.append("- 直近のチャット:")
+        lines.extend(reversed(fitted) if fitted else ["  (なし)"])
+
+        summary = history.summary()
+        if summary:
+            line = f"- それ以前の会話: {summary}"
+            if used + estimate_tokens(line) + 1 <= budget:
+                lines.append(line)
+        return "\n".join(lines)
+
+    def fill(self, template: str, players: List[Dict[str, Any]], history: ChatHistory) -> str:
+        """Replace SLOT in `template` with a context that keeps the whole prompt within budget"""
+        fixed = estimate_tokens(template.replace(SLOT, ""))
+        prompt = template.replace(SLOT, self.context(players, history, max(0, self.budget_tokens - fixed)))
+        tokens = estimate_tokens(prompt)
+        self.builds += 1
+        self.last_tokens = tokens
+        self.max_tokens = max(self.max_tokens, tokens)
+        self.total_tokens += tokens
+        return prompt
+
+    def stats(self) -> Dict[str, Any]:
+        return {"builds": self.builds, "budget_tokens": self.budget_tokens,
+                "last_tokens": self.last_tokens, "max_tokens": self.max_tokens,
+                "avg_tokens": self.total_tokens / self.builds if self.builds else None,
+                "dropped_chats": self.dropped_chats}
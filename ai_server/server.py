@@ -1,28 +1,62 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import uvicorn
-import requests
 import json
 import random
+import time
+import textwrap
+import math
+import asyncio
+import atexit
+import signal
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
 import os
-from typing import List, Optional, Dict, Any
+import numpy as np
+from typing import List, Optional, Dict, Any, Tuple
 
-app = FastAPI()
+import parkour_brain
+import state_backend
+import voxel_codec
+from addressee import AddresseeClassifier, mentions
+from decision_cache import DecisionCache, fingerprint
+from event_bus import EventBus
+from fast_path import CACHE, LLM, RETALIATE, FastPath, Situation
+from game_master import GameMaster, GameState, gm
+from journal import CHECKPOINT, Journal, replay
+from json_stream import JsonFieldStream
+from llm_router import LLMRouter
+from player_index import PlayerIndex
+from prompt_builder import SLOT, ChatHistory, PromptBuilder
+from state_backend import SharedState
+from think_scheduler import AMBIENT, MENTION, ThinkScheduler
+from voxel_recorder import SnapshotRing, VoxelRecorder, freeze
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 複数ワーカーではワーカー 0 だけが思考し、ほかのワーカーからの依頼を受け付ける
+    relay = asyncio.create_task(_relay_thinks()) if WORKER_COUNT > 1 and WORKER_INDEX == 0 else None
+    yield
+    if relay is not None:
+        relay.cancel()
+    await llm.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Mount Debug Frontend
 if not os.path.exists("debug_frontend"):
     os.makedirs("debug_frontend", exist_ok=True)
 app.mount("/debug", StaticFiles(directory="debug_frontend", html=True), name="debug")
 
-# 設定
-OLLAMA_URL = "http://localhost:11434/api/generate"
-MODEL_NAME = "llama3.1" # RTX 5080 (16GB VRAM) 推奨
-
 # データモデル
 class PlayerData(BaseModel):
     name: str
     location: Dict[str, float]
+    rotation: Optional[Dict[str, float]] = None  # {x: pitch, y: yaw}
     tags: Dict[str, List[str]]
 
 class ChatData(BaseModel):
@@ -57,32 +91,119 @@ class VoxelSnapshot(BaseModel):
     height: int
     grid: List[int]
 
+class BotRoster(BaseModel):
+    bots: List[str]  # ai タグの付いたプレイヤー (いま参加している AI ボット全員)
+
+@app.post("/v1/mc/bots")
+def report_bots(roster: BotRoster):
+    """AI ボットの一覧を受け取る (main.js が全ワーカーに定期的に送る)
+
+    一覧にない名前の視界・tick は 404 にして ParkourBrain を作らない。一覧から消えたボット
+    (ログアウト・改名) と、BRAIN_IDLE_TTL 秒使われていないボットの brain はここで捨てる
+    """
+    names = sorted(set(roster.bots))
+    if game_state.get("ai_bots") != names:
+        game_state["ai_bots"] = names
+    brains = parkour_brain.brains
+    removed = [name for name in brains.names() if name not in names and brains.remove(name)]
+    removed += brains.evict_idle()
+    for name in removed:
+        snapshot_ring.remove(name)
+    return {"bots": len(names), "removed": removed}
+
+def _check_bot(name: str):
+    """/v1/mc/bots で報告された AI ボット以外の視界は受け取らない (知らない名前で brain を作らない)"""
+    if name not in game_state.get("ai_bots", ()):
+        raise HTTPException(status_code=404, detail=f"{name} is not a reported AI bot")
+
 @app.post("/v1/mc/state")
 def receive_state(snapshot: VoxelSnapshot):
     """マイクラからの視界データ(Voxel)を受け取る"""
-    global latest_voxel_snapshot
-    
-    # Update global state for visualizer
-    latest_voxel_snapshot = snapshot.dict()
-    # Add path if available from brain (Mock for now or extract)
-    # If we want to show the path *AI planned*, we should grab it from Brain.
-    from parkour_brain import brain
-    # Ideally brain updates its internal state when we call update_state below.
-    # But path is calculated on 'get_next_action' or we can store last path.
-    
-    # Save to file for debug/visualization (Legacy)
-    with open("latest_voxel.json", "w") as f:
-        f.write(snapshot.json())
-
-    # --- Parkour Logic (Simplified for now) ---
-    from parkour_brain import brain
-    
-    # 1. Update Brain
-    brain.update_state(snapshot.dict())
-    
+    _check_owner(snapshot.player.name)
+    _check_bot(snapshot.player.name)
+    _ingest_snapshot(snapshot.dict())
     return {"ok": True}
 
-latest_voxel_snapshot = None
+@app.post("/v1/mc/state/packed")
+async def receive_state_packed(request: Request):
+    """バイナリ形式の視界データを受け取る (voxel_codec 参照)
+
+    Content-Type: application/octet-stream -> raw body
+    それ以外 (text/plain 等)             -> base64 body (server-net は文字列しか送れない)
+    """
+    body = await request.body()
+    is_b64 = request.headers.get("content-type", "").split(";")[0].strip() != "application/octet-stream"
+    try:
+        frame = voxel_codec.decode_body(body, is_base64=is_b64)
+        if frame.kind == voxel_codec.FRAME_DELTA:
+            data = voxel_codec.decode_delta(frame)
+        else:
+            data = voxel_codec.decode_cells(frame)
+    except voxel_codec.VoxelDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _check_owner(frame.player)
+    _check_bot(frame.player)
+
+    brains = parkour_brain.brains
+    result = await asyncio.wrap_future(brains.submit(frame.player, _ingest_frame, frame, data))
+    if result == "need_keyframe":
+        # 差分の基準フレームを持っていない -> クライアントにキーフレームを要求
+        raise HTTPException(status_code=409, detail="need_keyframe")
+    return {"ok": True, "stale": True} if result == "stale" else {"ok": True}
+
+_last_frame_seq: Dict[str, int] = {}
+
+def _ingest_frame(brain, frame, data) -> str:
+    """Runs under the bot's lock. Returns "ok", "stale" or "need_keyframe"."""
+    # HTTP requests from server-net can overtake each other; keep the newest frame
+    # (a fresh brain, e.g. after eviction, takes any frame)
+    last = _last_frame_seq.get(frame.player) if brain.snapshot is not None else None
+    if last is not None and frame.seq <= last and last - frame.seq < 1000:
+        return "stale"
+
+    if frame.kind == voxel_codec.FRAME_DELTA:
+        if not _ingest_delta(brain, frame, *data):
+            return "need_keyframe"
+    else:
+        brain.update_state(voxel_codec.frame_to_snapshot(frame, data))
+    _last_frame_seq[frame.player] = frame.seq
+    _remember(frame.player, brain)
+    return "ok"
+
+def _ingest_snapshot(data: Dict[str, Any]):
+    brains = parkour_brain.brains
+    name = data["player"]["name"]
+
+    def ingest(brain):
+        # 1. Update Brain (the bot's own; snapshots of other AI bots go to theirs)
+        brain.update_state(data)
+        _remember(name, brain)
+    brains.run(name, ingest)
+
+# Debug/visualization history: in memory per bot, disk only if VOXEL_RECORD_PATH is set
+snapshot_ring = SnapshotRing()
+voxel_recorder = VoxelRecorder.from_env()
+if voxel_recorder:
+    atexit.register(voxel_recorder.close)
+
+def _remember(name: str, brain):
+    snap = freeze(brain.snapshot)
+    snapshot_ring.push(name, snap)
+    if voxel_recorder:
+        voxel_recorder.submit(snap)  # encoded and written on the recorder thread
+    _share_bot(name, brain)
+
+def _ingest_delta(brain, frame, base_seq, indices, values) -> bool:
+    if brain.snapshot is None or (brain.radius, brain.half_height) != (frame.radius, frame.half_height):
+        return False
+    # Grid lives in the brain's rolling buffer; brain.snapshot follows it
+    return brain.apply_delta(frame.origin, indices, values, frame.seq, base_seq)
+
+def _jsonable_snapshot(data: Dict[str, Any]) -> Dict[str, Any]:
+    grid = data.get("grid")
+    if isinstance(grid, np.ndarray):
+        data = dict(data, grid=grid.ravel().tolist())
+    return data
 
 class GameEvent(BaseModel):
     type: str
@@ -93,62 +214,129 @@ class GameEvent(BaseModel):
 @app.post("/v1/mc/events")
 def receive_event(evt: GameEvent):
     """マイクラからのイベント受信"""
+    _handle_event(evt)
+    return {"status": "ok"}
+
+# 殴られてから RETALIATE_WINDOW 秒以内なら fast_path が反撃を決める (1 回の被弾につき 1 回)
+RETALIATE_WINDOW = float(os.getenv("RETALIATE_WINDOW", "3"))
+# 被弾の記録はバックエンドの "hits" (bot -> [attacker, time.time()]) に置く (思考するワーカー 0 からも見える)
+
+def _handle_event(evt: GameEvent):
+    _journal("event", evt.dict())
     if evt.type == "hit":
         print(f"🔥 {evt.victim} was hit by {evt.attacker}!")
-        # Update Brain Target
-        from parkour_brain import brain
-        brain.set_target_player(evt.attacker)
-        
-    return {"status": "ok"}
+        # Update Brain Target: the bot that was hit, or every bot if a human was
+        bots = _bot_views()
+        names = [name for name in ([evt.victim] if evt.victim in bots else bots) if name != evt.attacker]
+        for name in names:
+            if _is_local(name):
+                parkour_brain.brains.run(name, lambda brain: brain.set_target_player(evt.attacker))
+            else:
+                bus.publish(_brain_topic(name), {"target": evt.attacker})
+        if names:
+            now = time.time()
+
+            def record(hits: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+                hits = {n: hit for n, hit in hits.items() if hit[1] >= now - RETALIATE_WINDOW}
+                hits.update((name, [evt.attacker, now]) for name in names)
+                return hits
+            backend.update("hits", record, {})
+
+def _fresh_hits() -> List[Tuple[str, str]]:
+    """(bot, attacker) for hits not yet answered and at most RETALIATE_WINDOW seconds old"""
+    cutoff = time.time() - RETALIATE_WINDOW
+    return [(name, attacker) for name, (attacker, at) in game_state.get("hits", {}).items() if at >= cutoff]
+
+def _answer_hit(bot: str):
+    backend.update("hits", lambda hits: {n: hit for n, hit in hits.items() if n != bot}, {})
+
+class TickRequest(BaseModel):
+    player: str
+    dimension: Optional[str] = None  # このディメンション宛てのコマンドも受け取る (省略時は視界データのもの)
+    frame: Optional[str] = None  # base64 packed frame (voxel_codec), or
+    snapshot: Optional[VoxelSnapshot] = None  # legacy JSON snapshot
+    events: List[GameEvent] = []
+
+@app.post("/v1/mc/tick")
+async def tick(req: TickRequest):
+    """1 tick 分をまとめて処理: 視界データ + イベント -> 次の動作 + コマンド
+
+    /v1/mc/state, /v1/mc/events, /v1/mc/next_move, /v1/mc/commands を 1 往復にしたもの。
+    視界の反映と経路計画は同じ Bot のロック内で行うので、古い視界で計画することがない。
+    frame: "ok" | "stale" | "need_keyframe" (次はキーフレームを送る) | null (視界なし)
+    """
+    frame = data = None
+    if req.frame is not None:
+        try:
+            frame = voxel_codec.decode_body(req.frame.encode("ascii"), is_base64=True)
+            if frame.kind == voxel_codec.FRAME_DELTA:
+                data = voxel_codec.decode_delta(frame)
+            else:
+                data = voxel_codec.decode_cells(frame)
+        except (voxel_codec.VoxelDecodeError, UnicodeEncodeError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if frame.player != req.player:
+            raise HTTPException(status_code=400, detail="frame is for another player")
+    snapshot = req.snapshot.dict() if req.snapshot is not None else None
+    if snapshot is not None and snapshot["player"]["name"] != req.player:
+        raise HTTPException(status_code=400, detail="snapshot is for another player")
+
+    _check_owner(req.player)
+    _check_bot(req.player)
+
+    if JOURNAL_FRAMES and req.frame is not None:
+        _journal("frame", {"player": req.player, "frame": req.frame})
+    parkour_brain.brains.get(req.player)  # so a hit on this bot's first tick targets it
+    for evt in req.events:
+        await _shared_io(_handle_event, evt)
+
+    target = await _pending_target(req.player)
+    frame_status, move = await asyncio.wrap_future(parkour_brain.brains.submit(
+        req.player, _tick_brain, req.player, frame, data, snapshot, _player_index(), target))
+    dimension = req.dimension or (frame.dimension if frame is not None else
+                                  snapshot["player"]["dimension"] if snapshot is not None else None)
+    return {"frame": frame_status, "move": move, "commands": await _shared_io(_drain_commands, req.player, dimension)}
+
+def _tick_brain(brain, player_name, frame, data, snapshot, index, target=None):
+    """Runs under the bot's lock: ingest the new view (and a target from another worker), then plan on it"""
+    if target is not None:
+        brain.set_target_player(target)
+    status = None
+    if frame is not None:
+        status = _ingest_frame(brain, frame, data)
+    elif snapshot is not None:
+        brain.update_state(snapshot)
+        _remember(player_name, brain)
+        status = "ok"
+    if brain.snapshot is None:
+        return status, {"type": "idle"}
+    return status, _decide_move(brain, player_name, index)
 
 class UnmuteRequest(BaseModel):
     mcName: str
 
 @app.post("/v1/discord/unmute")
 def request_unmute(req: UnmuteRequest):
-    """Ghost Modeからのミュート解除リクエスト"""
-    # Simply fire a 'speak' event or specialized unmute event that bot polls
-    # We reuse 'discord_report' queue logic?
-    # Or create a new event type in the shared queue which bot polls via /pull
-    
-    # We append to 'events' queue that bot.py polls.
-    # Where is that queue stored?
-    # server.py doesn't seem to have a persistent event queue for Discord polling in the snippet I saw?
-    # Let's check 'ChatData' or 'ReportData'?
-    # Ah, 'command_queue' is for MC.
-    # We need a queue for Discord.
-    
-    # Let's add it to a global 'discord_events' list if not exists, or just print for now if bot.py polls logs (unlikely).
-    # Re-reading bot.py (Step 984), it polls POST_BASE/v1/discord/pull.
-    # Let's check server.py endpoint for /pull.
-    # If not found, I need to add it.
-    
-    global discord_events
-    discord_events.append({
-        "type": "mute", # Using 'mute' with 'target' to force unmute?
-        # unique event for unmuting
+    """Ghost Modeからのミュート解除リクエスト (Discord Bot が /v1/discord/pull で受け取る)"""
+    bus.publish(DISCORD_TOPIC, {
         "type": "unmute_request",
         "mc_name": req.mcName
     })
     return {"status": "ok"}
 
-discord_events = []
-
-@app.post("/v1/discord/pull")
-def pull_discord_events():
-    global discord_events
-    events = discord_events[:]
-    discord_events = []
-    # return events wrapped
-    return {"events": events}
-
-def get_latest_voxel():
-    if latest_voxel_snapshot is None:
+@app.get("/v1/debug/voxel")
+def get_latest_voxel(player_name: Optional[str] = None):
+    """最新の視界データ + 経路 (debug_frontend / visualize_voxel.py 用)"""
+    brains = parkour_brain.brains
+    if player_name is None:
+        # Any bot that has sent a snapshot
+        player_name = next((n for n in brains.names() if brains.get(n).snapshot is not None), None)
+    brain = brains.get(player_name, create=False) if player_name else None
+    if brain is None or brain.snapshot is None:
         return {"error": "no data"}
     
     # Inject current brain path if available
-    from parkour_brain import brain
-    data = latest_voxel_snapshot.copy()
+    data = dict(_jsonable_snapshot(brain.snapshot))
     
     # Add debug info
     if brain.target_pos:
@@ -158,25 +346,65 @@ def get_latest_voxel():
 
     return data
     
+@app.get("/v1/debug/voxel/history")
+def get_voxel_history(player_name: str = "Bot", limit: int = 8):
+    """直近の視界データ (古い順, 最大 VOXEL_RING_SIZE 件)"""
+    snaps = snapshot_ring.latest(player_name, limit)
+    return {
+        "player": player_name,
+        "snapshots": [_jsonable_snapshot(s) for s in snaps],
+        "recorder": voxel_recorder.stats() if voxel_recorder else None,
+    }
+
+@app.get("/v1/mc/debug/planner")
+def get_planner_stats(player_name: str = "Bot"):
+    """経路探索のカウンタ (A* / D* Lite の展開ノード数など)"""
+    brains = parkour_brain.brains
+    brain = brains.get(player_name, create=False)
+    if brain is None:
+        raise HTTPException(status_code=404, detail="unknown bot")
+    return {
+        "nodes_expanded": brain.nodes_expanded,
+        "incremental": brain.planner.stats(),
+    }
+
 @app.post("/v1/mc/next_move")
-def get_next_move(player_name: str = "Bot"): 
-    """Botの次の動作を決定して返す (High-Frequency Polling)"""
-    from parkour_brain import brain
-    
-    if latest_voxel_snapshot:
-        brain.update_state(latest_voxel_snapshot)
+async def get_next_move(player_name: str = "Bot"): 
+    """Botの次の動作を決定して返す (High-Frequency Polling)
+
+    Bot ごとの ParkourBrain をワーカープールで計画する (Bot 同士は並列)
+    """
+    _check_owner(player_name)
+    brains = parkour_brain.brains
+    target = await _pending_target(player_name)
+    if target is not None:
+        await asyncio.wrap_future(brains.submit(player_name, parkour_brain.ParkourBrain.set_target_player, target))
+    brain = brains.get(player_name, create=False)
+    if brain is None or brain.snapshot is None:
+        return {"type": "idle"}
+    return await asyncio.wrap_future(brains.submit(player_name, _decide_move, player_name, _player_index()))
+
+def _decide_move(brain, player_name: str, index: PlayerIndex):
+    """Runs under the bot's lock on the brain pool"""
+    if brain.snapshot:
+        # brain already holds this snapshot (and its nav grid) from /v1/mc/state
+        
+        # Candidates are ranked by walking cost on the brain's distance field
+        # (one Dijkstra per snapshot), not straight-line distance, so a player
+        # behind a wall or across a ravine does not win over a reachable one.
+        # The player index narrows them to the grid cells around the bot first.
+        my_pos = brain.snapshot["origin"]
         
         # --- Priority 1: Chase (Target Player) ---
         target_rel = None
         has_target = False
         
-        from game_master import gm
-        
         # Check active CHASE target
         if brain.target_player:
-            target_p = next((p for p in gm.state.players if p.name == brain.target_player), None)
-            if target_p:
-                dist = _calc_dist(latest_voxel_snapshot["origin"], target_p.location)
+            i = index.find(brain.target_player)
+            if i is not None and _is_candidate(index.players[i], player_name):
+                target_loc = index.location(i)
+                dist = _calc_dist(my_pos, target_loc)
                 if dist > 30: 
                     print(f"Chase: Lost target (too far {dist:.1f})")
                     brain.target_player = None
@@ -184,81 +412,46 @@ def get_next_move(player_name: str = "Bot"):
                     print(f"Chase: Caught up!")
                     # Attack Logic could go here (send 'attack' command?)
                 else:
-                    target_rel = _calc_rel(latest_voxel_snapshot["origin"], target_p.location)
+                    target_rel = _calc_rel(my_pos, target_loc)
                     has_target = True
             else:
                 brain.target_player = None
         
         # --- Priority 2: Observe (Being Watched) ---
-        # If someone is looking at us, stare back and freeze (fear factor)
+        # If someone is looking at us (within 20 blocks, ~25 deg cone), stare back
+        # and freeze (fear factor): approach the closest watcher slowly (creepy)
         if not has_target:
-            my_pos = latest_voxel_snapshot["origin"]
-            
-            for p_name, p_state in gm.state.players.items():
-                if p_name == player_name: continue
-                if not p_state.is_alive: continue
-                # Skip spectators
-                if "spectator" in p_state.role or "ghost" in p_state.tags: continue
-
-                # Check if looking at me
-                # Vector from Them -> Me
-                dx = my_pos["x"] - p_state.location["x"]
-                dz = my_pos["z"] - p_state.location["z"]
-                dist = (dx**2 + dz**2)**0.5
-                
-                if dist < 20: # Only care if close enough
-                     # Normalize direction to me
-                     dir_to_me = {"x": dx/dist, "z": dz/dist}
-                     
-                     # Their view vector (from rotation y/yaw)
-                     # Yaw in MC: 0=South(+Z), 90=West(-X), 180=North(-Z), -90=East(+X)
-                     # Convert to Rad
-                     import math
-                     yaw_rad = (p_state.rotation["y"] + 90) * (math.pi / 180)
-                     # View Vector (2D XZ)
-                     view_x = math.cos(yaw_rad)
-                     view_z = math.sin(yaw_rad)
-                     
-                     # Dot Product
-                     dot = dir_to_me["x"] * view_x + dir_to_me["z"] * view_z
-                     
-                     # If dot > 0.9 (approx 25 deg cone), they are looking at us
-                     if dot > 0.9:
-                         # Reaction: Stare back (Turn to them)
-                         # Set target to them, but maybe DON'T move?
-                         # For now, let's just turn to face them.
-                         # ParkourBrain.get_next_action normally moves toward target.
-                         # We might need a special action "scan" or "idle_face".
-                         # For MVP: Just set them as target (Bot will walk to them slowly/creepy).
-                         # Or verify logic: if we set target, brain pathfinds.
-                         # Let's say "If watched, approach slowly" (Creepy).
-                         target_rel = _calc_rel(my_pos, p_state.location)
-                         has_target = True
-                         # print(f"Observe: {p_name} is watching! Staring back.")
-                         break
+            best = math.inf
+            for i in index.watchers(my_pos, radius=20.0, min_dot=0.9).tolist():
+                p = index.players[i]
+                if not _is_candidate(p, player_name):
+                    continue
+                score = _path_score(brain, my_pos, p["location"])
+                if score < best:
+                    best = score
+                    target_rel = _calc_rel(my_pos, p["location"])
+                    has_target = True
 
         # --- Priority 3: Group Up (If no chase target) ---
         if not has_target:
-            # Find nearest living player to stick with
+            # Find nearest living player to stick with (reachable ones only).
+            # Walking cost is never below straight-line distance (minus the one
+            # block cost_near may snap to), so only players inside the 50 block
+            # cut-off + 2 need scoring.
             nearest = None
-            min_d = 999
-            my_pos = latest_voxel_snapshot["origin"]
-            
-            for p_name, p_state in gm.state.players.items():
-                if p_name == player_name: continue
-                if not p_state.is_alive: continue
-                # Skip spectators/ghosts? 
-                if "spectator" in p_state.role or "ghost" in p_state.tags: continue # Simple check
-                
-                d = _calc_dist(my_pos, p_state.location)
+            min_d = math.inf
+            for i in index.within(my_pos, 52.0)[0].tolist():
+                p = index.players[i]
+                if not _is_candidate(p, player_name):
+                    continue
+                d = _path_score(brain, my_pos, p["location"])
                 if d < min_d:
                     min_d = d
-                    nearest = p_state
+                    nearest = p
             
-            # Logic: If isolated (> 8 blocks), move closer. If too close (< 3), stop/back up.
+            # Logic: If isolated (> 5 blocks of walking), move closer.
             if nearest and min_d > 5.0 and min_d < 50.0:
-                 # print(f"Group: Moving to {nearest.name} ({min_d:.1f}m)")
-                 target_rel = _calc_rel(my_pos, nearest.location)
+                 target_rel = _calc_rel(my_pos, nearest["location"])
                  has_target = True
         
         # --- Priority 3: Wander (Handled by Brain fallback) ---
@@ -268,6 +461,31 @@ def get_next_move(player_name: str = "Bot"):
         
     return {"type": "idle"}
 
+_index_cache: Dict[str, Any] = {"players": None, "index": PlayerIndex([])}
+
+def _player_index() -> PlayerIndex:
+    """Index over game_state["players"], rebuilt once per /v1/report"""
+    players = game_state["players"]
+    if _index_cache["players"] is not players:
+        _index_cache["index"] = PlayerIndex(players)
+        _index_cache["players"] = players
+    return _index_cache["index"]
+
+def _is_candidate(p: Dict[str, Any], player_name: str) -> bool:
+    """A reported player other than the bot, alive and not spectating"""
+    if p["name"] == player_name:
+        return False
+    p_state = _game().players.get(p["name"])
+    if p_state is not None and (not p_state.is_alive or "spectator" in p_state.role):
+        return False
+    # tags is {"pub": [...], "sec": [...]}; ghost_spectator.js tags ghosts "ghost"
+    return not any(t == "ghost" or t.endswith(":ghost") for ts in p.get("tags", {}).values() for t in ts)
+
+def _path_score(brain, my_pos, location) -> float:
+    """Walking cost from the bot to `location`; straight-line beyond the sensor window"""
+    cost = brain.path_distance(_calc_rel(my_pos, location))
+    return _calc_dist(my_pos, location) if cost is None else cost
+
 def _calc_dist(p1, p2):
     return ((p1["x"]-p2["x"])**2 + (p1["z"]-p2["z"])**2)**0.5
 
@@ -276,63 +494,264 @@ def _calc_rel(from_pos, to_pos):
             int(to_pos["y"] - from_pos["y"]), 
             int(to_pos["z"] - from_pos["z"]))
 
-# ゲーム状態とコマンドキュー
-game_state = {
-    "chat_history": [],
-    "players": []
-}
-command_queue: List[Dict[str, Any]] = []
-discord_queue: List[Dict[str, Any]] = []
+# ゲーム状態とコマンドキューの置き場所 (STATE_BACKEND):
+#   memory (既定): このプロセス内。ワーカーは 1 つだけ
+#   sqlite: STATE_DB の SQLite (WAL) をワーカー間で共有する。WORKERS=N で複数ワーカー起動できる
+backend = state_backend.from_env(max_events=int(os.getenv("BUS_MAX_EVENTS", "1024")))
+# 直近 CHAT_HISTORY_TURNS 件だけ保持し、それより古い発言は要約に畳む
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "40"))
 
-# LLM Config (LM Studio / Ollama)
-LLM_API_BASE = os.getenv("LLM_API_BASE", "http://127.0.0.1:1234/v1")
-LLM_MODEL = os.getenv("LLM_MODEL", "local-model") # LM Studio often ignores model name or uses loaded model
+def _load_chat_history(state: Dict[str, Any]) -> ChatHistory:
+    history = ChatHistory(max_turns=CHAT_HISTORY_TURNS)
+    history.load(state)
+    return history
 
-def call_llm(prompt: str) -> Optional[str]:
-    """LM Studio (OpenAI Compatible) にリクエストを送る"""
-    try:
-        # system prompt + user prompt
-        messages = [
-            {"role": "system", "content": "You are a helpful Minecraft AI assistant. Reply in JSON only."},
-            {"role": "user", "content": prompt}
-        ]
-        
-        # print(f"DEBUG: Calling LLM at {LLM_API_BASE}...")
-        
-        # Synchronous implementation for simplicity in this thread, or use httpx inside async route
-        # Since this is called from async 'think_and_queue', we should ideally use async logic or run_in_executor.
-        # But 'think_and_queue' in this file (checked line 449) is async.
-        # Let's use httpx.post directly if we can, or requests.
-        # Just going with persistent client or simple one-off.
-        
-        import requests
-        resp = requests.post(
-            f"{LLM_API_BASE}/chat/completions",
-            json={
-                "model": LLM_MODEL,
-                "messages": messages,
-                "temperature": 0.7,
-                "max_tokens": 300
-            },
-            timeout=10 # Fast timeout
-        )
-        
-        if resp.status_code == 200:
-            data = resp.json()
-            content = data["choices"][0]["message"]["content"]
-            # Clean up potential markdown code blocks
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            return content
+backend.codec("chat_history", ChatHistory.dump, _load_chat_history)
+backend.codec("gm", GameState.dict, lambda data: GameState(**data))
+game_state = SharedState(backend)  # game_state["players"] などの読み書きはバックエンドに行く
+game_state.setdefault("chat_history", ChatHistory(max_turns=CHAT_HISTORY_TURNS))
+game_state.setdefault("players", [])
+
+async def _shared_io(fn, *args):
+    """共有バックエンド (SQLite) の読み書きは、他のワーカーの書き込みを待つことがあるのでスレッドで行う"""
+    if backend.shared:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+def _append_chat(entry: Dict[str, str]):
+    """チャット履歴に 1 件追加 (共有バックエンドでは他ワーカーの追加と混ざらないよう読み書きを 1 トランザクションで)"""
+    def append(history: ChatHistory) -> ChatHistory:
+        history.append(entry)
+        return history
+    backend.update("chat_history", append)
+
+# gm.state は複数のスレッドから読まれるので、書き換えずにコピーの上で役職を配って丸ごと差し替える
+_gm_lock = threading.Lock()
+
+def _game() -> GameState:
+    """最新の gm.state (読み取り専用)。共有バックエンドでは他のワーカーが開始したゲームも含む"""
+    if backend.shared:
+        return game_state.get("gm", gm.state)
+    return gm.state
+
+def _start_game(config: Dict[str, int]):
+    def start(state: GameState) -> GameState:
+        master = GameMaster()
+        master.state = state
+        master.start_game(config)
+        return master.state
+    with _gm_lock:
+        if backend.shared:
+            gm.state = backend.update("gm", start, gm.state)
         else:
-            print(f"LLM Error: {resp.status_code} {resp.text}")
-            return None
-            
-    except Exception as e:
-        print(f"LLM Exception: {e}")
+            gm.state = start(gm.state.copy(deep=True))
+
+# マイクラ/Discord へ送るコマンドやイベントはすべて bus のトピックに積む (id 付き・上限あり)
+#   mc: マイクラ全体向け (ブロードキャスト), mc/player/<名前>: そのプレイヤー (AI ボットなど) 宛て,
+#   mc/dim/<ディメンション>: そのディメンションにいる側宛て, discord: Discord Bot 向け
+bus = backend.bus
+MC_TOPIC = "mc"
+DISCORD_TOPIC = "discord"
+# ロングポーリングで応答を保留する上限 (秒)
+LONG_POLL_MAX = float(os.getenv("LONG_POLL_MAX", "30"))
+COMMAND_TOPIC_RESCAN = float(os.getenv("COMMAND_TOPIC_RESCAN", "1"))
+
+def _player_topic(player: str) -> str:
+    return f"{MC_TOPIC}/player/{player}"
+
+def _dimension_topic(dimension: str) -> str:
+    return f"{MC_TOPIC}/dim/{dimension}"
+
+def publish_command(cmd: Dict[str, Any], player: Optional[str] = None, dimension: Optional[str] = None) -> int:
+    """マイクラ向けコマンドを積む。player / dimension を指定するとその宛先だけが受け取る (省略時は全体向け)"""
+    if player is not None:
+        return bus.publish(_player_topic(player), cmd)
+    if dimension is not None:
+        return bus.publish(_dimension_topic(dimension), cmd)
+    return bus.publish(MC_TOPIC, cmd)
+
+def _command_topics(player: Optional[str] = None, dimension: Optional[str] = None) -> List[str]:
+    """受け取り側のトピック: 全体向け + 自分宛て。宛先の指定がなければ (旧クライアント) すべて"""
+    if player is None and dimension is None:
+        return [MC_TOPIC] + bus.topics(MC_TOPIC + "/")
+    topics = [MC_TOPIC]
+    if player is not None:
+        topics.append(_player_topic(player))
+    if dimension is not None:
+        topics.append(_dimension_topic(dimension))
+    return topics
+
+# 複数ワーカー (WORKERS=N で python server.py を起動): ワーカー i は PORT + i で待ち受ける。
+# AI ボットはそれぞれ名前のハッシュ (bot_worker、main.js の botWorker と同じ計算) で決まる 1 つのワーカーが
+# 受け持ち、視界と動作 (tick / state / next_move) はそのワーカーに送る。ほかのワーカーに届いたら 421 で
+# 受け持ちのポートを返す。思考 (デバウンス・判断キャッシュ・LLM) はワーカー 0 だけが行い、ほかのワーカーは
+# 受けたチャットを THINK_TOPIC で回す。ワーカー 0 が決めた追跡相手は brain/<ボット名> トピックで受け持ちの
+# ワーカーに届き、次の tick で反映される。ボットの位置と追跡相手は BOT_SHARE_INTERVAL 秒ごとに "bots" キーで共有する
+PORT = int(os.getenv("PORT", "8082"))
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "1"))
+BOT_SHARE_INTERVAL = float(os.getenv("BOT_SHARE_INTERVAL", "0.5"))
+BOT_STALE = 10.0  # これより長く共有が更新されないボットはいなくなったとみなす
+THINK_TOPIC = "think"
+
+def bot_worker(name: str, workers: int) -> int:
+    """name を受け持つワーカー番号: コードポイント列の FNV-1a (32bit) を workers で割った余り"""
+    h = 0x811C9DC5
+    for ch in name:
+        h = ((h ^ ord(ch)) * 0x01000193) & 0xFFFFFFFF
+    return h % workers
+
+def _is_local(bot: str) -> bool:
+    return WORKER_COUNT <= 1 or bot_worker(bot, WORKER_COUNT) == WORKER_INDEX
+
+def _check_owner(bot: str):
+    """bot をほかのワーカーが受け持っていれば 421 (detail に受け持ちのワーカーとポート)"""
+    if not _is_local(bot):
+        owner = bot_worker(bot, WORKER_COUNT)
+        raise HTTPException(status_code=421, detail={"worker": owner, "port": PORT + owner})
+
+def _brain_topic(bot: str) -> str:
+    return f"brain/{bot}"
+
+_bot_shared_at: Dict[str, float] = {}
+
+def _share_bot(name: str, brain):
+    """Runs under the bot's lock: publish its position and target for the other workers (throttled)"""
+    if WORKER_COUNT <= 1:
+        return
+    now = time.time()
+    if now - _bot_shared_at.get(name, 0.0) < BOT_SHARE_INTERVAL:
+        return
+    _bot_shared_at[name] = now
+    view = {"origin": brain.snapshot["origin"] if brain.snapshot else None, "target": brain.target_player, "t": now}
+
+    def put(bots: Dict[str, Any]) -> Dict[str, Any]:
+        bots = {n: v for n, v in bots.items() if v["t"] >= now - BOT_STALE}
+        bots[name] = view
+        return bots
+    backend.update("bots", put, {})
+
+def _bot_views() -> Dict[str, Dict[str, Any]]:
+    """AI ボット名 -> {"origin": 視界の原点 (なければ None), "target": 追跡相手}。
+    複数ワーカーでは、ほかのワーカーが受け持つボットも共有された分 (少し古い) を含む"""
+    views: Dict[str, Dict[str, Any]] = {}
+    if WORKER_COUNT > 1:
+        cutoff = time.time() - BOT_STALE
+        views.update((name, v) for name, v in game_state.get("bots", {}).items() if v["t"] >= cutoff)
+    brains = parkour_brain.brains
+    for name in brains.names():
+        brain = brains.get(name, create=False)
+        views[name] = {"origin": brain.snapshot["origin"] if brain.snapshot else None, "target": brain.target_player}
+    return views
+
+async def _pending_target(bot: str) -> Optional[str]:
+    """ほかのワーカー (思考したワーカー 0 など) が bot に決めた最新の追跡相手"""
+    if WORKER_COUNT <= 1:
+        return None
+    updates = await _shared_io(bus.drain, _brain_topic(bot), "brain")
+    return updates[-1]["target"] if updates else None
+
+async def _relay_thinks():
+    """ワーカー 0: ほかのワーカーが受けたチャット (THINK_TOPIC) を自分のチャットと同じように思考に回す"""
+    while True:
+        try:
+            result = await bus.pull_wait([THINK_TOPIC], "think", LONG_POLL_MAX, auto_ack=True)
+        except Exception as e:
+            print(f"Think relay failed: {e}")
+            await asyncio.sleep(1)
+            continue
+        for req in result[THINK_TOPIC][0]:
+            _trigger_think(req["text"])
+
+# 受け取ったもの / 送ったものの追記型ジャーナル (JOURNAL_DIR 指定時のみ)。
+# 再起動時は最新セグメント (先頭がチェックポイント) を読み直して、チャット履歴・プレイヤー・
+# 役職設定・gm.state・未配信のコマンド/Discord イベントを元に戻す。
+# JOURNAL_FRAMES=1 なら tick の視界フレームも記録する (bench_replay.py で再生できる)
+JOURNAL_FRAMES = os.getenv("JOURNAL_FRAMES") == "1"
+
+def _checkpoint() -> Dict[str, Any]:
+    return {"players": game_state["players"], "chat": game_state["chat_history"].dump(),
+            "role_config": game_state.get("role_config"), "ai_mode": game_state.get("ai_mode"),
+            "gm": gm.state.dict(), "bus": bus.dump()}
+
+def _restore_checkpoint(state: Optional[Dict[str, Any]]):
+    if state is None:
+        return
+    game_state["players"] = state["players"]
+    game_state["chat_history"] = _load_chat_history(state["chat"])
+    for key in ("role_config", "ai_mode"):
+        if state[key] is not None:
+            game_state[key] = state[key]
+    gm.state = GameState(**state["gm"])
+    bus.load(state["bus"])
+
+def _restore_report(data: Dict[str, Any]):
+    game_state["players"] = data["players"]
+    for chat in data["chats"]:
+        _append_chat(chat)
+
+# レコードの種類ごとの復元処理 (event / frame は Bot の一時的な状態なので戻さない)
+RECOVERY_HANDLERS = {
+    CHECKPOINT: _restore_checkpoint,
+    "report": _restore_report,
+    "chat": _append_chat,
+    "config": lambda data: game_state.update(role_config=data["roles"]),
+    "ai_mode": lambda data: game_state.update(ai_mode=data["mode"]),
+    "gm": lambda data: setattr(gm, "state", GameState(**data)),
+    "publish": lambda data: bus.restore("publish", data),
+    "ack": lambda data: bus.restore("ack", data),
+}
+
+journal = Journal.from_env(checkpoint=_checkpoint)
+if journal and backend.shared:
+    # ワーカーごとに同じディレクトリへ書くと壊れる。共有バックエンドの SQLite 自体が永続化済み
+    print("[Journal] disabled: the shared state backend is already durable")
+    journal = None
+if journal:
+    recovered = replay(journal.recover(), RECOVERY_HANDLERS)
+    print(f"[Journal] recovered {recovered['records']} from {journal.directory}")
+    journal.open()
+    bus.journal = journal
+    atexit.register(journal.close)
+
+def _journal(kind: str, data: Any):
+    if journal:
+        journal.append(kind, data)
+
+# LLM Config (LM Studio / Ollama, OpenAI 互換):
+#   LLM_ENDPOINTS="http://a:1234/v1|model,http://b:11434/v1|llama3.1" で複数台に振り分け
+#   (未設定なら LLM_API_BASE / LLM_MODEL の 1 台), LLM_MAX_CONCURRENCY, LLM_TIMEOUT, LLM_HEDGE_AFTER
+llm = LLMRouter.from_env()  # closed by lifespan()
+
+# 1 にすると SSE (stream: true) で受け取り、chat の message が揃った時点で発言する
+LLM_STREAM = os.getenv("LLM_STREAM", "1") == "1"
+
+def _llm_messages(prompt: str) -> List[Dict[str, str]]:
+    # system prompt + user prompt
+    return [
+        {"role": "system", "content": "You are a helpful Minecraft AI assistant. Reply in JSON only."},
+        {"role": "user", "content": prompt}
+    ]
+
+async def call_llm(prompt: str, max_tokens: int = 300) -> Optional[str]:
+    """LM Studio (OpenAI Compatible) にリクエストを送る
+
+    非同期 + コネクションプールなので、推論中もイベントループ (ポーリング系) は止まらない
+    """
+    content = await llm.chat(_llm_messages(prompt), temperature=0.7, max_tokens=max_tokens)
+    if content is None:
         return None
+    # Clean up potential markdown code blocks
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
+    return content
+
+@app.get("/v1/debug/llm")
+def get_llm_stats():
+    """LLM エンドポイントごとの状態 (EWMA/p90 レイテンシ・同時実行数・失敗数) とヘッジ/フェイルオーバー回数"""
+    return llm.stats()
 
 
 @app.post("/v1/discord/report")
@@ -346,34 +765,28 @@ async def discord_report(data: DiscordReportData):
         "sender": f"Discord:{data.discord_user_id}",
         "message": data.text
     }
-    game_state["chat_history"].append(chat_entry)
+    await _shared_io(_record_chat, chat_entry)
     
-    # AIに思考させる
-    await think_and_queue()
+    # AIに思考させる (バックグラウンドで実行されるので待たない)
+    _trigger_think(data.text)
     
     return {"status": "ok"}
 
+def _record_chat(chat_entry: Dict[str, str]):
+    _append_chat(chat_entry)
+    _journal("chat", chat_entry)
+    _log_chat(chat_entry["sender"], chat_entry["message"])
+
 @app.post("/v1/report")
 async def report(data: ReportData):
     """マイクラからの状況報告を受け取る"""
-    global game_state, discord_queue
-    
-    # プレイヤー位置更新
-    game_state["players"] = [p.dict() for p in data.players]
+    global game_state
     
-    # チャット履歴更新 & 読み上げ
+    await _shared_io(_record_report, data)
+
+    # チャットを受け取ったら思考する (1 バッチ分はまとめて 1 回になる)
     for chat in data.chats:
-        print(f"Chat received: {chat.sender}: {chat.message}")
-        game_state["chat_history"].append(chat.dict())
-        
-        # Discordで読み上げ (TTS)
-        discord_queue.append({
-            "type": "speak",
-            "text": f"{chat.sender}「{chat.message}」"
-        })
-        
-        # チャットを受け取ったら思考する
-        await think_and_queue()
+        _trigger_think(chat.message)
 
     # Process events through GameMaster (Mocking event extraction from report)
     # The actual implementation needs GameMaster integration here similar to previous plan
@@ -382,8 +795,6 @@ async def report(data: ReportData):
     # Since I don't have the full GM integration in this file yet (it was overwritten or missed in previous steps),
     # I will re-add the GM integration properly.
     
-    from game_master import gm
-    
     # Mock extracting events from data (needs client side support to send 'events' list)
     # For now, let's assume ReportData has an 'events' field in future, or we parse chat/actions.
     # To demonstrate the logic:
@@ -394,36 +805,64 @@ async def report(data: ReportData):
     # events = data.events (NEED TO ADD TO MODEL)
     # for cmd in gm.process_event(event):
     #    if cmd.get("type") == "discord_event":
-    #        discord_queue.append(cmd["event"])
+    #        bus.publish(DISCORD_TOPIC, cmd["event"])
     #    else:
     #        minecraft_commands.append(cmd)
             
     return {"status": "ok", "commands": minecraft_commands}
 
+def _record_report(data: ReportData):
+    # プレイヤー位置更新
+    game_state["players"] = [p.dict() for p in data.players]
+    _journal("report", {"players": game_state["players"], "chats": [c.dict() for c in data.chats]})
+
+    # チャット履歴更新 & 読み上げ
+    for chat in data.chats:
+        print(f"Chat received: {chat.sender}: {chat.message}")
+        _append_chat(chat.dict())
+        _log_chat(chat.sender, chat.message)
+
+        # Discordで読み上げ (TTS)
+        bus.publish(DISCORD_TOPIC, {
+            "type": "speak",
+            "text": f"{chat.sender}「{chat.message}」"
+        })
+
+class PullRequest(BaseModel):
+    consumer: str = "discord"
+    ack: Optional[int] = None  # これまでに処理し終えたイベントの id
+    wait: float = 0.0  # > 0 ならロングポーリング: イベントが来るまで最大 wait 秒待つ
+
 @app.post("/v1/discord/pull")
-async def discord_pull():
-    """Discord Botからのポーリングに対し、溜まっている発言キューを返す"""
-    global discord_queue
-    
-    if not discord_queue:
-        return {"events": []}
-    
-    events_to_send = discord_queue.copy()
-    discord_queue = []
-    
-    return {"events": events_to_send}
+async def discord_pull(req: Optional[PullRequest] = None):
+    """Discord Botからのポーリングに対し、溜まっているイベント (発言・ミュート解除要求など) を返す
 
-    return {"events": events_to_send}
+    consumer/ack を送るとカーソル方式: ack までを処理済みにして、その続きを返す。
+    ack されるまで同じイベントが返るので、Bot が落ちても再起動後に受け取り直せる。
+    ボディなし (旧クライアント) は返した時点で処理済みにする。
+    wait を付けると、何もなければイベントが積まれた瞬間 (または wait 秒後) まで応答を保留する。
+    """
+    if req is None:
+        events, cursor = await _shared_io(lambda: bus.pull(DISCORD_TOPIC, "discord", auto_ack=True))
+    elif req.wait > 0:
+        ack = {DISCORD_TOPIC: req.ack} if req.ack is not None else None
+        result = await bus.pull_wait([DISCORD_TOPIC], req.consumer, min(req.wait, LONG_POLL_MAX), ack=ack)
+        events, cursor = result[DISCORD_TOPIC]
+    else:
+        events, cursor = await _shared_io(lambda: bus.pull(DISCORD_TOPIC, req.consumer, ack=req.ack))
+    return {"events": events, "cursor": cursor}
 
 class CommandRequest(BaseModel):
     type: str
     player: str
     target: Optional[str] = None
+    to_player: Optional[str] = None  # 宛先 (省略時は全体向け)
+    to_dimension: Optional[str] = None
 
 @app.post("/v1/mc/command_request")
-async def command_request(cmd: CommandRequest):
+def command_request(cmd: CommandRequest):
     """Discord Botからのコマンドキュー追加リクエスト"""
-    # Simply push to command_queue for Minecraft to pick up
+    # Simply push to the command topic for Minecraft to pick up
     target_action = {
         "action": cmd.type,
         "player": cmd.player,
@@ -431,39 +870,66 @@ async def command_request(cmd: CommandRequest):
     }
     # type="camera_control", target="next" or "stop"
     
-    command_queue.append(target_action)
+    publish_command(target_action, player=cmd.to_player, dimension=cmd.to_dimension)
     return {"status": "queued"}
 
+@app.get("/v1/debug/bus")
+def get_bus_stats():
+    """イベントバスのトピックごとの最新 id・保持数・あふれて捨てた数・待機中のロングポーリング数・各コンシューマのカーソル、ジャーナルの書き込み量、状態バックエンド"""
+    return dict(topics=bus.stats(), long_polls={"waits": bus.waits, "wakeups": bus.wakeups},
+                journal=journal.stats() if journal else None, state=backend.stats())
+
 @app.get("/v1/mc/commands")
-def poll_commands():
-    """Minecraft側が溜まっているコマンドを取りに来る"""
-    global command_queue
-    if not command_queue:
-        return {"commands": []}
-    
-    cmds = command_queue.copy()
-    command_queue = [] # Clear
-    return {"commands": cmds}
+async def poll_commands(wait: float = 0.0, player: Optional[str] = None, dimension: Optional[str] = None,
+                        consumer: str = "minecraft"):
+    """Minecraft側が溜まっているコマンドを取りに来る
+
+    player / dimension を付けると、全体向け + その宛先のコマンドだけを返す (ほかの宛先は見ない)。
+    consumer ごとに受け取り位置が別なので、別のコントローラー (カメラ等) は別の consumer 名で取れば
+    全体向けのコマンドを取り合わない。
+    wait > 0 ならロングポーリング: コマンドがなければ、積まれた瞬間 (または wait 秒後) まで応答を保留する
+    """
+    if wait <= 0:
+        return {"commands": await _shared_io(_drain_commands, player, dimension, consumer)}
+    # 宛先を省略したポーリングは全トピックを見る。宛先トピック (人間のプレイヤー・ディメンション) は
+    # 待っている間にも増えるので、COMMAND_TOPIC_RESCAN 秒ごとに見直す
+    rescan = COMMAND_TOPIC_RESCAN if player is None and dimension is None else LONG_POLL_MAX
+    end = time.monotonic() + min(wait, LONG_POLL_MAX)
+    while True:
+        topics = await _shared_io(_command_topics, player, dimension)
+        remaining = end - time.monotonic()
+        result = await bus.pull_wait(topics, consumer, max(0.0, min(remaining, rescan)), auto_ack=True)
+        commands = [cmd for name in topics for cmd in result[name][0]]
+        if commands or remaining <= rescan:
+            return {"commands": commands}
+
+def _drain_commands(player: Optional[str] = None, dimension: Optional[str] = None,
+                    consumer: str = "minecraft") -> List[Dict[str, Any]]:
+    """全体向けのコマンド + player / dimension 宛てのコマンド (どちらも省略時はすべて)"""
+    cmds: List[Dict[str, Any]] = []
+    for topic in _command_topics(player, dimension):
+        cmds += bus.drain(topic, consumer)
+    return cmds
 
 class GameConfig(BaseModel):
     roles: Dict[str, int]
 
 @app.post("/v1/game/start")
-async def start_game():
+def start_game():
     """Discord等からゲーム開始をトリガーする"""
-    from game_master import gm
     # Current config (can be stored in game_state)
     # For now, default or last config
     config = game_state.get("role_config", {"werewolf": 1})
-    gm.start_game(config)
+    _start_game(config)
+    _journal("gm", gm.state.dict())  # 役職はランダムなので結果を記録する
     
     # Send start message to Discord
-    discord_queue.append({
+    bus.publish(DISCORD_TOPIC, {
         "type": "message",
         "channel_id": "DEFAULT",
         "content": "**ゲームを開始しました！** 🎮"
     })
-    discord_queue.append({
+    bus.publish(DISCORD_TOPIC, {
         "type": "speak",
         "text": "ゲームを開始します。各プレイヤーに役職を配布しました。"
     })
@@ -471,9 +937,10 @@ async def start_game():
     return {"status": "started", "config": config}
 
 @app.post("/v1/game/config")
-async def config_game(config: GameConfig):
+def config_game(config: GameConfig):
     """役職構成を設定する"""
     game_state["role_config"] = config.roles
+    _journal("config", {"roles": config.roles})
     print(f"Game Config Updated: {config.roles}")
     return {"status": "updated", "config": config.roles}
 
@@ -481,25 +948,48 @@ class AiModeConfig(BaseModel):
     mode: str # 'player' or 'gm'
 
 @app.post("/v1/game/ai_mode")
-async def set_ai_mode(config: AiModeConfig):
+def set_ai_mode(config: AiModeConfig):
     game_state["ai_mode"] = config.mode
+    _journal("ai_mode", {"mode": config.mode})
     print(f"AI Mode switched to: {config.mode}")
     return {"status": "updated", "mode": config.mode}
 
-async def think_and_queue():
-    """AIに思考させ、結果をコマンドキュー(マイクラ&Discord)に追加する"""
-    print("AI Thinking...")
-    
-    mode = game_state.get("ai_mode", "player") # 'player' or 'gm'
+async def think(mode: str) -> Optional[Dict[str, Any]]:
+    """AIに思考させ、行動(JSON)を返す。プロンプトは実行時点の最新の状況から作る"""
+    # 明らかな場面 (反撃・雑音チャット・周りに誰もいない) はルールで即決する
+    sit = _situation(mode)
+    path, action = fast_path.decide(sit)
+    if path == RETALIATE:
+        await _shared_io(_answer_hit, sit.attackers[0][0])
+    if path is not None:
+        print(f"AI Decided ({path}): {action}")
+        return action
 
-    base_info = f"""
-    現在の状況:
-    - プレイヤー一覧: {json.dumps(game_state['players'])}
-    - 直近のチャット: {json.dumps(game_state['chat_history'][-5:])}
-    """
+    # AI ボットが複数いれば全員分をまとめて考える (think_agents)
+    bots = _batch_bots(mode)
+
+    # ほぼ同じ状況 (位置のブレ程度) で考えた結果があれば LLM を呼ばずに使い回す
+    key = fingerprint(":".join([mode] + bots), game_state["players"], game_state["chat_history"])
+    cached = decision_cache.get(key)
+    if cached is not None:
+        fast_path.record(CACHE)
+        print(f"AI Decided (cache): {cached}")
+        if bots:
+            for bot, action in cached.items():
+                await _shared_io(_apply_agent, bot, action)
+            return None
+        return cached
+
+    fast_path.record(LLM)
+    if bots:
+        return await think_agents(bots, key)
+    print(f"AI Thinking... ({mode})")
+
+    # 状況欄はトークン予算内で prompt_builder が埋める
+    base_info = SLOT
 
     if mode == "gm":
-        prompt = f"""
+        prompt = textwrap.dedent(f"""
         あなたはMinecraft人狼ゲームの「ゲームマスター(GM)」兼「実況者」です。
         {base_info}
         
@@ -514,10 +1004,10 @@ async def think_and_queue():
             "message": "実況コメント",
             "reason": "コメントの理由"
         }}
-        """
+        """)
     else:
         # Player Mode (Default)
-        prompt = f"""
+        prompt = textwrap.dedent(f"""
         あなたはMinecraftの人狼ゲームのプレイヤー(AIボット)です。
         {base_info}
         
@@ -535,29 +1025,280 @@ async def think_and_queue():
             "message": "チャット内容 (chatの場合)",
             "reason": "行動の理由"
         }}
-        """
+        """)
         
     prompt += "\n必ずJSONのみを出力してください。"
+    prompt = prompt_builder.fill(prompt, game_state["players"], game_state["chat_history"])
     
-    llm_response = call_llm(prompt)
+    if LLM_STREAM:
+        action, spoken = await _think_streaming(prompt)
+    else:
+        action, spoken = await _think_blocking(prompt), False
+    if action is not None:
+        decision_cache.put(key, action)
+    return None if spoken else action
+
+# 複数の AI ボットの行動の決め方: multi = 全員分を 1 リクエストで、concurrent = 1 体 1 リクエストを並列に
+# (同時実行数は LLM_MAX_CONCURRENCY を共有)、off = 従来どおり AI 1 人分
+THINK_BATCH = os.getenv("THINK_BATCH", "multi")
+agent_stats = {"batches": 0, "llm_calls": 0, "agents_decided": 0, "agents_missing": 0}
+
+def _batch_bots(mode: str) -> List[str]:
+    if mode != "player" or THINK_BATCH == "off":
+        return []
+    bots = sorted(_bot_views())
+    return bots if len(bots) > 1 else []
+
+def _agent_prompt(bots: List[str]) -> str:
+    """bots 全員の行動を {"ボット名": 行動, ...} で答えさせるプロンプト (状況欄は SLOT)"""
+    lines = []
+    views = _bot_views()
+    for bot in bots:
+        view = views.get(bot, {})
+        line = f"- {bot}"
+        if view.get("origin"):
+            o = view["origin"]
+            line += f" ({round(o['x'])},{round(o['y'])},{round(o['z'])})"
+        if view.get("target"):
+            line += f" 追跡中: {view['target']}"
+        lines.append(line)
+    agents = "\n".join(lines)
+    example = ",\n".join(
+        f'    "{bot}": {{"action": "move" | "attack" | "chat" | "idle", "target": "プレイヤー名", '
+        f'"message": "チャット内容", "reason": "理由"}}' for bot in bots)
+    return textwrap.dedent(f"""
+    あなたはMinecraftの人狼ゲームで、AIボットのプレイヤー {len(bots)} 体を操作しています。
+    {SLOT}
+
+    操作する AI ボット:
+    {{agents}}
+
+    タグの見方:
+    - pub: 公開情報 (全員が見える状態)
+    - sec: 秘匿情報 (役職など、あなただけが知っている情報)
+
+    どのボットも「村人」として振る舞ってください。
+    怪しいプレイヤーがいれば攻撃し、チャットで会話してください。ボット同士で同じ発言をしないでください。
+
+    ボットごとに行動を決め、ボット名をキーにした 1 つの JSON で答えてください:
+    {{{{
+    {{example}}
+    }}}}
+    必ずJSONのみを出力してください。
+    """).format(agents=agents, example=example)
+
+def _apply_agent(bot: str, action: Dict[str, Any]):
+    """まとめて考えた行動を各ボットに振り分ける: move/attack は追跡相手に、chat はそのボットのキューに
+
+    追跡相手は経路計画だけに使う。反撃の判断 (_situation) は被弾の記録 ("hits") から作るので、
+    ここで決めた追跡で fast_path が反撃し続けることはない。ほかのワーカーが受け持つボットの追跡相手は
+    brain/<ボット名> トピック経由で、そのボットの次の tick で反映される。
+    """
+    if not isinstance(action, dict) or action.get("action") in (None, "idle"):
+        return
+    target = action.get("target")
+    if action.get("action") in ("move", "attack") and target:
+        if _is_local(bot):
+            parkour_brain.brains.submit(bot, parkour_brain.ParkourBrain.set_target_player, target)
+        else:
+            bus.publish(_brain_topic(bot), {"target": target})
+    queue_action(dict(action, player=bot), bot=bot)
+
+async def _reply_pieces(prompt: str, max_tokens: int):
+    """LLM の返答を、ストリーミングなら届いた順に、そうでなければ一度に返す"""
+    if LLM_STREAM:
+        async with aclosing(llm.stream_chat(_llm_messages(prompt), temperature=0.7, max_tokens=max_tokens)) as deltas:
+            async for delta in deltas:
+                yield delta
+    else:
+        reply = await call_llm(prompt, max_tokens=max_tokens)
+        if reply:
+            yield reply
+
+async def _decide_agents(bots: List[str], decided: Dict[str, Any]):
+    """bots の行動を 1 リクエストで決め、届いたボットから順に振り分ける"""
+    prompt = prompt_builder.fill(_agent_prompt(bots), game_state["players"], game_state["chat_history"])
+    fields = JsonFieldStream()
+    agent_stats["llm_calls"] += 1
+    async for piece in _reply_pieces(prompt, max_tokens=150 + 120 * len(bots)):
+        for bot, action in fields.feed(piece).items():
+            if bot in bots and isinstance(action, dict):
+                decided[bot] = action
+                await _shared_io(_apply_agent, bot, action)
+
+async def think_agents(bots: List[str], key: str) -> None:
+    """
+    AI ボット全員の行動を決める。multi なら共通の状況を 1 回だけ書いた 1 リクエストで、
+    concurrent なら 1 体ずつのリクエストを並列に送る。行動は各ボットに振り分け済みなので None を返す
+    """
+    print(f"AI Thinking... (player x{len(bots)}, {THINK_BATCH})")
+    decided: Dict[str, Any] = {}
+    if THINK_BATCH == "concurrent":
+        await asyncio.gather(*(_decide_agents([bot], decided) for bot in bots))
+    else:
+        await _decide_agents(bots, decided)
+    agent_stats["batches"] += 1
+    agent_stats["agents_decided"] += len(decided)
+    agent_stats["agents_missing"] += len(bots) - len(decided)
+    print(f"AI Decided (agents): {decided}")
+    if len(decided) == len(bots):
+        decision_cache.put(key, decided)
+    return None
+
+async def _think_blocking(prompt: str) -> Optional[Dict[str, Any]]:
+    llm_response = await call_llm(prompt)
     if llm_response:
         try:
             action = json.loads(llm_response)
             print(f"AI Decided: {action}")
-            
-            # マイクラ用キューに追加
-            command_queue.append(action)
-            
-            # 発言(chat)ならDiscord用キューにも追加して同期させる
-            if action.get("action") == "chat" and action.get("message"):
-                discord_queue.append({
-                    "type": "speak",
-                    "text": action["message"]
-                })
-                
+            return action
         except:
             print("JSON Parse Error")
+    return None
+
+async def _think_streaming(prompt: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """ストリーミングで思考する -> (行動, 発言済みか)。chat なら reason の生成を待たずにその場で発言する"""
+    fields = JsonFieldStream()
+    async with aclosing(llm.stream_chat(_llm_messages(prompt), temperature=0.7, max_tokens=300)) as deltas:
+        async for delta in deltas:
+            fields.feed(delta)
+            action = fields.fields
+            if action.get("action") == "chat" and isinstance(action.get("message"), str) and action["message"]:
+                # Speak now; closing the stream also stops the rest of the generation
+                print(f"AI Decided (streaming): {action}")
+                chat = {"action": "chat", "message": action["message"]}
+                await _shared_io(queue_action, chat)
+                return chat, True
+    if not fields.done:
+        print("JSON Parse Error")
+        return None, False
+    print(f"AI Decided: {fields.fields}")
+    return fields.fields, False
+
+# ルールで決める近さの基準 (Bot から FAST_PATH_NEAR ブロック以内に人がいなければ idle)
+fast_path = FastPath(near_radius=float(os.getenv("FAST_PATH_NEAR", "24")))
+
+def _situation(mode: str) -> Situation:
+    """fast_path の判断材料: 最新のチャット、最近殴られた Bot、Bot の近くにいる人数"""
+    history = game_state["chat_history"]
+    recent = history.recent(1)
+    last_chat = recent[0] if recent else None
+    bots = _bot_views()
+    index = _player_index()
+    attackers, nearby, positioned = [], set(), False
+    # 追跡対象 (brain.target_player) ではなく、最近殴られた記録から反撃を決める
+    for name, attacker in _fresh_hits():
+        i = index.find(attacker)
+        if i is not None and _is_candidate(index.players[i], name):
+            attackers.append((name, attacker))
+    for name, view in bots.items():
+        if view["origin"]:
+            positioned = True
+            for j in index.within(view["origin"], fast_path.near_radius)[0].tolist():
+                p = index.players[j]
+                if p["name"] not in bots and _is_candidate(p, name):
+                    nearby.add(p["name"])
+    return Situation(mode=mode, last_chat=last_chat,
+                     mentioned=last_chat is not None and _is_mention(last_chat["message"]),
+                     attackers=attackers, nearby_players=len(nearby) if positioned else None)
+
+# 判断キャッシュ: 最大 DECISION_CACHE_SIZE 件、DECISION_CACHE_TTL 秒で失効
+decision_cache = DecisionCache(max_entries=int(os.getenv("DECISION_CACHE_SIZE", "256")),
+                               ttl=float(os.getenv("DECISION_CACHE_TTL", "30")))
+
+# プロンプト全体を PROMPT_TOKEN_BUDGET トークン (推定) 以内に収める
+prompt_builder = PromptBuilder(budget_tokens=int(os.getenv("PROMPT_TOKEN_BUDGET", "1200")))
+
+def queue_action(action: Dict[str, Any], bot: Optional[str] = None):
+    """思考結果をコマンドキュー(マイクラ&Discord)に追加する。bot を指定するとそのボット宛て"""
+    # マイクラ用キューに追加
+    publish_command(action, player=bot)
+    
+    # 発言(chat)ならDiscord用キューにも追加して同期させる
+    if action.get("action") == "chat" and action.get("message"):
+        addressee.spoke()  # 直後のチャットは AI への返事の可能性が高い
+        bus.publish(DISCORD_TOPIC, {
+            "type": "speak",
+            "text": action["message"] if bot is None else f"{bot}「{action['message']}」"
+        })
+
+# 連続したチャットは THINK_DEBOUNCE 秒待って 1 回の思考にまとめる (モードごとに同時 THINK_MAX_IN_FLIGHT 件まで)
+# 思考は THINK_WORKERS 個のバックグラウンドワーカーが優先度順 (呼びかけ > 雑談) に実行する
+think_scheduler = ThinkScheduler(
+    think, lambda action: _shared_io(queue_action, action),
+    debounce=float(os.getenv("THINK_DEBOUNCE", "0.5")),
+    max_wait=float(os.getenv("THINK_MAX_WAIT", "2.0")),
+    max_in_flight=int(os.getenv("THINK_MAX_IN_FLIGHT", "1")),
+    workers=int(os.getenv("THINK_WORKERS", "1")))
+
+# Bot 名のほかに、呼びかけとみなす名前 (カンマ区切り)
+AI_NAMES = [n.strip() for n in os.getenv("AI_NAMES", "AI,ボット").split(",") if n.strip()]
+
+def _is_mention(text: str) -> bool:
+    """Bot (または AI_NAMES) に直接話しかけているか"""
+    return mentions(text, AI_NAMES + list(_bot_views()))
+
+# AI 宛て/関係ありそうなチャット (スコア ADDRESSEE_THRESHOLD 以上) だけ思考する。0 なら全部
+addressee = AddresseeClassifier(threshold=float(os.getenv("ADDRESSEE_THRESHOLD", "0.4")))
+# 設定するとチャットを JSONL で記録する (bench_addressee.py で再生できる)
+CHAT_LOG = os.getenv("CHAT_LOG")
+# ファイルへの追記は専用スレッド 1 本で行う (イベントループを止めない、書く順番は受け取った順)
+_chat_log_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-log") if CHAT_LOG else None
+if _chat_log_writer is not None:
+    atexit.register(_chat_log_writer.shutdown)
+
+def _log_chat(sender: str, message: str):
+    if _chat_log_writer is not None:
+        line = json.dumps({"t": time.time(), "sender": sender, "message": message}, ensure_ascii=False) + "\n"
+        _chat_log_writer.submit(_append_chat_log, line)
+
+def _append_chat_log(line: str):
+    with open(CHAT_LOG, "a", encoding="utf-8") as f:
+        f.write(line)
+
+def _trigger_think(text: str):
+    """AI 宛てでなさそうなチャットは履歴に残すだけにする (次の思考で読まれる)"""
+    if WORKER_INDEX != 0:
+        # 思考するのはワーカー 0 だけ (デバウンス・判断キャッシュを 1 か所に): 宛先の判定ごと任せる
+        asyncio.get_running_loop().run_in_executor(None, bus.publish, THINK_TOPIC, {"text": text})
+        return
+    names = AI_NAMES + list(_bot_views())
+    if not addressee.should_think(text, names):
+        return
+    priority = MENTION if mentions(text, names) else AMBIENT
+    think_scheduler.trigger(game_state.get("ai_mode", "player"), priority) # 'player' or 'gm'
+
+@app.get("/v1/debug/think")
+def get_think_stats():
+    """思考スケジューラのカウンタ (まとめられたトリガー数など)、プロンプトのトークン数、判断キャッシュのヒット率、
+    ルール/キャッシュ/LLM それぞれで決めた割合、宛先判定で思考を省いたチャット数"""
+    return dict(think_scheduler.stats(), prompt=prompt_builder.stats(), cache=decision_cache.stats(),
+                paths=fast_path.stats(), addressee=addressee.stats(), agents=dict(agent_stats, mode=THINK_BATCH),
+                chat_history={"turns": len(game_state["chat_history"]),
+                              "summarized": game_state["chat_history"].summarized})
 
 if __name__ == "__main__":
-    print(f"Starting FastAPI Server on port 8082 (Model: {MODEL_NAME})...")
-    uvicorn.run(app, host="0.0.0.0", port=8082)
+    models = ", ".join(f"{ep.client.model}@{ep.client.api_base}" for ep in llm.endpoints)
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1 and not backend.shared:
+        raise SystemExit("WORKERS > 1 needs a shared state backend (STATE_BACKEND=sqlite)")
+    print(f"Starting FastAPI Server on port {PORT} with {workers} worker(s) (LLM: {models})...")
+    if workers > 1:
+        # ワーカーごとに別ポート (PORT + i) のプロセス。各プロセスが server を読み込み直す
+        procs = [subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--host", "0.0.0.0",
+                                   "--port", str(PORT + i)],
+                                  env=dict(os.environ, WORKER_INDEX=str(i), WORKER_COUNT=str(workers)))
+                 for i in range(workers)]
+        signal.signal(signal.SIGTERM, signal.default_int_handler)  # kill でもワーカーを残さない
+        try:
+            for proc in procs:
+                proc.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for proc in procs:
+                proc.terminate()
+            for proc in procs:
+                proc.wait()
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=PORT)
@@ -0,0 +1,375 @@
+"""
+Where the server keeps the state its handlers share, so that several uvicorn
+workers can serve one game.
+
+  memory  (default) plain Python objects in this process; the bus is an
+          event_bus.EventBus. Fastest, but pins the server to one worker.
+  sqlite  one SQLite database in WAL mode (STATE_DB, default state.db)
+          shared by every worker process on the host. Readers never block
+          the writer, and writes are small, short transactions.
+
+Both backends have the same small API:
+
+  get(key, default) / set(key, value) / delete(key) / keys()
+  update(key, fn, default)   atomic read-modify-write: value = fn(value)
+  bus                        publish / pull / pull_wait / drain / topics /
+                             pending / stats, as event_bus.EventBus
+
+Values must be JSON-able, unless a codec is registered for the key with
+codec(key, encode, decode), e.g. a ChatHistory stored as its dump(). The
+memory backend ignores codecs and keeps the objects themselves.
+
+For SQLite, get() caches the decoded value per key together with its
+version, and decodes again only after a write bumped the version. Repeated
+reads therefore cost one indexed lookup and return the same object, which
+_player_index() relies on. Treat values as read-only and write them back
+with set() or update(). The bus polls every `poll_interval` seconds in
+pull_wait(), because a publish in another process cannot wake this one.
+Each poll runs on a worker thread and only reads, unless it moves the
+consumer's cursor; a parked poll therefore takes no write lock.
+
+ParkourBrain state is not shared. Each bot belongs to one worker, picked by
+a hash of its name (server.bot_worker), and its ticks go to that worker's
+port; a request that reaches another worker gets 421 with the right port.
+Only worker 0 thinks, so chat debounce and the decision cache live in one
+place. The other workers pass it their chats over the bus, and it sends
+targets back to each bot's worker the same way. Hits and bot positions are
+stored as keys, so every worker sees them.
+
+Select with STATE_BACKEND=memory|sqlite.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from event_bus import EventBus
+
+_MISSING = object()
+
+
+class InProcessBackend:
+    shared = False
+
+    def __init__(self, max_events: int = 1024):
+        self._values: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self.bus = EventBus(max_events)
+
+    def codec(self, key: str, encode: Callable[[Any], Any], decode: Callable[[Any], Any]):
+        pass  # objects are kept as they are
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._values.get(key, default)
+
+    def set(self, key: str, value: Any):
+        self._values[key] = value
+
+    def delete(self, key: str):
+        self._values.pop(key, None)
+
+    def keys(self) -> List[str]:
+        return list(self._values)
+
+    def update(self, key: str, fn: Callable[[Any], Any], default: Any = None) -> Any:
+        with self._lock:
+            value = self._values[key] = fn(self._values.get(key, default))
+            return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "keys": len(self._values)}
+
+
+class SqliteBackend:
+    shared = True
+
+    def __init__(self, path: str, max_events: int = 1024, poll_interval: float = 0.05):
+        self.path = path
+        self._local = threading.local()
+        self._codecs: Dict[str, Tuple[Callable, Callable]] = {}
+        self._cache: Dict[str, Tuple[int, Any]] = {}  # key -> (version, decoded value)
+        self._cache_lock = threading.Lock()  # get() runs on the event loop and on brain / threadpool threads
+        self.reads = 0
+        self.decodes = 0
+        self.writes = 0
+        with self._txn() as c:
+            c.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL)")
+            c.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            c.execute("INSERT OR IGNORE INTO meta VALUES ('version', 0)")
+            c.execute("CREATE TABLE IF NOT EXISTS topics (topic TEXT PRIMARY KEY, last_id INTEGER NOT NULL, "
+                      "published INTEGER NOT NULL, dropped INTEGER NOT NULL)")
+            c.execute("CREATE TABLE IF NOT EXISTS events (topic TEXT NOT NULL, id INTEGER NOT NULL, "
+                      "event TEXT NOT NULL, PRIMARY KEY (topic, id))")
+            c.execute("CREATE TABLE IF NOT EXISTS cursors (topic TEXT NOT NULL, consumer TEXT NOT NULL, "
+                      "cursor INTEGER NOT NULL, PRIMARY KEY (topic, consumer))")
+        self.bus = SqliteEventBus(self, max_events=max_events, poll_interval=poll_interval)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; a power cut may lose the last commits
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _txn(self) -> Iterator[sqlite3.Connection]:
+        """A write transaction; BEGIN IMMEDIATE takes the write lock up front, so read-modify-write is atomic"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def codec(self, key: str, encode: Callable[[Any], Any], decode: Callable[[Any], Any]):
+        self._codecs[key] = (encode, decode)
+
+    def _decode(self, key: str, version: int, text: str) -> Any:
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        value = self._fresh(key, text)  # outside the lock; a racing thread may decode the same version too
+        with self._cache_lock:
+            self.decodes += 1
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] >= version:
+                return cached[1]  # keep one object per version, and never go back to an older one
+            self._cache[key] = (version, value)
+        return value
+
+    def _encode(self, key: str, value: Any) -> str:
+        if key in self._codecs:
+            value = self._codecs[key][0](value)
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        self.reads += 1
+        row = self._conn().execute("SELECT version, value FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        return self._decode(key, row[0], row[1])
+
+    def _put(self, c: sqlite3.Connection, key: str, value: Any):
+        # Versions come from one counter over all keys, so a deleted and re-set key never reuses one
+        c.execute("UPDATE meta SET value = value + 1 WHERE name = 'version'")
+        c.execute("INSERT INTO kv (key, value, version) VALUES (?, ?, (SELECT value FROM meta WHERE name = 'version')) "
+                  "ON CONFLICT (key) DO UPDATE SET value = excluded.value, version = excluded.version",
+                  (key, self._encode(key, value)))
+        self.writes += 1
+
+    def set(self, key: str, value: Any):
+        with self._txn() as c:
+            self._put(c, key, value)
+
+    def delete(self, key: str):
+        with self._txn() as c:
+            c.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def keys(self) -> List[str]:
+        return [row[0] for row in self._conn().execute("SELECT key FROM kv")]
+
+    def update(self, key: str, fn: Callable[[Any], Any], default: Any = None) -> Any:
+        with self._txn() as c:
+            row = c.execute("SELECT version, value FROM kv WHERE key = ?", (key,)).fetchone()
+            # Decode a fresh copy: fn may mutate it, and the cached object must keep the old version's value
+            value = default if row is None else self._fresh(key, row[1])
+            value = fn(value)
+            self._put(c, key, value)
+            return value
+
+    def _fresh(self, key: str, text: str) -> Any:
+        value = json.loads(text)
+        return self._codecs[key][1](value) if key in self._codecs else value
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "sqlite", "path": self.path, "keys": len(self.keys()), "reads": self.reads,
+                "decodes": self.decodes, "writes": self.writes}
+
+
+class SqliteEventBus:
+    """event_bus.EventBus over the topics / events / cursors tables, shared by every worker"""
+
+    def __init__(self, db: SqliteBackend, max_events: int = 1024, poll_interval: float = 0.05):
+        self.db = db
+        self.max_events = max_events
+        self.poll_interval = poll_interval
+        self.journal = None  # the journal is per process; a shared backend is already durable
+        self.waits = 0
+        self.wakeups = 0
+        self._waiting: Dict[str, int] = {}
+
+    @staticmethod
+    def _topic(c: sqlite3.Connection, topic: str) -> int:
+        row = c.execute("SELECT last_id FROM topics WHERE topic = ?", (topic,)).fetchone()
+        if row is None:
+            c.execute("INSERT INTO topics VALUES (?, 0, 0, 0)", (topic,))
+            return 0
+        return row[0]
+
+    def publish(self, topic: str, event: Dict[str, Any]) -> int:
+        with self.db._txn() as c:
+            seq = self._topic(c, topic) + 1
+            c.execute("UPDATE topics SET last_id = ?, published = published + 1 WHERE topic = ?", (seq, topic))
+            c.execute("INSERT INTO events VALUES (?, ?, ?)",
+                      (topic, seq, json.dumps(event, ensure_ascii=False, separators=(",", ":"))))
+            if seq > self.max_events:
+                gone = c.execute("DELETE FROM events WHERE topic = ? AND id <= ?", (topic, seq - self.max_events)).rowcount
+                if gone:
+                    c.execute("UPDATE topics SET dropped = dropped + ? WHERE topic = ?", (gone, topic))
+            return seq
+
+    def pull(self, topic: str, consumer: str, ack: Optional[int] = None, limit: int = 100,
+             auto_ack: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        # Read first: a poll that finds nothing new, or does not move the cursor, takes no write lock
+        conn = self.db._conn()
+        conn.execute("BEGIN")
+        try:
+            events, last, cursor, stored, known = self._read(conn, topic, consumer, ack, limit, auto_ack)
+        finally:
+            conn.execute("COMMIT")
+        if known and stored == cursor:
+            return events, last
+        with self.db._txn() as c:
+            self._topic(c, topic)
+            events, last, cursor, stored, _ = self._read(c, topic, consumer, ack, limit, auto_ack)
+            if stored != cursor:
+                c.execute("INSERT INTO cursors VALUES (?, ?, ?) ON CONFLICT (topic, consumer) DO UPDATE SET cursor = excluded.cursor",
+                          (topic, consumer, cursor))
+            if stored is not None and cursor > stored:
+                c.execute("DELETE FROM events WHERE topic = ? AND id <= (SELECT MIN(cursor) FROM cursors WHERE topic = ?)",
+                          (topic, topic))
+            return events, last
+
+    @staticmethod
+    def _read(c: sqlite3.Connection, topic: str, consumer: str, ack: Optional[int], limit: int, auto_ack: bool):
+        """(events, last delivered id, cursor to keep, stored cursor or None, whether the topic exists)"""
+        row = c.execute("SELECT last_id FROM topics WHERE topic = ?", (topic,)).fetchone()
+        known = row is not None
+        last_seq = row[0] if known else 0
+        row = c.execute("SELECT cursor FROM cursors WHERE topic = ? AND consumer = ?", (topic, consumer)).fetchone()
+        stored = row[0] if row is not None else None
+        if stored is not None:
+            cursor = stored
+        else:
+            first = c.execute("SELECT MIN(id) FROM events WHERE topic = ?", (topic,)).fetchone()[0]
+            cursor = (first if first is not None else last_seq + 1) - 1
+        if ack is not None:
+            cursor = max(cursor, min(ack, last_seq))
+        rows = c.execute("SELECT id, event FROM events WHERE topic = ? AND id > ? ORDER BY id LIMIT ?",
+                         (topic, cursor, limit)).fetchall()
+        events = [dict(json.loads(text), id=seq) for seq, text in rows]
+        if events:
+            last = events[-1]["id"]
+            if auto_ack:
+                cursor = last
+        else:
+            last = cursor
+        return events, last, cursor, stored, known
+
+    def _pull_all(self, topics: Sequence[str], consumer: str, ack: Dict[str, int], limit: int,
+                  auto_ack: bool) -> Dict[str, Tuple[List[Dict[str, Any]], int]]:
+        return {name: self.pull(name, consumer, ack=ack.get(name), limit=limit, auto_ack=auto_ack) for name in topics}
+
+    async def pull_wait(self, topics: Sequence[str], consumer: str, timeout: float,
+                        ack: Optional[Dict[str, int]] = None, limit: int = 100,
+                        auto_ack: bool = False) -> Dict[str, Tuple[List[Dict[str, Any]], int]]:
+        ack = ack or {}
+        end = time.monotonic() + timeout
+        parked = False
+        try:
+            while True:
+                # SQLite calls may wait on another worker's write lock; keep them off the event loop
+                result = await asyncio.to_thread(self._pull_all, topics, consumer, ack, limit, auto_ack)
+                remaining = end - time.monotonic()
+                if any(events for events, _ in result.values()):
+                    self.wakeups += parked
+                    return result
+                if remaining <= 0:
+                    return result
+                ack = {name: cursor for name, (_, cursor) in result.items()}
+                if not parked:
+                    parked = True
+                    self.waits += 1
+                    for name in topics:
+                        self._waiting[name] = self._waiting.get(name, 0) + 1
+                await asyncio.sleep(min(self.poll_interval, remaining))
+        finally:
+            if parked:
+                for name in topics:
+                    self._waiting[name] -= 1
+
+    def drain(self, topic: str, consumer: str) -> List[Dict[str, Any]]:
+        events: List[Dict[str, Any]] = []
+        while True:
+            batch, _ = self.pull(topic, consumer, auto_ack=True)
+            events += batch
+            if not batch:
+                return events
+
+    def topics(self, prefix: str = "") -> List[str]:
+        rows = self.db._conn().execute("SELECT topic FROM topics WHERE substr(topic, 1, ?) = ? ORDER BY rowid",
+                                       (len(prefix), prefix))
+        return [row[0] for row in rows]
+
+    def pending(self, topic: str) -> List[Dict[str, Any]]:
+        rows = self.db._conn().execute("SELECT event FROM events WHERE topic = ? ORDER BY id", (topic,))
+        return [json.loads(row[0]) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self.db._conn()
+        held = dict(conn.execute("SELECT topic, COUNT(*) FROM events GROUP BY topic"))
+        cursors: Dict[str, Dict[str, int]] = {}
+        for topic, consumer, cursor in conn.execute("SELECT topic, consumer, cursor FROM cursors"):
+            cursors.setdefault(topic, {})[consumer] = cursor
+        return {topic: {"last_id": last_id, "held": held.get(topic, 0), "published": published, "dropped": dropped,
+                        "waiting": self._waiting.get(topic, 0), "cursors": cursors.get(topic, {})}
+                for topic, last_id, published, dropped in conn.execute("SELECT * FROM topics ORDER BY rowid")}
+
+
+class SharedState(MutableMapping):
+    """dict view of a backend, so game_state["players"] = ... reads and writes the shared value"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.backend.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        self.backend.set(key, value)
+
+    def __delitem__(self, key: str):
+        if key not in self.backend.keys():
+            raise KeyError(key)
+        self.backend.delete(key)
+
+    def __iter__(self):
+        return iter(self.backend.keys())
+
+    def __len__(self) -> int:
+        return len(self.backend.keys())
+
+
+def from_env(max_events: int = 1024):
+    kind = os.getenv("STATE_BACKEND", "memory")
+    if kind == "memory":
+        return InProcessBackend(max_events)
+    if kind == "sqlite":
+        return SqliteBackend(os.getenv("STATE_DB", "state.db"), max_events=max_events,
+                             poll_interval=float(os.getenv("STATE_POLL_INTERVAL", "0.05")))
+    raise ValueError(f"unknown STATE_BACKEND {kind!r} (memory or sqlite)")
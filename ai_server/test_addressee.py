@@ -0,0 +1,38 @@
+import unittest
+
+from addressee import AddresseeClassifier, mentions, replay
+
+
+class TestAddresseeClassifier(unittest.TestCase):
+    def test_scores_questions_and_requests_above_table_talk(self):
+        c = AddresseeClassifier()
+        self.assertTrue(mentions("ねえAI、どう思う?", ["AI"]))
+        self.assertFalse(mentions("he said so", ["AI"]))
+        self.assertEqual(c.score("ai come here", ["AI"]), 1.0)
+        for text in ("誰が人狼だと思う?", "こっちに来て", "what do you think"):
+            self.assertGreaterEqual(c.score(text), c.threshold, text)
+        for text in ("トイレ行ってくる", "おなかすいた", "nice", "www"):
+            self.assertLess(c.score(text), c.threshold, text)
+
+    def test_lines_right_after_the_ai_spoke_count_as_replies(self):
+        c = AddresseeClassifier()
+        before = c.score("ダイヤあった")
+        c.spoke()
+        self.assertGreater(c.score("ダイヤあった"), before)
+        c.should_think("a")
+        c.should_think("b")
+        self.assertAlmostEqual(c.score("ダイヤあった"), before)
+
+    def test_replay_counts_saved_calls_and_misses(self):
+        log = [{"sender": "Steve", "message": "brb", "addressed": False},
+               {"sender": "Alex", "message": "AI 誰が怪しい?", "addressed": True},
+               {"sender": "AI", "message": "Steve が怪しいです"},
+               {"sender": "Alex", "message": "なんで?", "addressed": True},
+               {"sender": "Steve", "message": "ただいま", "addressed": False}]
+        result = replay(log, AddresseeClassifier(), ["AI"])
+        self.assertEqual((result["calls_before"], result["calls_after"], result["saved"]), (4, 2, 2))
+        self.assertEqual((result["missed_addressed"], result["false_alarms"]), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
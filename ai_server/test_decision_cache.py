@@ -0,0 +1,45 @@
+import time
+import unittest
+
+from decision_cache import DecisionCache, fingerprint
+from prompt_builder import ChatHistory
+
+
+def history(*messages):
+    h = ChatHistory()
+    for m in messages:
+        h.append({"sender": "Steve", "message": m})
+    return h
+
+
+def player(x, tags=()):
+    return {"name": "Alex", "location": {"x": x, "y": 64, "z": 0}, "tags": {"pub": list(tags)}}
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_jitter_and_formatting_do_not_change_the_key(self):
+        key = fingerprint("gm", [player(1.0)], history("Hello  there"))
+        self.assertEqual(fingerprint("gm", [player(2.9)], history("hello there ")), key)
+        self.assertNotEqual(fingerprint("player", [player(1.0)], history("hello there")), key)
+        self.assertNotEqual(fingerprint("gm", [player(4.0)], history("hello there")), key)
+        self.assertNotEqual(fingerprint("gm", [player(1.0, ["pub:dead"])], history("hello there")), key)
+        self.assertNotEqual(fingerprint("gm", [player(1.0)], history("hello there", "?")), key)
+
+
+class TestDecisionCache(unittest.TestCase):
+    def test_lru_ttl_and_counters(self):
+        cache = DecisionCache(max_entries=2, ttl=0.05)
+        cache.put("a", {"action": "idle"})
+        cache.put("b", {"action": "chat"})
+        cache.get("a")["action"] = "mutated"  # callers get copies
+        cache.put("c", {"action": "move"})  # evicts b, the least recently used
+        self.assertEqual(cache.get("a"), {"action": "idle"})
+        self.assertIsNone(cache.get("b"))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("c"))
+        self.assertEqual({k: cache.stats()[k] for k in ("hits", "misses", "expired", "evictions", "size")},
+                         {"hits": 2, "misses": 2, "expired": 1, "evictions": 1, "size": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from event_bus import EventBus
+
+
+class TestEventBus(unittest.TestCase):
+    def test_cursor_pull_redelivers_until_acked(self):
+        bus = EventBus()
+        for n in range(3):
+            bus.publish("discord", {"n": n})
+        events, cursor = bus.pull("discord", "bot", limit=2)
+        self.assertEqual(([e["n"] for e in events], cursor), ([0, 1], 2))
+        # The consumer crashed before acking: the same events come back
+        self.assertEqual([e["id"] for e in bus.pull("discord", "bot")[0]], [1, 2, 3])
+        events, cursor = bus.pull("discord", "bot", ack=2)
+        self.assertEqual(([e["n"] for e in events], cursor), ([2], 3))
+        self.assertEqual(bus.pending("discord"), [{"n": 2}])  # 1 and 2 released
+        self.assertEqual(bus.pull("discord", "bot", ack=3), ([], 3))
+        self.assertEqual(bus.pending("discord"), [])
+
+    def test_auto_ack_consumers_and_overflow(self):
+        bus = EventBus(max_events=3)
+        for n in range(5):
+            bus.publish("mc", {"n": n})
+        self.assertEqual([e["n"] for e in bus.drain("mc", "minecraft")], [2, 3, 4])
+        self.assertEqual(bus.drain("mc", "minecraft"), [])
+        bus.publish("mc", {"n": 5})
+        # A second consumer only holds back release for what it has not acked
+        self.assertEqual([e["id"] for e in bus.pull("mc", "debug")[0]], [6])
+        self.assertEqual([e["id"] for e in bus.drain("mc", "minecraft")], [6])
+        self.assertEqual(bus.pending("mc"), [{"n": 5}])
+        self.assertEqual(bus.stats()["mc"]["dropped"], 2)
+
+    def test_no_events_lost_under_concurrency(self):
+        bus = EventBus(max_events=100000)
+        received = []
+
+        def produce(k):
+            for n in range(2000):
+                bus.publish("mc", {"k": k, "n": n})
+
+        producers = [threading.Thread(target=produce, args=(k,)) for k in range(4)]
+        for t in producers:
+            t.start()
+        while any(t.is_alive() for t in producers):
+            received += bus.drain("mc", "minecraft")
+        received += bus.drain("mc", "minecraft")
+        self.assertEqual([e["id"] for e in received], list(range(1, 8001)))
+
+
+    def test_long_poll_wakes_on_publish_and_times_out(self):
+        bus = EventBus()
+
+        async def run():
+            threading.Timer(0.1, bus.publish, args=("discord", {"n": 1})).start()  # from another thread
+            t0 = time.monotonic()
+            woke = await bus.pull_wait(["mc", "discord"], "bot", timeout=5)
+            woke_after = time.monotonic() - t0
+            t0 = time.monotonic()
+            idle = await bus.pull_wait(["mc"], "bot", timeout=0.1)
+            return woke, woke_after, idle, time.monotonic() - t0
+
+        woke, woke_after, idle, idle_after = asyncio.run(run())
+        self.assertEqual([e["n"] for e in woke["discord"][0]], [1])
+        self.assertEqual(woke["mc"], ([], 0))
+        self.assertLess(woke_after, 1.0)
+        self.assertEqual(idle, {"mc": ([], 0)})
+        self.assertTrue(0.1 <= idle_after < 1.0)
+        self.assertEqual((bus.waits, bus.wakeups, bus.stats()["discord"]["waiting"]), (2, 1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from fast_path import ALONE, LLM, NOISE, RETALIATE, FastPath, Situation, is_noise
+
+
+def chat(message):
+    return {"sender": "Steve", "message": message}
+
+
+class TestIsNoise(unittest.TestCase):
+    def test_laughter_fillers_and_symbols(self):
+        for message in ("w", "wwww", "草草", "GG gg", "...", "!?", "👍", "  ", "おk"):
+            self.assertTrue(is_noise(message), message)
+        for message in ("where are you", "草を刈って", "ok let's go", "gg, again?", "ダイヤ見つけた"):
+            self.assertFalse(is_noise(message), message)
+
+
+class TestFastPath(unittest.TestCase):
+    def test_rule_order_and_shares(self):
+        fp = FastPath()
+        hit = Situation("player", chat("www"), attackers=[("Bot1", "Alex")], nearby_players=0)
+        path, action = fp.decide(hit)
+        self.assertEqual((path, action["action"], action["target"]), (RETALIATE, "attack", "Alex"))
+        # A mention always reaches the model, even right after a hit, as noise or with nobody around
+        self.assertEqual(fp.decide(Situation("player", chat("AI www"), mentioned=True,
+                                             attackers=[("Bot1", "Alex")], nearby_players=0)), (None, None))
+        self.assertEqual(fp.decide(Situation("gm", chat("wwww"), nearby_players=3)), (NOISE, None))
+        self.assertEqual(fp.decide(Situation("player", chat("where is everyone"), nearby_players=0)), (ALONE, None))
+        # gm mode has no "alone" rule; an unknown neighbourhood is not "alone" either
+        self.assertEqual(fp.decide(Situation("gm", chat("hello"), nearby_players=0)), (None, None))
+        self.assertEqual(fp.decide(Situation("player", chat("hello"))), (None, None))
+        fp.record(LLM)
+        stats = fp.stats()
+        self.assertEqual(stats["decisions"], 4)
+        self.assertEqual(stats["paths"], {RETALIATE: 1, NOISE: 1, ALONE: 1, LLM: 1})
+        self.assertAlmostEqual(stats["share"][LLM], 0.25)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from event_bus import EventBus
+from journal import CHECKPOINT, Journal, encode, read_segment, replay
+
+
+class TestJournal(unittest.TestCase):
+    def test_segments_start_with_a_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            seen = []
+            j = Journal(tmp, segment_bytes=300, checkpoint=lambda: len(seen))
+            j.open()
+            for n in range(20):
+                j.append("n", n)
+                seen.append(n)
+            j.close()
+
+            segments = j.segments()
+            self.assertGreater(len(segments), 2)
+            for path in segments:
+                self.assertEqual(next(read_segment(path))[1], CHECKPOINT)
+            records = [(kind, data) for _, kind, data in j.replay_records()]
+            self.assertEqual([d for k, d in records if k == "n"], list(range(20)))
+            # The newest segment's checkpoint counts everything before it
+            tail = list(j.recover())
+            self.assertEqual(tail[0][2], 20 - (len(tail) - 1))
+
+    def test_torn_tail_is_cut_off_on_open(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            j = Journal(tmp)
+            j.open()
+            for n in range(3):
+                j.append("n", n)
+            j.close()
+            path = j.segments()[-1]
+            with open(path, "r+b") as f:
+                f.truncate(os.path.getsize(path) - 3)  # crash in the middle of the last record
+
+            j = Journal(tmp)
+            self.assertEqual([d for _, k, d in j.recover() if k == "n"], [0, 1])
+            j.open()
+            j.append("n", 3)
+            j.close()
+            self.assertEqual([d for _, k, d in j.recover() if k == "n"], [0, 1, 3])
+
+    def test_crash_while_rolling_recovers_from_the_previous_segment(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            j = Journal(tmp, checkpoint=lambda: "state")
+            j.open()
+            for n in range(3):
+                j.append("n", n)
+            j.close()
+            for torn in (b"", encode(CHECKPOINT, "newer")[:7]):  # the next segment was just created / half written
+                with open(os.path.join(tmp, "journal-00000002.log"), "wb") as f:
+                    f.write(torn)
+                self.assertEqual([d for _, _, d in Journal(tmp).recover()], ["state", 0, 1, 2])
+
+            j = Journal(tmp, checkpoint=lambda: "again")
+            j.open()
+            j.append("n", 3)
+            j.close()
+            self.assertEqual([os.path.basename(p) for p in j.segments()], ["journal-00000001.log", "journal-00000002.log"])
+            self.assertEqual([d for _, _, d in j.recover()], ["again", 3])
+
+    def test_append_does_not_wait_for_a_slow_fsync(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            j = Journal(tmp, fsync_interval=60)
+            j.open()
+            j.append("n", 0)
+            syncing, release = threading.Event(), threading.Event()
+
+            def slow_fsync(fd):
+                syncing.set()
+                release.wait(5)
+
+            with mock.patch("journal.os.fsync", slow_fsync):
+                sync = threading.Thread(target=j.sync)
+                sync.start()
+                syncing.wait(5)
+                t0 = time.monotonic()
+                j.append("n", 1)
+                self.assertLess(time.monotonic() - t0, 1)
+                release.set()
+                sync.join(5)
+            j.close()
+            self.assertEqual([d for _, k, d in j.recover() if k == "n"], [0, 1])
+
+    def test_bus_recovers_unacked_events(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            bus = EventBus()
+            j = Journal(tmp, checkpoint=bus.dump)
+            j.open()
+            bus.journal = j
+            for n in range(3):
+                bus.publish("discord", {"n": n})
+            bus.pull("discord", "voice", ack=0)
+            bus.pull("discord", "voice", ack=1)
+            j.close()
+
+            restored = EventBus()
+            replay(Journal(tmp).recover(), {CHECKPOINT: restored.load,
+                                            "publish": lambda d: restored.restore("publish", d),
+                                            "ack": lambda d: restored.restore("ack", d)})
+            self.assertEqual(restored.pending("discord"), [{"n": 1}, {"n": 2}])
+            events, cursor = restored.pull("discord", "voice")
+            self.assertEqual(([e["id"] for e in events], cursor), ([2, 3], 3))
+            self.assertEqual(restored.publish("discord", {"n": 3}), 4)
+
+    def test_replay_paces_by_recorded_time(self):
+        records = [(100.0 + i * 0.05, "n", i) for i in range(5)] + [(200.0, "other", None)]
+        got = []
+        r = replay(iter(records), {"n": got.append})
+        self.assertEqual((got, r["records"]), ([0, 1, 2, 3, 4], {"n": 5}))
+        self.assertAlmostEqual(r["recorded_seconds"], 0.2)
+        r = replay(iter(records), {"n": got.append}, speed=2)
+        self.assertGreaterEqual(r["replay_seconds"], 0.09)
+
+
+if __name__ == "__main__":
+    unittest.main()
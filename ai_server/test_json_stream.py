@@ -0,0 +1,30 @@
+import unittest
+
+from json_stream import JsonFieldStream
+
+REPLY = ('```json\n{"action": "chat", "message": "He said \\"}\\" \\u3042", "n": -1.5e3, '
+         '"ok": true, "none": null, "t": {"a": [1, "]"]}, "reason": "long"}\n``` trailing {')
+
+
+class TestJsonFieldStream(unittest.TestCase):
+    def test_fields_complete_in_order_for_any_chunking(self):
+        for step in (1, 2, 5, len(REPLY)):
+            stream, order = JsonFieldStream(), []
+            for i in range(0, len(REPLY), step):
+                order += list(stream.feed(REPLY[i:i + step]))
+            self.assertTrue(stream.done)
+            self.assertEqual(order, ["action", "message", "n", "ok", "none", "t", "reason"])
+            self.assertEqual(stream.fields["message"], 'He said "}" あ')
+            self.assertEqual((stream.fields["n"], stream.fields["none"], stream.fields["t"]),
+                             (-1500.0, None, {"a": [1, "]"]}))
+
+    def test_value_is_reported_only_once_complete(self):
+        stream = JsonFieldStream()
+        self.assertEqual(stream.feed('{"action": "chat", "message": "hal'), {"action": "chat"})
+        self.assertEqual(stream.feed('f done'), {})
+        self.assertEqual(stream.feed('", "reason'), {"message": "half done"})
+        self.assertFalse(stream.done)
+
+
+if __name__ == '__main__':
+    unittest.main()
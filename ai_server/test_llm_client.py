@@ -0,0 +1,91 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+import unittest
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from llm_client import LLMClient
+
+
+class FakeOpenAI:
+    """
+    OpenAI-compatible /v1/chat/completions on a local port. The reply is a list
+    of (delay, text) pieces: streamed one SSE chunk per piece with "stream": true,
+    otherwise joined and sent after the total delay. A non-200 `status` fails
+    every request after the delay.
+    """
+
+    def __init__(self, pieces, status=200):
+        self.pieces = pieces
+        self.status = status
+        self.active = self.max_active = 0
+        self.client_ports = []
+        self.streams_finished = 0
+        app = FastAPI()
+
+        @app.post("/v1/chat/completions")
+        async def completions(request: Request):
+            self.client_ports.append(request.client.port)
+            if self.status != 200:
+                await asyncio.sleep(sum(d for d, _ in self.pieces))
+                return JSONResponse({"error": "injected"}, status_code=self.status)
+            if (await request.json()).get("stream"):
+                return StreamingResponse(self._sse(), media_type="text/event-stream")
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            await asyncio.sleep(sum(d for d, _ in self.pieces))
+            self.active -= 1
+            content = "".join(t for _, t in self.pieces)
+            return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{sock.getsockname()[1]}/v1"
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [sock]}, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+    async def _sse(self):
+        for delay, text in self.pieces:
+            await asyncio.sleep(delay)
+            yield f"data: {json.dumps({'choices': [{'delta': {'content': text}}]})}\n\n"
+        yield "data: [DONE]\n\n"
+        self.streams_finished += 1
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(5)
+
+
+class TestLLMClient(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeOpenAI([(0.3, '```json\n{"action": "chat", "message": "hi"}\n```')])
+        self.addCleanup(self.fake.stop)
+
+    def test_concurrency_limit_keepalive_and_deadline(self):
+        async def run():
+            llm = LLMClient(self.fake.url, max_concurrency=2)
+            msgs = [{"role": "user", "content": "x"}]
+            results = await asyncio.gather(*(llm.chat(msgs) for _ in range(4)))
+            late = await llm.chat(msgs, deadline=0.05)
+            await llm.aclose()
+            return llm, results, late
+
+        llm, results, late = asyncio.run(run())
+        self.assertTrue(all(r and r.startswith("```json") for r in results))
+        self.assertEqual(self.fake.max_active, 2)
+        # Four calls through two slots reuse the two pooled connections
+        self.assertEqual(len(set(self.fake.client_ports[:4])), 2)
+        self.assertIsNone(late)
+        self.assertEqual((llm.completed, llm.timeouts, llm.in_flight), (4, 1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
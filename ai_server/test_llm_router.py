@@ -0,0 +1,105 @@
+import asyncio
+import time
+import unittest
+
+from llm_client import LLMClient
+from llm_router import LLMRouter
+from test_llm_client import FakeOpenAI
+
+MSGS = [{"role": "user", "content": "x"}]
+
+
+class TestLLMRouter(unittest.TestCase):
+    def fakes(self, *specs):
+        fakes = [FakeOpenAI([(delay, name)], status=status) for name, delay, status in specs]
+        for fake in fakes:
+            self.addCleanup(fake.stop)
+        return fakes
+
+    def router(self, fakes, **kw):
+        return LLMRouter([LLMClient(f.url, max_concurrency=4, timeout=2.0) for f in fakes], **kw)
+
+    def test_balances_toward_the_faster_endpoint(self):
+        fast, slow = self.fakes(("fast", 0.01, 200), ("slow", 0.15, 200))
+        router = self.router([fast, slow])
+
+        async def run():
+            replies = [await router.chat(MSGS) for _ in range(10)]
+            await router.aclose()
+            return replies
+
+        replies = asyncio.run(run())
+        # Each endpoint is tried once (no samples yet), then the fast one keeps winning
+        self.assertEqual(replies.count("slow"), 1)
+        self.assertLess(router.endpoints[0].ewma, router.endpoints[1].ewma)
+
+    def test_hedges_past_p90_and_fails_over_on_errors(self):
+        a, b, broken = self.fakes(("a", 0.02, 200), ("b", 0.02, 200), ("broken", 0.0, 500))
+        router = self.router([a, b], min_samples=3, min_hedge=0.15)
+        for ep in router.endpoints:  # as if both had answered in ~20ms so far
+            ep.recent.extend([0.02] * 5)
+            ep.ewma = 0.02
+
+        async def run():
+            ep = router._ranked()[0]
+            fake = a if ep.client.api_base == a.url else b
+            fake.pieces = [(1.0, "stuck")]  # the preferred endpoint stalls
+            t0 = time.monotonic()
+            reply = await router.chat(MSGS)
+            hedged = time.monotonic() - t0
+
+            failover = self.router([broken, a])
+            failover.endpoints[0].ewma = 0.0  # make sure the broken one is picked first
+            a.pieces = [(0.0, "a")]
+            recovered = await failover.chat(MSGS)
+            await router.aclose()
+            await failover.aclose()
+            return reply, hedged, failover, recovered
+
+        reply, hedged, failover, recovered = asyncio.run(run())
+        self.assertIn(reply, ("a", "b"))
+        self.assertLess(hedged, 0.6)
+        self.assertEqual((router.hedges, router.hedge_wins), (1, 1))
+        self.assertEqual(recovered, "a")
+        self.assertEqual((failover.failovers, failover.endpoints[0].failures), (1, 1))
+
+    def test_stream_fails_over_before_first_delta(self):
+        broken, ok = self.fakes(("x", 0.0, 503), ("streamed", 0.0, 200))
+        router = self.router([broken, ok])
+
+        async def run():
+            out = [d async for d in router.stream_chat(MSGS)]
+            await router.aclose()
+            return out
+
+        self.assertEqual(asyncio.run(run()), ["streamed"])
+        self.assertEqual(router.failovers, 1)
+
+    def test_stream_hedges_on_first_delta_and_accepts_empty_replies(self):
+        slow, fast, empty = self.fakes(("slow", 1.0, 200), ("fast", 0.02, 200), ("", 0.0, 200))
+        router = self.router([slow, fast], hedge_after=0.15)
+        quiet = self.router([empty, fast])
+
+        async def run():
+            t0 = time.monotonic()
+            out = [d async for d in router.stream_chat(MSGS)]
+            hedged = time.monotonic() - t0
+            nothing = [d async for d in quiet.stream_chat(MSGS)]
+            await router.aclose()
+            await quiet.aclose()
+            return out, hedged, nothing
+
+        out, hedged, nothing = asyncio.run(run())
+        self.assertEqual(out, ["fast"])
+        self.assertLess(hedged, 0.6)
+        self.assertEqual((router.hedges, router.hedge_wins), (1, 1))
+        self.assertEqual(len(router.endpoints[1].recent_first), 1)
+        self.assertEqual([ep.in_flight for ep in router.endpoints], [0, 0])
+        # Completing without a delta is an answer: no cooldown, no failover
+        self.assertEqual(nothing, [])
+        self.assertEqual((quiet.failovers, quiet.endpoints[0].failures), (0, 0))
+        self.assertEqual(len(quiet.endpoints[0].recent_first), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
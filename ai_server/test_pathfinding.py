@@ -0,0 +1,202 @@
+import unittest
+
+import numpy as np
+
+from pathfinding import IncrementalPlanner, NavGrid
+from parkour_brain import ParkourBrain
+
+
+def flat_world(h=6, d=9, w=9, floor=1):
+    """(Y, Z, X) grid with solid blocks up to and including y = floor"""
+    grid = np.zeros((h, d, w), dtype=np.uint8)
+    grid[:floor + 1] = 1
+    return grid
+
+
+class TestNavGrid(unittest.TestCase):
+    def test_standable_needs_floor_and_headroom(self):
+        grid = flat_world()
+        grid[3, 4, 4] = 1  # head-height block
+        nav = NavGrid(grid)
+        self.assertTrue(nav.is_standable((2, 0, 0)))
+        self.assertFalse(nav.is_standable((2, 4, 4)))
+        self.assertFalse(nav.is_standable((3, 0, 0)))  # floating
+        self.assertEqual(int(nav.standable[2].sum()), 9 * 9 - 1)
+        self.assertTrue(nav.is_standable((4, 4, 4)))  # on top of that block
+
+    def test_walk_path_is_shortest(self):
+        nav = NavGrid(flat_world())
+        path = nav.astar((2, 0, 0), (2, 0, 4))
+        self.assertEqual(len(path), 4)
+        self.assertTrue(all(method == "walk" for _, method in path))
+        self.assertEqual(nav.coords(path[-1][0]), (2, 0, 4))
+
+    def test_jump_up_and_drop(self):
+        grid = flat_world()
+        grid[2, :, 4:] = 1  # one-block step up at x >= 4
+        nav = NavGrid(grid)
+        up = nav.astar((2, 0, 2), (3, 0, 5))
+        self.assertIn("jump_up", [m for _, m in up])
+        down = nav.astar((3, 0, 5), (2, 0, 2))
+        self.assertIn("drop", [m for _, m in down])
+
+        grid[4, 0, 3] = 1  # ceiling above the take-off cell blocks the jump
+        grid[4, 1:, :] = 1
+        self.assertIsNone(NavGrid(grid).astar((2, 0, 3), (3, 0, 5)))
+
+    def test_long_jump_over_gap(self):
+        grid = flat_world()
+        grid[:, :, 4] = 0  # one-wide trench across the whole map
+        path = NavGrid(grid).astar((2, 4, 2), (2, 4, 6))
+        self.assertEqual([m for _, m in path], ["walk", "long_jump", "walk"])
+
+    def test_no_corner_cutting(self):
+        grid = flat_world()
+        grid[2:4, 1, 0] = 1  # pillar next to the start
+        nav = NavGrid(grid)
+        path = nav.astar((2, 0, 0), (2, 1, 1))
+        self.assertEqual(len(path), 2)  # walk around, not through the corner
+
+
+class TestDistanceField(unittest.TestCase):
+    def test_matches_astar_for_every_goal(self):
+        grid = flat_world(h=7, d=12, w=12)
+        grid[2:4, 2:10, 6] = 1  # wall
+        grid[2, 9, 2:5] = 1  # step up
+        nav = NavGrid(grid)
+        field = nav.distance_field((2, 5, 2))
+        for goal in map(tuple, np.argwhere(nav.standable)):
+            path = nav.astar((2, 5, 2), goal)
+            if path is None:
+                self.assertEqual(field.cost(goal), np.inf)
+                continue
+            self.assertAlmostEqual(field.cost(goal), path_cost(nav, (2, 5, 2), path))
+            self.assertAlmostEqual(path_cost(nav, (2, 5, 2), field.path_to(goal)), field.cost(goal))
+
+    def test_cost_near_tolerates_unstandable_feet(self):
+        nav = NavGrid(flat_world())
+        field = nav.distance_field((2, 4, 4))
+        cost, cell = field.cost_near((3, 4, 7))  # one block up, e.g. mid-jump
+        self.assertEqual((cost, cell), (3.0, (2, 4, 7)))
+
+
+def path_cost(nav, start, path):
+    cost, cur = 0.0, nav.index(start)
+    for i, _ in path:
+        cost += nav.costs[nav.offsets.index(i - cur)]
+        cur = i
+    return cost
+
+
+class TestIncrementalPlanner(unittest.TestCase):
+    def test_matches_astar_and_reuses_tree(self):
+        grid = flat_world(h=7, d=20, w=20)
+        grid[2:4, 3:15, 8] = 1  # wall
+        nav = NavGrid(grid)
+        planner = IncrementalPlanner()
+        start, goal = (2, 5, 2), (2, 5, 16)
+
+        path = planner.plan(nav, (0, 0, 0), start, goal)
+        self.assertAlmostEqual(path_cost(nav, start, path), path_cost(nav, start, nav.astar(start, goal)))
+        self.assertGreater(planner.nodes_expanded, 0)
+
+        # Same snapshot, nothing moved: answered from the kept tree
+        planner.plan(nav, (0, 0, 0), start, goal)
+        self.assertEqual(planner.nodes_expanded, 0)
+
+        # Bot moved one step along its path: still no search
+        nxt = nav.coords(path[0][0])
+        planner.plan(nav, (0, 0, 0), nxt, goal)
+        self.assertEqual(planner.nodes_expanded, 0)
+
+    def test_repairs_window_slide_and_new_wall(self):
+        world = flat_world(h=7, d=20, w=30)
+        planner = IncrementalPlanner()
+        start, goal = (2, 10, 3), (2, 10, 15)
+        planner.plan(NavGrid(world[:, :, 0:20]), (0, 0, 0), start, goal)
+
+        # Window slides +1 in x and a wall appears between bot and goal
+        world[2:4, 2:18, 10] = 1
+        nav = NavGrid(np.ascontiguousarray(world[:, :, 1:21]))
+        start, goal = (2, 10, 2), (2, 10, 14)
+        path = planner.plan(nav, (1, 0, 0), start, goal)
+        self.assertEqual(planner.resets, 0)
+        self.assertAlmostEqual(path_cost(nav, start, path), path_cost(nav, start, nav.astar(start, goal)))
+
+        # Goal moves a little: repaired, not restarted
+        goal = (2, 12, 14)
+        path = planner.plan(nav, (1, 0, 0), start, goal)
+        self.assertEqual(planner.resets, 0)
+        self.assertAlmostEqual(path_cost(nav, start, path), path_cost(nav, start, nav.astar(start, goal)))
+
+        # Enclosed goal: no path
+        world[2:4, 11:14, 13:17] = 1
+        world[2:4, 12, 14:16] = 0
+        nav = NavGrid(np.ascontiguousarray(world[:, :, 1:21]))
+        self.assertIsNone(planner.plan(nav, (1, 0, 0), start, (2, 12, 14)))
+
+
+    def test_capped_repair_falls_back_to_astar_and_rebuilds_in_slices(self):
+        world = flat_world(h=7, d=20, w=20)
+        planner = IncrementalPlanner(repair_factor=0.2, min_repair=4)
+        start, goal = (2, 10, 2), (2, 10, 16)
+        planner.plan(NavGrid(world), (0, 0, 0), start, goal)
+        self.assertEqual((planner.capped, planner.fallbacks), (0, 0))
+
+        # A long wall invalidates most of the tree: more than the cap allows
+        world[2:4, 1:19, 9] = 1
+        nav = NavGrid(world)
+        best = path_cost(nav, start, nav.astar(start, goal))
+        path = planner.plan(nav, (0, 0, 0), start, goal)
+        self.assertEqual((planner.capped, planner.fallbacks), (1, 1))
+        self.assertAlmostEqual(path_cost(nav, start, path), best)
+        self.assertIsNone(planner.nav)  # tree dropped
+
+        # The new tree is built a slice per call, answered by A* meanwhile
+        for _ in range(50):
+            fallbacks = planner.fallbacks
+            path = planner.plan(nav, (0, 0, 0), start, goal)
+            self.assertAlmostEqual(path_cost(nav, start, path), best)
+            if planner.fallbacks == fallbacks:
+                break
+        self.assertGreater(planner.fallbacks, 2)
+        self.assertEqual(planner.capped, 1)
+        planner.plan(nav, (0, 0, 0), start, goal)
+        self.assertEqual(planner.nodes_expanded, 0)
+        self.assertEqual(planner.stats()["fallbacks"], planner.fallbacks)
+
+
+class TestBrainPlanning(unittest.TestCase):
+    def setUp(self):
+        grid = np.zeros((9, 33, 33), dtype=np.uint8)
+        grid[:4] = 1
+        grid[4:6, 10:23, 20] = 1  # wall in front of the bot along z
+        self.brain = ParkourBrain()
+        self.brain.update_state({"player": {"dimension": "d"}, "origin": {"x": 0, "y": 64, "z": 0},
+                                 "radius": 16, "halfHeight": 4, "width": 33, "height": 9, "grid": grid})
+
+    def test_next_action_walks_around_wall(self):
+        action = self.brain.get_next_action((8, 0, 0))
+        self.assertEqual(action["type"], "move_to")
+        nodes = [step["node"] for step in self.brain.path]
+        self.assertEqual(nodes[-1], (8, 0, 0))
+        self.assertNotIn((4, 0, 0), nodes)
+
+    def test_path_distance_ranks_reachable_first(self):
+        grid = self.brain.voxel_grid.copy()
+        grid[4:6, 14:19, 3:8] = 1
+        grid[4:6, 15:18, 4:7] = 0  # walled-in pen around (-11, 0, 0)
+        self.brain.update_state({"player": {"dimension": "d"}, "origin": {"x": 0, "y": 64, "z": 0},
+                                 "radius": 16, "halfHeight": 4, "width": 33, "height": 9, "grid": grid})
+        self.assertEqual(self.brain.path_distance((-11, 0, 0)), np.inf)
+        self.assertEqual(self.brain.path_distance((0, 0, 12)), 12.0)
+        self.assertIsNone(self.brain.path_distance((40, 0, 0)))  # outside the window
+
+    def test_unstandable_target_snaps_to_neighbour(self):
+        action = self.brain.get_next_action((4, 0, 0))  # inside the wall
+        self.assertEqual(action["type"], "move_to")
+        self.assertEqual(abs(self.brain.path[-1]["node"][0] - 4), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
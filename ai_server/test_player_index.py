@@ -0,0 +1,64 @@
+import math
+import unittest
+
+import numpy as np
+
+from player_index import PlayerIndex
+
+
+def players(n, seed=0):
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in range(n):
+        x, z = rng.uniform(-100, 100, size=2)
+        out.append({"name": f"P{i}", "location": {"x": float(x), "y": 64.0, "z": float(z)},
+                    "rotation": {"x": 0.0, "y": float(rng.uniform(-180, 180))}, "tags": {}})
+    return out
+
+
+def looking_at(p, me):
+    # The per-player loop next_move used before the index
+    dx, dz = me["x"] - p["location"]["x"], me["z"] - p["location"]["z"]
+    dist = (dx ** 2 + dz ** 2) ** 0.5
+    yaw_rad = (p["rotation"]["y"] + 90) * (math.pi / 180)
+    return 0 < dist < 20 and (dx * math.cos(yaw_rad) + dz * math.sin(yaw_rad)) / dist > 0.9
+
+
+class TestPlayerIndex(unittest.TestCase):
+    def test_queries_match_brute_force(self):
+        ps = players(300)
+        index = PlayerIndex(ps)
+        for me in ({"x": 0.0, "z": 0.0}, {"x": 37.5, "z": -80.0}, {"x": 500.0, "z": 500.0}):
+            idx, dist = index.within(me, 30.0)
+            brute = sorted((math.hypot(p["location"]["x"] - me["x"], p["location"]["z"] - me["z"]), i)
+                           for i, p in enumerate(ps))
+            self.assertEqual(idx.tolist(), [i for d, i in brute if d < 30.0])
+            self.assertTrue(np.all(np.diff(dist) >= 0))
+            self.assertEqual(index.nearest(me), brute[0][1])
+            self.assertEqual(sorted(index.watchers(me).tolist()),
+                             [i for i, p in enumerate(ps) if looking_at(p, me)])
+
+    def test_small_lists_skip_the_grid_and_agree_with_it(self):
+        ps = players(40, seed=3)
+        small, hashed = PlayerIndex(ps), PlayerIndex(ps, grid_min=0)
+        self.assertIsNone(small.cells)
+        self.assertTrue(hashed.cells)
+        for me in ({"x": 0.0, "z": 0.0}, {"x": 60.0, "z": 20.0}):
+            for radius in (10.0, 30.0, math.inf):
+                self.assertEqual(small.within(me, radius)[0].tolist(), hashed.within(me, radius)[0].tolist())
+            self.assertEqual(small.watchers(me).tolist(), hashed.watchers(me).tolist())
+            self.assertEqual(small.nearest(me, exclude="P0"), hashed.nearest(me, exclude="P0"))
+
+    def test_missing_rotation_and_empty_index(self):
+        ps = [{"name": "A", "location": {"x": 0, "y": 64, "z": 5}, "tags": {}},
+              {"name": "B", "location": {"x": 0, "y": 64, "z": -5}, "rotation": {"x": 0, "y": 0}, "tags": {}}]
+        index = PlayerIndex(ps)
+        me = {"x": 0, "z": 0}
+        self.assertEqual(index.watchers(me).tolist(), [1])  # B faces south (+Z) at us; A reports no yaw
+        self.assertEqual(index.nearest(me, exclude="A"), 1)
+        self.assertIsNone(PlayerIndex([]).nearest(me))
+        self.assertEqual(len(PlayerIndex([]).watchers(me)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from prompt_builder import SLOT, ChatHistory, PromptBuilder, estimate_tokens
+
+
+def players(n):
+    return [{"name": f"P{i}", "location": {"x": i + 0.4, "y": 64.0, "z": -i - 0.6},
+             "tags": {"pub": ["pub:alive"], "sec": ["sec:wolf"] if i == 1 else []}} for i in range(n)]
+
+
+class TestChatHistory(unittest.TestCase):
+    def test_old_turns_fold_into_a_bounded_summary(self):
+        history = ChatHistory(max_turns=3, max_summary_senders=3)
+        for i in range(10):
+            history.append({"sender": f"S{i % 3}", "message": f"m{i}"})
+        self.assertEqual([t["message"] for t in history.turns], ["m7", "m8", "m9"])
+        self.assertEqual(history.summarized, 7)
+        self.assertEqual(history.summary(), "S0(3件, 最後「m6」), S2(2件, 最後「m5」), S1(2件, 最後「m4」)")
+        self.assertEqual(history.recent(2), [{"sender": "S2", "message": "m8"}, {"sender": "S0", "message": "m9"}])
+        history.append({"sender": "S3", "message": "m10"})  # folds m7 by S1
+        history.append({"sender": "S4", "message": "m11"})  # folds m8 by S2
+        history.append({"sender": "S5", "message": "m12"})  # folds m9 by S0
+        self.assertEqual(len(history._summary), 3)
+
+
+class TestPromptBuilder(unittest.TestCase):
+    def test_players_are_compact_with_shared_tags_once(self):
+        self.assertEqual(PromptBuilder.player_lines(players(3)),
+                         ["全員共通タグ: pub:alive", "P0 (0,64,-1)", "P1 (1,64,-2) sec:wolf", "P2 (2,64,-3)"])
+
+    def test_prompt_stays_within_budget(self):
+        history = ChatHistory(max_turns=100)
+        for i in range(100):
+            history.append({"sender": "Steve", "message": "長いメッセージ" * 5})
+        builder = PromptBuilder(budget_tokens=150)
+        template = f"指示\n{SLOT}\nJSONで答えて"
+        prompt = builder.fill(template, players(50), history)
+        self.assertLessEqual(estimate_tokens(prompt), 150)
+        self.assertIn("行省略", prompt)
+        self.assertIn("- 直近のチャット:\n  (なし)", prompt)  # players take precedence
+        self.assertEqual(builder.stats()["last_tokens"], estimate_tokens(prompt))
+
+        # With room to spare: everything fits, newest chat last, summary included
+        history = ChatHistory(max_turns=2)
+        for i in range(4):
+            history.append({"sender": "Alex", "message": f"m{i}"})
+        prompt = PromptBuilder(budget_tokens=1000).fill(template, players(2), history)
+        self.assertIn("  Alex: m2\n  Alex: m3\n- それ以前の会話: Alex(2件, 最後「m1」)", prompt)
+
+
+if __name__ == '__main__':
+    unittest.main()
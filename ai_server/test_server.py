@@ -0,0 +1,560 @@
+import asyncio
+import base64
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import httpx
+import numpy as np
+from fastapi.testclient import TestClient
+
+import parkour_brain
+import server
+import voxel_codec
+from decision_cache import DecisionCache
+from game_master import GameState
+from journal import Journal, replay
+from llm_client import LLMClient
+from parkour_brain import BrainRegistry
+from prompt_builder import ChatHistory
+from test_llm_client import FakeOpenAI
+
+
+def flat_grid():
+    grid = np.zeros((9, 33, 33), dtype=np.uint8)
+    grid[:4] = 1
+    return grid
+
+
+def snapshot(name, origin, grid):
+    x, y, z = origin
+    return {"player": {"name": name, "pos": {"x": x, "y": y, "z": z}, "dimension": "minecraft:overworld"},
+            "origin": {"x": x, "y": y, "z": z}, "radius": 16, "halfHeight": 4,
+            "width": 33, "height": 9, "grid": grid.ravel().tolist()}
+
+
+class ServerTestCase(unittest.TestCase):
+    """Fresh brains, bus, cache and game state for each test; the module's own are put back afterwards"""
+
+    def setUp(self):
+        registry = self.patch(parkour_brain, "brains", BrainRegistry(max_workers=4))
+        self.addCleanup(registry.shutdown)
+        self.patch(server, "bus", server.EventBus())
+        self.patch(server, "decision_cache", DecisionCache())
+        self.patch(server, "snapshot_ring", server.SnapshotRing())
+        self.patch(server.gm, "state", server.gm.state)
+        state = mock.patch.dict(server.game_state, {"players": [], "chat_history": ChatHistory(), "hits": {}, "bots": {},
+                                                   "ai_bots": [f"Bot{i}" for i in range(10)]})
+        state.start()
+        self.addCleanup(state.stop)
+        server._last_frame_seq.clear()
+        server._bot_shared_at.clear()
+        self.client = TestClient(server.app)
+
+    def patch(self, target, name, value):
+        patcher = mock.patch.object(target, name, value)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return value
+
+
+class TestBrainRouting(ServerTestCase):
+    def test_snapshots_and_moves_are_per_bot(self):
+        grid = flat_grid()
+        grid[4:6, :, 17] = 1  # wall east of Bot1 only
+        self.client.post("/v1/mc/state", json=snapshot("Bot1", (0, 64, 0), grid))
+        self.client.post("/v1/mc/state", json=snapshot("Bot2", (500, 70, 500), flat_grid()))
+
+        brains = parkour_brain.brains
+        self.assertEqual(sorted(brains.names()), ["Bot1", "Bot2"])
+        self.assertEqual(brains.get("Bot1").origin, (0, 64, 0))
+        self.assertEqual(brains.get("Bot2").origin, (500, 70, 500))
+        self.assertEqual(brains.get("Bot1").voxel_grid[4, 0, 17], 1)
+        self.assertEqual(brains.get("Bot2").voxel_grid[4, 0, 17], 0)
+
+        # A player 5+ blocks east of both bots: only Bot2 walks straight at them
+        server.game_state["players"] = [
+            {"name": "Steve", "location": {"x": 8, "y": 64, "z": 0}, "tags": {}},
+            {"name": "Alex", "location": {"x": 508, "y": 70, "z": 500}, "tags": {}},
+        ]
+        move = self.client.post("/v1/mc/next_move", params={"player_name": "Bot2"}).json()
+        self.assertEqual((move["type"], move["target"]), ("move_to", {"x": 1, "y": 0, "z": 0}))
+        move = self.client.post("/v1/mc/next_move", params={"player_name": "Bot1"}).json()
+        self.assertNotEqual(move.get("target"), {"x": 1, "y": 0, "z": 0})
+        self.assertEqual(self.client.post("/v1/mc/next_move", params={"player_name": "Nobody"}).json(),
+                         {"type": "idle"})
+
+    def test_bot_walks_toward_a_player_watching_it(self):
+        self.client.post("/v1/mc/state", json=snapshot("Bot1", (0, 64, 0), flat_grid()))
+        # Both within group-up range, but only Alex (south, yaw 180 = facing north) watches the bot
+        server.game_state["players"] = [
+            {"name": "Steve", "location": {"x": -3, "y": 64, "z": 0}, "rotation": {"x": 0, "y": 0}, "tags": {}},
+            {"name": "Alex", "location": {"x": 0, "y": 64, "z": 10}, "rotation": {"x": 0, "y": 180}, "tags": {}},
+        ]
+        move = self.client.post("/v1/mc/next_move", params={"player_name": "Bot1"}).json()
+        self.assertEqual((move["type"], move["target"]), ("move_to", {"x": 0, "y": 0, "z": 1}))
+
+    def test_ghosts_are_never_picked(self):
+        self.client.post("/v1/mc/state", json=snapshot("Bot1", (0, 64, 0), flat_grid()))
+        # The ghost is closer and stands straight east; Steve is west
+        server.game_state["players"] = [
+            {"name": "Ghost", "location": {"x": 8, "y": 64, "z": 0}, "tags": {"pub": ["ghost"], "sec": []}},
+            {"name": "Steve", "location": {"x": -9, "y": 64, "z": 0}, "tags": {"pub": [], "sec": []}},
+        ]
+        move = self.client.post("/v1/mc/next_move", params={"player_name": "Bot1"}).json()
+        self.assertEqual((move["type"], move["target"]), ("move_to", {"x": -1, "y": 0, "z": 0}))
+
+    def test_packed_delta_needs_that_bots_keyframe(self):
+        grid = flat_grid()
+        key = voxel_codec.encode_frame(grid, (0, 64, 0), 16, 4, "Bot1", seq=1)
+        self.assertEqual(self.client.post("/v1/mc/state/packed", content=key,
+                                          headers={"Content-Type": "application/octet-stream"}).status_code, 200)
+
+        delta = voxel_codec.encode_delta([], [], (1, 64, 0), 16, 4, base_seq=1, seq=2, player="Bot2")
+        resp = self.client.post("/v1/mc/state/packed", content=delta,
+                                headers={"Content-Type": "application/octet-stream"})
+        self.assertEqual(resp.status_code, 409)
+
+        delta = voxel_codec.encode_delta([], [], (1, 64, 0), 16, 4, base_seq=1, seq=2, player="Bot1")
+        resp = self.client.post("/v1/mc/state/packed", content=delta,
+                                headers={"Content-Type": "application/octet-stream"})
+        self.assertEqual(resp.json(), {"ok": True})
+        self.assertEqual(parkour_brain.brains.get("Bot1").snapshot["origin"], {"x": 1, "y": 64, "z": 0})
+
+
+class TestBotRoster(ServerTestCase):
+    def test_only_reported_bots_get_brains_and_leavers_are_dropped(self):
+        key = voxel_codec.encode_frame(flat_grid(), (0, 64, 0), 16, 4, "Stranger", seq=1)
+        resp = self.client.post("/v1/mc/tick", json={"player": "Stranger", "frame": base64.b64encode(key).decode()})
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(self.client.post("/v1/mc/state", json=snapshot("Stranger", (0, 64, 0), flat_grid())).status_code,
+                         404)
+        self.assertEqual(parkour_brain.brains.names(), [])
+
+        self.client.post("/v1/mc/bots", json={"bots": ["Bot1", "Stranger"]})
+        for name in ("Bot1", "Stranger"):
+            self.client.post("/v1/mc/state", json=snapshot(name, (0, 64, 0), flat_grid()))
+        self.assertEqual(sorted(parkour_brain.brains.names()), ["Bot1", "Stranger"])
+
+        # Stranger logged out
+        resp = self.client.post("/v1/mc/bots", json={"bots": ["Bot1"]}).json()
+        self.assertEqual(resp, {"bots": 1, "removed": ["Stranger"]})
+        self.assertEqual(parkour_brain.brains.names(), ["Bot1"])
+        self.assertNotIn("Stranger", server.snapshot_ring.names())
+
+
+class TestTick(ServerTestCase):
+    def test_frame_events_move_and_commands_in_one_round_trip(self):
+        server.queue_action({"action": "chat", "message": "hi"})
+        server.game_state["players"] = [{"name": "Steve", "location": {"x": -8, "y": 64, "z": 0}, "tags": {}}]
+        key = voxel_codec.encode_frame(flat_grid(), (0, 64, 0), 16, 4, "Bot1", seq=1)
+        hit = {"type": "hit", "victim": "Bot1", "attacker": "Steve", "timestamp": 0}
+        resp = self.client.post("/v1/mc/tick", json={
+            "player": "Bot1", "frame": base64.b64encode(key).decode(), "events": [hit]}).json()
+
+        self.assertEqual(resp["frame"], "ok")
+        # Planned on the frame from this same request, chasing whoever hit us
+        self.assertEqual(parkour_brain.brains.get("Bot1").target_player, "Steve")
+        self.assertEqual(resp["move"]["type"], "move_to")
+        self.assertEqual(resp["move"]["target"], {"x": -1, "y": 0, "z": 0})
+        self.assertEqual(resp["commands"], [{"action": "chat", "message": "hi", "id": 1}])
+
+        # No frame this tick: still a move, commands already delivered
+        resp = self.client.post("/v1/mc/tick", json={"player": "Bot1"}).json()
+        self.assertEqual((resp["frame"], resp["move"]["type"], resp["commands"]), (None, "move_to", []))
+
+    def test_delta_without_base_asks_for_keyframe(self):
+        delta = voxel_codec.encode_delta([], [], (1, 64, 0), 16, 4, base_seq=7, seq=8, player="Bot1")
+        resp = self.client.post("/v1/mc/tick", json={"player": "Bot1", "frame": base64.b64encode(delta).decode()})
+        self.assertEqual(resp.json(), {"frame": "need_keyframe", "move": {"type": "idle"}, "commands": []})
+        resp = self.client.post("/v1/mc/tick", json={"player": "Bot2", "frame": base64.b64encode(delta).decode()})
+        self.assertEqual(resp.status_code, 400)
+
+
+class TestMentions(ServerTestCase):
+    def test_bot_names_and_ai_names_are_mentions(self):
+        parkour_brain.brains.get("Bot1")
+        self.assertTrue(server._is_mention("bot1 come here"))
+        self.assertTrue(server._is_mention("ねえAI、どう思う?"))
+        self.assertFalse(server._is_mention("he said so"))
+        self.assertFalse(server._is_mention("Bot10 is over there"))
+
+    def test_chat_not_for_the_ai_only_goes_to_history(self):
+        self.patch(server, "addressee", server.AddresseeClassifier())
+        triggers = server.think_scheduler.triggers
+        report = {"players": [], "chats": [{"sender": "Steve", "message": "トイレ行ってくる"}]}
+        self.client.post("/v1/report", json=report)
+        self.assertEqual(server.think_scheduler.triggers, triggers)
+        self.assertEqual(server.game_state["chat_history"].recent(1)[0]["message"], "トイレ行ってくる")
+        self.assertEqual(server.addressee.stats()["skipped"], 1)
+
+
+class TestRetaliation(ServerTestCase):
+    def test_each_hit_is_answered_once_and_only_while_fresh(self):
+        server.game_state["players"] = [{"name": "Steve", "location": {"x": 0, "y": 64, "z": 0}, "tags": {}}]
+        parkour_brain.brains.get("Bot1")
+        hit = {"type": "hit", "victim": "Bot1", "attacker": "Steve", "timestamp": 0}
+        self.client.post("/v1/mc/events", json=hit)
+
+        action = asyncio.run(server.think("player"))
+        self.assertEqual((action["action"], action["target"]), ("attack", "Steve"))
+        # Still chasing Steve, but that hit has been answered
+        self.assertEqual(parkour_brain.brains.get("Bot1").target_player, "Steve")
+        self.assertEqual(server._situation("player").attackers, [])
+
+        self.client.post("/v1/mc/events", json=hit)
+        with mock.patch.object(server, "RETALIATE_WINDOW", 0.0):
+            time.sleep(0.01)
+            self.assertEqual(server._situation("player").attackers, [])
+
+
+class TestWorkers(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patch(server, "WORKER_COUNT", 2)
+        self.patch(server, "WORKER_INDEX", 0)
+        # One bot for each worker
+        self.mine = next(f"Bot{i}" for i in range(10) if server.bot_worker(f"Bot{i}", 2) == 0)
+        self.theirs = next(f"Bot{i}" for i in range(10) if server.bot_worker(f"Bot{i}", 2) == 1)
+
+    def test_bot_worker_is_stable_and_matches_the_client(self):
+        # Same values as botWorker() in scripts/main.js
+        self.assertEqual([server.bot_worker(n, 4) for n in ("Bot1", "Bot2", "ボット", "Steve🙂")], [1, 0, 0, 2])
+        self.assertEqual({server.bot_worker(f"Bot{i}", 3) for i in range(20)}, {0, 1, 2})
+
+    def test_other_workers_redirect_a_bot_to_its_owner(self):
+        key = base64.b64encode(voxel_codec.encode_frame(flat_grid(), (0, 64, 0), 16, 4, self.theirs, seq=1)).decode()
+        resp = self.client.post("/v1/mc/tick", json={"player": self.theirs, "frame": key})
+        self.assertEqual((resp.status_code, resp.json()["detail"]), (421, {"worker": 1, "port": server.PORT + 1}))
+        self.assertEqual(self.client.post("/v1/mc/next_move", params={"player_name": self.theirs}).status_code, 421)
+        self.assertNotIn(self.theirs, parkour_brain.brains.names())
+        key = base64.b64encode(voxel_codec.encode_frame(flat_grid(), (0, 64, 0), 16, 4, self.mine, seq=1)).decode()
+        self.assertEqual(self.client.post("/v1/mc/tick", json={"player": self.mine, "frame": key}).json()["frame"], "ok")
+
+    def test_worker_0_thinks_and_sends_targets_to_the_owner(self):
+        self.patch(server, "addressee", server.AddresseeClassifier(threshold=0))
+        server.game_state["players"] = [{"name": "Steve", "location": {"x": -8, "y": 64, "z": 0}, "tags": {}}]
+        # Worker 0 decides for a bot it does not serve: the target waits on the bus for the owner
+        server._apply_agent(self.theirs, {"action": "attack", "target": "Steve"})
+        self.assertNotIn(self.theirs, parkour_brain.brains.names())
+        self.patch(server, "WORKER_INDEX", 1)
+        key = base64.b64encode(voxel_codec.encode_frame(flat_grid(), (0, 64, 0), 16, 4, self.theirs, seq=1)).decode()
+        self.client.post("/v1/mc/tick", json={"player": self.theirs, "frame": key})
+        self.assertEqual(parkour_brain.brains.get(self.theirs).target_player, "Steve")
+        # Its position is shared for worker 0's prompts and fast path
+        self.assertEqual(server.game_state["bots"][self.theirs]["origin"], {"x": 0, "y": 64, "z": 0})
+
+        # Chat on worker 1 is passed to worker 0, which triggers the (single) think scheduler
+        async def relay():
+            with mock.patch.object(server.think_scheduler, "trigger") as trigger:
+                server._trigger_think("ねえ、どう思う?")
+                server.WORKER_INDEX = 0
+                task = asyncio.create_task(server._relay_thinks())
+                for _ in range(100):
+                    if trigger.called:
+                        break
+                    await asyncio.sleep(0.01)
+                task.cancel()
+                return trigger.call_args
+
+        self.assertEqual(asyncio.run(relay()), mock.call("player", server.AMBIENT))
+
+
+class TestCommandRouting(ServerTestCase):
+    def test_each_caller_gets_broadcast_plus_its_own_slice(self):
+        def pull(**params):
+            return [c.get("message", c.get("title")) for c in self.client.get("/v1/mc/commands", params=params).json()["commands"]]
+
+        self.assertEqual(pull(player="Steve", consumer="camera"), [])  # a consumer exists from its first pull
+        server.publish_command({"action": "title", "title": "all"})
+        server.publish_command({"action": "chat", "message": "to Bot1"}, player="Bot1")
+        server.publish_command({"action": "chat", "message": "to Bot2"}, player="Bot2")
+        server.publish_command({"action": "chat", "message": "nether"}, dimension="minecraft:nether")
+        self.assertEqual(pull(player="Bot1"), ["all", "to Bot1"])
+        self.assertEqual(pull(player="Bot2", dimension="minecraft:nether"), ["to Bot2", "nether"])
+        # Another controller has its own cursor on the broadcast topic, and sees nobody else's slice
+        self.assertEqual(pull(player="Steve", consumer="camera"), ["all"])
+        self.assertEqual(pull(player="Bot1"), [])
+
+    def test_tick_uses_the_dimension_of_its_frame(self):
+        server.publish_command({"action": "chat", "message": "nether"}, dimension="minecraft:nether")
+        key = voxel_codec.encode_frame(flat_grid(), (0, 64, 0), 16, 4, "Bot1", seq=1)
+        resp = self.client.post("/v1/mc/tick", json={"player": "Bot1", "frame": base64.b64encode(key).decode()})
+        self.assertEqual(resp.json()["commands"], [])  # the frame says overworld
+        resp = self.client.post("/v1/mc/tick", json={"player": "Bot1", "dimension": "minecraft:nether"})
+        self.assertEqual([c["message"] for c in resp.json()["commands"]], ["nether"])
+
+    def test_global_long_poll_sees_topics_created_while_it_waits(self):
+        self.patch(server, "COMMAND_TOPIC_RESCAN", 0.1)
+
+        async def run():
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+                poll = asyncio.create_task(c.get("/v1/mc/commands", params={"wait": 5}))
+                await asyncio.sleep(0.05)
+                t0 = time.monotonic()
+                server.publish_command({"action": "chat", "message": "to Steve"}, player="Steve")
+                resp = await poll
+                return resp.json()["commands"], time.monotonic() - t0
+
+        commands, elapsed = asyncio.run(run())
+        self.assertEqual([c["message"] for c in commands], ["to Steve"])
+        self.assertLess(elapsed, 1.0)
+
+
+class TestDiscordPull(ServerTestCase):
+    def test_unmute_requests_are_delivered_and_redelivered_until_acked(self):
+        self.client.post("/v1/discord/unmute", json={"mcName": "Steve"})
+        server.queue_action({"action": "chat", "message": "hi"})
+        first = self.client.post("/v1/discord/pull", json={"consumer": "voice"}).json()
+        self.assertEqual([e["type"] for e in first["events"]], ["unmute_request", "speak"])
+        again = self.client.post("/v1/discord/pull", json={"consumer": "voice"}).json()
+        self.assertEqual(again, first)
+        self.assertEqual(self.client.post("/v1/discord/pull", json={"consumer": "voice", "ack": first["cursor"]}).json(),
+                         {"events": [], "cursor": 2})
+
+    def test_long_poll_answers_when_an_event_arrives(self):
+        threading.Timer(0.1, server.queue_action, args=({"action": "chat", "message": "hi"},)).start()
+        t0 = time.monotonic()
+        resp = self.client.post("/v1/discord/pull", json={"consumer": "voice", "wait": 5}).json()
+        self.assertLess(time.monotonic() - t0, 1.0)
+        self.assertEqual(resp["events"], [{"type": "speak", "text": "hi", "id": 1}])
+        # Minecraft's long poll gets the chat command that was queued with it
+        self.assertEqual(self.client.get("/v1/mc/commands", params={"wait": 5}).json()["commands"],
+                         [{"action": "chat", "message": "hi", "id": 1}])
+
+    def test_pull_without_a_body_acks_on_delivery(self):
+        self.client.post("/v1/discord/unmute", json={"mcName": "Steve"})
+        self.assertEqual(len(self.client.post("/v1/discord/pull").json()["events"]), 1)
+        self.assertEqual(self.client.post("/v1/discord/pull").json()["events"], [])
+
+
+
+class TestThinkInBackground(ServerTestCase):
+    def test_endpoints_keep_serving_while_llm_thinks(self):
+        fake = FakeOpenAI([(0.3, '```json\n{"action": "chat", "message": "hi"}\n```')])
+        self.addCleanup(fake.stop)
+        self.patch(server, "llm", LLMClient(fake.url))
+        self.patch(server.think_scheduler, "debounce", 0.0)
+        report = {"players": [], "chats": [{"sender": "Steve", "message": "what do you think?"}]}
+
+        async def run():
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+                t0 = time.monotonic()
+                self.assertEqual((await c.post("/v1/report", json=report)).status_code, 200)
+                reported = time.monotonic() - t0
+                await asyncio.sleep(0.05)
+                t0 = time.monotonic()
+                for _ in range(5):
+                    self.assertEqual((await c.get("/v1/mc/commands")).status_code, 200)
+                polled = time.monotonic() - t0
+                done_while_polling = server.llm.completed > 0
+                await server.think_scheduler.drain()
+            await server.llm.aclose()
+            return reported, polled, done_while_polling
+
+        reported, polled, done_while_polling = asyncio.run(run())
+        self.assertFalse(done_while_polling)
+        # The model takes 0.3s; the report only enqueues, and polls keep answering
+        self.assertLess(reported, 0.2)
+        self.assertLess(polled, 0.2)
+        self.assertEqual(server.bus.pending("mc"), [{"action": "chat", "message": "hi"}])
+
+
+class TestStreamingThink(ServerTestCase):
+    def think(self, pieces):
+        fake = FakeOpenAI(pieces)
+        self.addCleanup(fake.stop)
+        self.patch(server, "llm", LLMClient(fake.url))
+
+        async def run():
+            t0 = time.monotonic()
+            action = await server.think("player")
+            elapsed = time.monotonic() - t0
+            await server.llm.aclose()
+            return action, elapsed
+
+        return (fake,) + asyncio.run(run())
+
+
+    def test_chat_is_spoken_before_reason_is_generated(self):
+        fake, action, elapsed = self.think([
+            (0.05, '```json\n{"action": "chat", "mess'), (0.05, 'age": "やあ、こんにちは"'),
+            (1.0, ', "reason": "挨拶されたので'), (0.0, '"}\n```')])
+        self.assertIsNone(action)  # already queued
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(server.bus.pending("mc"), [{"action": "chat", "message": "やあ、こんにちは"}])
+        self.assertEqual(server.bus.pending("discord"), [{"type": "speak", "text": "やあ、こんにちは"}])
+        self.assertEqual(fake.streams_finished, 0)  # the rest was never generated
+
+    def test_other_actions_wait_for_the_whole_object(self):
+        _, action, _ = self.think([(0.0, '{"action": "move", "tar'), (0.0, 'get": "Steve", "reason": "x"}')])
+        self.assertEqual(action, {"action": "move", "target": "Steve", "reason": "x"})
+        self.assertEqual(server.bus.pending("discord"), [])
+
+    def test_same_situation_reuses_the_decision(self):
+        server.game_state["players"] = [{"name": "Steve", "location": {"x": 10.2, "y": 64, "z": 5}, "tags": {}}]
+        fake, first, _ = self.think([(0.0, '{"action": "move", "target": "Steve", "reason": "x"}')])
+        server.game_state["players"][0]["location"]["x"] = 11.0  # jitter within the 4-block quantum
+
+        async def again():
+            return await server.think("player")
+
+        self.assertEqual(asyncio.run(again()), first)
+        self.assertEqual(len(fake.client_ports), 1)  # the model was called once
+        self.assertEqual((server.decision_cache.hits, server.decision_cache.misses), (1, 1))
+
+
+class TestAgentThink(ServerTestCase):
+    REPLY = ('{"Bot1": {"action": "chat", "message": "こんにちは"}, '
+             '"Bot2": {"action": "attack", "target": "Steve", "reason": "怪しい"}, "Bot3": {"action": "idle"}}')
+
+    def think(self, batch, delay=0.0):
+        fake = FakeOpenAI([(delay, self.REPLY)])
+        self.addCleanup(fake.stop)
+        self.patch(server, "llm", LLMClient(fake.url, max_concurrency=3))
+        self.patch(server, "THINK_BATCH", batch)
+        for bot in ("Bot1", "Bot2", "Bot3"):
+            parkour_brain.brains.get(bot)
+
+        async def run():
+            t0 = time.monotonic()
+            action = await server.think("player")
+            elapsed = time.monotonic() - t0
+            await server.llm.aclose()
+            return action, elapsed
+
+        action, elapsed = asyncio.run(run())
+        parkour_brain.brains.shutdown()  # target updates have landed
+        return fake, action, elapsed
+
+    def test_one_request_decides_every_bot(self):
+        fake, action, _ = self.think("multi")
+        self.assertIsNone(action)  # already routed to the bots
+        self.assertEqual(len(fake.client_ports), 1)
+        self.assertEqual(server.bus.pending("mc/player/Bot1"), [{"action": "chat", "message": "こんにちは", "player": "Bot1"}])
+        self.assertEqual(server.bus.pending("mc/player/Bot2"),
+                         [{"action": "attack", "target": "Steve", "reason": "怪しい", "player": "Bot2"}])
+        self.assertEqual(server.bus.topics("mc/"), ["mc/player/Bot1", "mc/player/Bot2"])
+        self.assertEqual(parkour_brain.brains.get("Bot2").target_player, "Steve")
+        self.assertEqual(server.bus.pending("discord"), [{"type": "speak", "text": "Bot1「こんにちは」"}])
+        # Each bot's tick picks up only its own commands
+        self.assertEqual(server._drain_commands("Bot2"),
+                         [{"action": "attack", "target": "Steve", "reason": "怪しい", "player": "Bot2", "id": 1}])
+        self.assertEqual(server.bus.pending("mc/player/Bot2"), [])
+        self.assertEqual(len(server.bus.pending("mc/player/Bot1")), 1)
+
+    def test_chasing_a_target_does_not_keep_retaliating(self):
+        server.game_state["players"] = [{"name": "Steve", "location": {"x": 0, "y": 64, "z": 0}, "tags": {}}]
+        self.think("multi")
+        self.assertEqual(parkour_brain.brains.get("Bot2").target_player, "Steve")
+        self.assertEqual(server._situation("player").attackers, [])
+
+        # So the next think goes back to the model (or the cache) instead of the fast path
+        self.assertEqual(server.fast_path.decide(server._situation("player")), (None, None))
+
+    def test_concurrent_requests_share_the_llm_slots(self):
+        fake, _, elapsed = self.think("concurrent", delay=0.3)
+        self.assertEqual(len(fake.client_ports), 3)
+        self.assertEqual(sorted(server.bus.topics("mc/")), ["mc/player/Bot1", "mc/player/Bot2"])
+        self.assertLess(elapsed, 0.6)  # three 0.3s calls at once, not 0.9s in a row
+
+
+class TestJournalRecovery(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        journal = self.patch(server, "journal", Journal(self.dir, checkpoint=server._checkpoint))
+        journal.open()
+        self.addCleanup(journal.close)
+        server.bus = server.EventBus(journal=journal)
+
+    def restart(self):
+        server.journal.close()
+        server.game_state.clear()
+        server.game_state.update(chat_history=ChatHistory(), players=[])
+        server.gm.state = GameState()
+        server.bus = server.EventBus()
+        replay(Journal(self.dir).recover(), server.RECOVERY_HANDLERS)
+
+    def test_state_and_undelivered_events_survive_a_restart(self):
+        self.client.post("/v1/game/config", json={"roles": {"werewolf": 1}})
+        server.gm.add_player("Steve")
+        self.client.post("/v1/game/start")
+        player = {"name": "Steve", "location": {"x": 0, "y": 64, "z": 0}, "tags": {}}
+        self.client.post("/v1/report", json={"players": [player], "chats": [{"sender": "Steve", "message": "おつかれ"}]})
+        delivered = self.client.post("/v1/discord/pull", json={"consumer": "voice"}).json()
+        self.client.post("/v1/discord/pull", json={"consumer": "voice", "ack": delivered["cursor"] - 1})
+        self.restart()
+
+        self.assertEqual(list(server.game_state["chat_history"].turns), [{"sender": "Steve", "message": "おつかれ"}])
+        self.assertEqual(server.game_state["players"][0]["name"], "Steve")
+        self.assertEqual(server.game_state["role_config"], {"werewolf": 1})
+        self.assertEqual(server.gm.state.players["Steve"].role, "werewolf")
+        # Only the last Discord event was not acked by the voice bot; it comes again with the same id
+        events = self.client.post("/v1/discord/pull", json={"consumer": "voice"}).json()["events"]
+        self.assertEqual(events, [dict(delivered["events"][-1])])
+
+
+class TestVoxelDebug(ServerTestCase):
+    def test_latest_and_history_come_from_memory(self):
+        server.snapshot_ring = server.SnapshotRing(size=4)  # put back by ServerTestCase
+        grid = flat_grid()
+        for x in range(6):
+            grid[8, 0, 0] = x
+            self.client.post("/v1/mc/state", json=snapshot("Bot1", (x, 64, 0), grid))
+
+        latest = self.client.get("/v1/debug/voxel", params={"player_name": "Bot1"}).json()
+        self.assertEqual((latest["origin"]["x"], latest["grid"][8 * 33 * 33]), (5, 5))
+        history = self.client.get("/v1/debug/voxel/history", params={"player_name": "Bot1", "limit": 10}).json()
+        self.assertEqual([s["origin"]["x"] for s in history["snapshots"]], [2, 3, 4, 5])
+        self.assertEqual([s["grid"][8 * 33 * 33] for s in history["snapshots"]], [2, 3, 4, 5])
+        self.assertEqual(self.client.get("/v1/debug/voxel", params={"player_name": "Nobody"}).json(),
+                         {"error": "no data"})
+
+
+class TestBrainRegistry(unittest.TestCase):
+    def test_bots_run_in_parallel_but_each_bot_in_order(self):
+        registry = BrainRegistry(max_workers=4)
+        self.addCleanup(registry.shutdown)
+        both_running = threading.Barrier(2, timeout=5)
+        # Two bots can only pass the barrier together if they run concurrently
+        futures = [registry.submit(name, lambda brain: both_running.wait()) for name in ("A", "B")]
+        for f in futures:
+            f.result(timeout=5)
+
+        active, overlap = [0], [False]
+
+        def work(brain):
+            active[0] += 1
+            overlap[0] |= active[0] > 1
+            threading.Event().wait(0.01)
+            active[0] -= 1
+
+        for f in [registry.submit("A", work) for _ in range(4)]:
+            f.result(timeout=5)
+        self.assertFalse(overlap[0])
+
+    def test_idle_and_least_recently_used_brains_are_dropped(self):
+        registry = BrainRegistry(max_workers=1, max_brains=2, idle_ttl=60)
+        self.addCleanup(registry.shutdown)
+        registry.run("A", lambda brain: None)
+        registry.run("B", lambda brain: None)
+        registry.run("A", lambda brain: None)
+        registry.get("C")  # over max_brains: B was used least recently
+        self.assertEqual(sorted(registry.names()), ["A", "C"])
+
+        registry.idle_ttl = 0.0
+        time.sleep(0.01)
+        self.assertEqual(sorted(registry.evict_idle()), ["A", "C"])
+        self.assertTrue(registry.get("A", create=False) is None and registry.evicted == 3)
+        self.assertFalse(registry.remove("A"))
+
+
+if __name__ == '__main__':
+    unittest.main()
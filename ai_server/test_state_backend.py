@@ -0,0 +1,143 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+
+from prompt_builder import ChatHistory
+from state_backend import InProcessBackend, SharedState, SqliteBackend
+
+
+def _load_chat(state):
+    history = ChatHistory()
+    history.load(state)
+    return history
+
+
+def _say_hi(history):
+    history.append({"sender": "Steve", "message": "hi"})
+    return history
+
+
+def _increment(path, n):
+    db = SqliteBackend(path)
+    for _ in range(n):
+        db.update("count", lambda v: v + 1, 0)
+
+
+class BackendContract:
+    """Runs against both backends; make() returns a fresh one"""
+
+    def test_values_and_shared_state(self):
+        db = self.make()
+        state = SharedState(db)
+        state["players"] = [{"name": "Steve"}]
+        state.setdefault("players", [])
+        self.assertEqual(state["players"], [{"name": "Steve"}])
+        self.assertIs(state["players"], state["players"])  # unchanged values are not decoded again
+        self.assertEqual(state.get("ai_mode", "gm"), "gm")
+        del state["players"]
+        self.assertNotIn("players", state)
+
+    def test_update_is_atomic_across_threads(self):
+        db = self.make()
+        threads = [threading.Thread(target=lambda: [db.update("n", lambda v: v + 1, 0) for _ in range(50)])
+                   for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(db.get("n"), 200)
+
+    def test_bus_redelivers_until_acked(self):
+        bus = self.make().bus
+        for n in range(3):
+            bus.publish("discord", {"n": n})
+        events, cursor = bus.pull("discord", "voice", limit=2)
+        self.assertEqual(([e["n"] for e in events], cursor), ([0, 1], 2))
+        self.assertEqual([e["id"] for e in bus.pull("discord", "voice", ack=2)[0]], [3])
+        self.assertEqual(bus.pending("discord"), [{"n": 2}])
+        self.assertEqual([e["n"] for e in bus.drain("discord", "voice")], [2])
+        self.assertEqual(bus.topics("disc"), ["discord"])
+
+
+class TestInProcessBackend(BackendContract, unittest.TestCase):
+    def make(self):
+        return InProcessBackend()
+
+
+class TestSqliteBackend(BackendContract, unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "state.db")
+
+    def make(self):
+        return SqliteBackend(self.path)
+
+    def test_workers_share_values_and_events(self):
+        a, b = self.make(), self.make()  # two workers on one database
+        for db in (a, b):
+            db.codec("chat_history", ChatHistory.dump, _load_chat)
+        a.set("chat_history", ChatHistory())
+        b.update("chat_history", _say_hi)
+        self.assertEqual(a.get("chat_history").recent(1), [{"sender": "Steve", "message": "hi"}])
+
+        async def wait():
+            return await a.bus.pull_wait(["mc"], "minecraft", timeout=5, auto_ack=True)
+
+        async def run():
+            task = asyncio.create_task(wait())
+            await asyncio.sleep(0.1)
+            b.bus.publish("mc", {"action": "chat"})
+            return await task
+
+        self.assertEqual(asyncio.run(run())["mc"][0], [{"action": "chat", "id": 1}])
+        self.assertEqual(a.bus.waits, 1)
+
+    def test_threads_share_one_decoded_value_per_version(self):
+        db = self.make()
+        db.set("players", [{"name": "Steve"}])
+        seen = []
+        barrier = threading.Barrier(8)
+
+        def read():
+            barrier.wait()
+            seen.append(db.get("players"))
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len({id(v) for v in seen}), 1)
+        self.assertIs(db.get("players"), seen[0])
+
+    def test_polls_that_do_not_move_the_cursor_do_not_write(self):
+        bus = self.make().bus
+        conn = bus.db._conn()
+        bus.publish("mc", {"n": 0})
+        self.assertEqual(len(bus.pull("mc", "minecraft", auto_ack=True)[0]), 1)
+        writes = conn.total_changes
+        for _ in range(5):
+            self.assertEqual(bus.pull("mc", "minecraft", auto_ack=True), ([], 1))
+        self.assertEqual(bus.pull("mc", "minecraft", ack=1), ([], 1))
+        self.assertEqual(conn.total_changes, writes)
+        bus.publish("mc", {"n": 1})
+        self.assertEqual(bus.drain("mc", "minecraft"), [{"n": 1, "id": 2}])
+        self.assertEqual(bus.pending("mc"), [])  # delivered rows are gone once the cursor moved
+
+    def test_update_is_atomic_across_processes(self):
+        self.make()
+        spawn = multiprocessing.get_context("spawn")  # as uvicorn starts its workers; SQLite connections must not cross a fork
+        procs = [spawn.Process(target=_increment, args=(self.path, 50)) for _ in range(3)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(30)
+        self.assertEqual(self.make().get("count"), 150)
+
+
+if __name__ == "__main__":
+    unittest.main()
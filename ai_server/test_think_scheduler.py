@@ -0,0 +1,98 @@
+import asyncio
+import unittest
+
+from think_scheduler import AMBIENT, MENTION, ThinkScheduler
+
+
+class Recorder:
+    """think() that reports the state it saw; each call can take a different time"""
+
+    def __init__(self, delays=()):
+        self.state = 0
+        self.delays = list(delays)
+        self.active = self.max_active = 0
+        self.seen, self.applied = [], []
+
+    async def think(self, mode):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        seen = self.state
+        self.seen.append(seen)
+        await asyncio.sleep(self.delays.pop(0) if self.delays else 0)
+        self.active -= 1
+        return (mode, seen)
+
+    def apply(self, result):
+        self.applied.append(result)
+
+
+class TestThinkScheduler(unittest.TestCase):
+    def test_burst_becomes_one_think_on_newest_state(self):
+        rec = Recorder()
+        sched = ThinkScheduler(rec.think, rec.apply, debounce=0.05)
+
+        async def run():
+            for i in range(10):
+                rec.state = i
+                sched.trigger("player")
+            sched.trigger("gm")
+            await sched.drain()
+
+        asyncio.run(run())
+        self.assertEqual(sorted(rec.applied), [("gm", 9), ("player", 9)])
+        self.assertEqual((sched.triggers, sched.thinks, sched.coalesced), (11, 2, 9))
+
+    def test_in_flight_cap_and_max_wait(self):
+        rec = Recorder(delays=[0.5])
+        sched = ThinkScheduler(rec.think, rec.apply, debounce=0.05, max_wait=0.1)
+
+        async def run():
+            # A trigger every 30ms would debounce forever; max_wait forces a think
+            for i in range(10):
+                rec.state = i
+                sched.trigger("player")
+                await asyncio.sleep(0.03)
+            await sched.drain()
+
+        asyncio.run(run())
+        self.assertEqual(rec.max_active, 1)
+        self.assertEqual(sched.thinks, 2)  # the rest piled up behind the slow first think
+        self.assertEqual(rec.applied[-1], ("player", 9))
+
+    def test_older_result_is_dropped_when_a_newer_one_landed(self):
+        rec = Recorder(delays=[0.2, 0.0])
+        sched = ThinkScheduler(rec.think, rec.apply, debounce=0.0, max_in_flight=2, workers=2)
+
+        async def run():
+            sched.trigger("player")
+            await asyncio.sleep(0.05)
+            rec.state = 1
+            sched.trigger("player")
+            await sched.drain()
+
+        asyncio.run(run())
+        self.assertEqual(rec.seen, [0, 1])
+        self.assertEqual(rec.applied, [("player", 1)])
+        self.assertEqual(sched.superseded, 1)
+
+    def test_mentions_skip_debounce_and_jump_the_queue(self):
+        rec = Recorder(delays=[0.2])
+        sched = ThinkScheduler(rec.think, rec.apply, debounce=0.0, workers=1)
+
+        async def run():
+            sched.trigger("busy")  # occupies the only worker
+            await asyncio.sleep(0.05)
+            sched.trigger("ambient", AMBIENT)
+            sched.trigger("mentioned", MENTION)
+            await sched.drain()
+            sched.debounce = 10.0
+            sched.trigger("player", MENTION)
+            await asyncio.wait_for(sched.drain(), 1.0)
+
+        asyncio.run(run())
+        self.assertEqual([mode for mode, _ in rec.applied], ["busy", "mentioned", "ambient", "player"])
+        self.assertEqual(sched.mentions, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
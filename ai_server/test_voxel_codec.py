@@ -0,0 +1,102 @@
+import base64
+import unittest
+
+import numpy as np
+
+import voxel_codec
+from parkour_brain import ParkourBrain
+
+
+def make_grid(seed=0):
+    rng = np.random.default_rng(seed)
+    grid = np.zeros((9, 33, 33), dtype=np.uint8)
+    grid[:4] = 1
+    grid[4, 10:20, 5:9] = 2
+    grid[5] = rng.integers(0, 3, size=(33, 33))
+    return grid
+
+
+class TestVoxelCodec(unittest.TestCase):
+    def test_roundtrip_all_encodings(self):
+        grid = make_grid()
+        for enc in (voxel_codec.ENC_RAW, voxel_codec.ENC_PACKED2, voxel_codec.ENC_RLE):
+            body = voxel_codec.encode_frame(grid, (10, 64, -3), 16, 4, "Bot", seq=7, encoding=enc)
+            frame = voxel_codec.decode_body(base64.b64encode(body), is_base64=True)
+            cells = voxel_codec.decode_cells(frame)
+
+            self.assertEqual(cells.dtype, np.uint8)
+            self.assertTrue(np.array_equal(cells.reshape(grid.shape), grid), enc)
+            self.assertEqual(frame.origin, (10, 64, -3))
+            self.assertEqual(frame.player, "Bot")
+            self.assertEqual(frame.seq, 7)
+
+    def test_rle_long_runs(self):
+        cells = np.zeros(1000, dtype=np.uint8)
+        cells[600:] = 1
+        self.assertTrue(np.array_equal(voxel_codec.rle_decode(voxel_codec.rle_encode(cells), 1000), cells))
+
+    def test_snapshot_matches_json_shape(self):
+        grid = make_grid()
+        frame = voxel_codec.parse_frame(voxel_codec.encode_frame(grid, (0, 70, 0), 16, 4, "Bot"))
+        snap = voxel_codec.frame_to_snapshot(frame, voxel_codec.decode_cells(frame))
+        self.assertEqual((snap["width"], snap["height"]), (33, 9))
+        self.assertEqual(snap["origin"], {"x": 0, "y": 70, "z": 0})
+
+    def test_rejects_bad_frames(self):
+        body = voxel_codec.encode_frame(make_grid(), (0, 0, 0), 16, 4, "Bot")
+        with self.assertRaises(voxel_codec.VoxelDecodeError):
+            voxel_codec.parse_frame(b"XXXX" + body[4:])
+        with self.assertRaises(voxel_codec.VoxelDecodeError):
+            voxel_codec.decode_cells(voxel_codec.parse_frame(body[:-10]))
+        with self.assertRaises(voxel_codec.VoxelDecodeError):
+            voxel_codec.decode_body(b"not base64!!", is_base64=True)
+
+    def test_deltas_need_windows_that_fit_u16_indices(self):
+        # radius 42 / halfHeight 4: 85 * 85 * 9 = 65,025 cells; radius 43: 68,121
+        ok = voxel_codec.parse_frame(voxel_codec.encode_delta([65024], [1], (0, 0, 0), 42, 4, base_seq=1, seq=2))
+        self.assertEqual(voxel_codec.decode_delta(ok)[1].tolist(), [65024])
+        big = voxel_codec.parse_frame(voxel_codec.encode_delta([], [], (0, 0, 0), 43, 4, base_seq=1, seq=2))
+        with self.assertRaises(voxel_codec.VoxelDecodeError):
+            voxel_codec.decode_delta(big)
+        grid = np.zeros((9, 87, 87), dtype=np.uint8)
+        with self.assertRaises(ValueError):
+            voxel_codec.diff_frames(grid, (0, 0, 0), grid, (1, 0, 0))
+        # Keyframes of that size are fine
+        key = voxel_codec.parse_frame(voxel_codec.encode_frame(grid, (0, 0, 0), 43, 4, "Bot"))
+        self.assertEqual(voxel_codec.decode_cells(key).size, 68121)
+
+    def test_delta_rolls_brain_grid_in_place(self):
+        rng = np.random.default_rng(3)
+        world = rng.integers(0, 3, size=(9, 60, 60)).astype(np.uint8)
+        win = lambda x, z: np.ascontiguousarray(world[:, z - 16:z + 17, x - 16:x + 17])
+
+        brain = ParkourBrain()
+        frame = voxel_codec.parse_frame(voxel_codec.encode_frame(win(30, 30), (30, 64, 30), 16, 4, "Bot", seq=1))
+        brain.update_state(voxel_codec.frame_to_snapshot(frame, voxel_codec.decode_cells(frame)))
+        buf = brain.voxel_grid
+
+        prev, prev_o, seq = win(30, 30), (30, 64, 30), 1
+        for x, z in ((31, 30), (31, 28), (29, 29)):
+            o = (x, 64, z)
+            indices, values = voxel_codec.diff_frames(prev, prev_o, win(x, z), o)
+            body = voxel_codec.encode_delta(indices, values, o, 16, 4, base_seq=seq, seq=seq + 1, player="Bot")
+            frame = voxel_codec.parse_frame(body)
+            base_seq, indices, values = voxel_codec.decode_delta(frame)
+            self.assertTrue(brain.apply_delta(frame.origin, indices, values, frame.seq, base_seq))
+            self.assertTrue(np.array_equal(brain.voxel_grid, win(x, z)))
+            prev, prev_o, seq = win(x, z), o, seq + 1
+
+        self.assertIs(brain.voxel_grid, buf)
+        self.assertEqual(brain.origin, (29, 64, 29))
+
+    def test_delta_needs_matching_base(self):
+        brain = ParkourBrain()
+        self.assertFalse(brain.apply_delta((0, 0, 0), [], [], 2, 1))
+        brain.update_state({"width": 33, "height": 9, "radius": 16, "halfHeight": 4,
+                            "origin": {"x": 0, "y": 0, "z": 0}, "grid": [0] * 9801, "seq": 5})
+        self.assertFalse(brain.apply_delta((0, 0, 0), [], [], 7, 6))
+        self.assertTrue(brain.apply_delta((0, 0, 0), [], [], 6, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from voxel_recorder import SnapshotRing, VoxelRecorder, freeze, read_records
+
+
+def snapshot(seq, grid):
+    return {"player": {"name": "Bot", "dimension": "minecraft:overworld"}, "origin": {"x": seq, "y": 64, "z": 0},
+            "radius": 16, "halfHeight": 4, "width": 33, "height": 9, "seq": seq, "grid": grid}
+
+
+class TestSnapshotRing(unittest.TestCase):
+    def test_keeps_last_n_per_bot_as_copies(self):
+        ring = SnapshotRing(size=3)
+        grid = np.zeros((9, 33, 33), dtype=np.uint8)
+        for seq in range(5):
+            grid[0, 0, 0] = seq  # the brain's buffer is updated in place
+            ring.push("Bot", freeze(snapshot(seq, grid)))
+        ring.push("Other", freeze(snapshot(9, grid)))
+
+        snaps = ring.latest("Bot")
+        self.assertEqual([s["seq"] for s in snaps], [2, 3, 4])
+        self.assertEqual([int(s["grid"][0, 0, 0]) for s in snaps], [2, 3, 4])
+        self.assertEqual([s["seq"] for s in ring.latest("Bot", 2)], [3, 4])
+        self.assertEqual(ring.latest("Bot", 0), [])
+        self.assertEqual(len(ring.latest("Other")), 1)
+
+
+class TestVoxelRecorder(unittest.TestCase):
+    def test_batches_are_gzipped_and_read_back(self):
+        rng = np.random.default_rng(0)
+        grids = [rng.integers(0, 3, size=(9, 33, 33)).astype(np.uint8) for _ in range(5)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "rec.jsonl.gz")
+            recorder = VoxelRecorder(path, batch_size=2, flush_interval=60)
+            for seq, grid in enumerate(grids):
+                recorder.submit(freeze(snapshot(seq, grid)))
+            recorder.close()
+
+            records = list(read_records(path))
+            self.assertEqual(recorder.written, 5)
+            self.assertEqual([r["seq"] for r in records], [0, 1, 2, 3, 4])
+            for r, grid in zip(records, grids):
+                self.assertTrue(np.array_equal(r["grid"].reshape(grid.shape), grid))
+            self.assertLess(os.path.getsize(path), sum(g.size for g in grids))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+
+from parkour_brain import ParkourBrain
+from world_memory import WorldMemory, UNKNOWN, SECTION
+
+
+def snapshot(origin, grid, dimension="minecraft:overworld"):
+    return {"player": {"name": "Bot", "dimension": dimension},
+            "origin": {"x": origin[0], "y": origin[1], "z": origin[2]},
+            "radius": 16, "halfHeight": 4, "width": 33, "height": 9, "grid": grid}
+
+
+class TestWorldMemory(unittest.TestCase):
+    def test_merge_and_read_across_sections(self):
+        mem = WorldMemory()
+        rng = np.random.default_rng(0)
+        grid = rng.integers(0, 3, size=(9, 33, 33)).astype(np.uint8)
+        lo = (-20, 60, 5)  # straddles negative chunk coords and a section boundary in Y
+        mem.merge("overworld", lo, grid)
+
+        self.assertTrue(np.array_equal(mem.read_region("overworld", lo, grid.shape), grid))
+        self.assertEqual(mem.get("overworld", -20 + 7, 60 + 2, 5 + 30), grid[2, 30, 7])
+
+        # Outside what was seen, and other dimensions, read as unknown
+        self.assertEqual(mem.get("overworld", 100, 60, 5), UNKNOWN)
+        self.assertEqual(mem.get("nether", -20, 60, 5), UNKNOWN)
+        around = mem.read_region("overworld", (-21, 60, 5), (1, 1, 2))
+        self.assertEqual(around.tolist(), [[[UNKNOWN, grid[0, 0, 0]]]])
+
+    def test_lru_eviction_respects_cap(self):
+        mem = WorldMemory(max_bytes=4 * SECTION ** 3)
+        block = np.ones((1, 1, 1), dtype=np.uint8)
+        for i in range(4):
+            mem.merge("d", (i * SECTION, 0, 0), block)
+        mem.read_region("d", (0, 0, 0), (1, 1, 1))  # touch section 0
+        mem.merge("d", (4 * SECTION, 0, 0), block)
+
+        self.assertEqual(len(mem.sections), 4)
+        self.assertEqual(mem.evictions, 1)
+        self.assertEqual(mem.get("d", 0, 0, 0), 1)
+        self.assertEqual(mem.get("d", SECTION, 0, 0), UNKNOWN)
+
+    def test_brain_remembers_blocks_outside_window(self):
+        brain = ParkourBrain()
+        flat = np.zeros((9, 33, 33), dtype=np.uint8)
+        flat[:4] = 1  # floor at y = -1
+        brain.update_state(snapshot((0, 64, 0), flat))
+        self.assertTrue(brain._is_standable(10, 0, 0))
+
+        # Walk 20 blocks east: (-10, 0, 0) is now outside the window but remembered
+        brain.update_state(snapshot((20, 64, 0), flat))
+        self.assertTrue(brain._is_standable(-10, 0, 0))
+        self.assertFalse(brain._is_standable(-40, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
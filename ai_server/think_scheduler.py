@@ -0,0 +1,161 @@
+"""
+Coalescing scheduler and background workers for LLM "thinking".
+
+Handlers call trigger(mode) and return immediately; they never wait on the
+model. Triggers for a mode are debounced: the think becomes ready `debounce`
+seconds after the last trigger, and never later than `max_wait` seconds after
+the first one. Every trigger in that window becomes one think, which reads
+the newest game state when it runs.
+
+Ready thinks go into a priority queue that `workers` background tasks serve.
+A direct mention (priority MENTION) skips the debounce and is served before
+ambient chat. Results are handed to `apply` as soon as each think finishes
+(awaited, if apply returns an awaitable).
+
+At most `max_in_flight` thinks per mode are queued or running at once.
+Triggers that arrive while the mode is at its cap wait in the next batch. If
+a newer think of the same mode finishes first, the older result is stale and
+is dropped instead of applied.
+
+Like LLMClient, the scheduler follows the event loop it is used from.
+"""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+MENTION = 0
+AMBIENT = 1
+
+
+@dataclass
+class _ModeState:
+    pending: int = 0  # triggers waiting for the next think
+    priority: int = AMBIENT  # best priority among them
+    first_at: float = 0.0
+    deadline: float = 0.0
+    in_flight: int = 0  # queued or running
+    dispatched: int = 0  # seq of the last think queued
+    applied: int = 0  # seq of the newest think whose result was applied
+    runner: Optional[asyncio.Task] = None
+    wake: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class ThinkScheduler:
+    def __init__(self, think: Callable[[str], Awaitable[Any]], apply: Callable[[Any], Optional[Awaitable[None]]],
+                 debounce: float = 0.5, max_wait: float = 2.0, max_in_flight: int = 1, workers: int = 1):
+        self.think = think
+        self.apply = apply
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.max_in_flight = max_in_flight
+        self.workers = workers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._modes: Dict[str, _ModeState] = {}
+        self._ready: Optional[asyncio.PriorityQueue] = None
+        self._order = itertools.count()  # FIFO within a priority
+        self._tasks: Set[asyncio.Task] = set()
+        self.triggers = 0
+        self.mentions = 0
+        self.thinks = 0
+        self.coalesced = 0  # triggers merged into another trigger's think
+        self.superseded = 0  # finished thinks dropped because a newer one already applied
+        self.failures = 0
+
+    def _state(self, mode: str) -> _ModeState:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._modes = {}
+            self._tasks = set()
+            self._ready = asyncio.PriorityQueue()
+            for _ in range(self.workers):
+                self._spawn(self._worker())
+        st = self._modes.get(mode)
+        if st is None:
+            st = self._modes[mode] = _ModeState()
+        return st
+
+    def trigger(self, mode: str, priority: int = AMBIENT):
+        """Request a think for `mode`; returns immediately"""
+        st = self._state(mode)
+        now = time.monotonic()
+        self.triggers += 1
+        if st.pending == 0:
+            st.first_at = now
+            st.priority = priority
+        st.pending += 1
+        st.priority = min(st.priority, priority)
+        if priority == MENTION:
+            self.mentions += 1
+        if st.priority == MENTION:
+            st.deadline = now  # answer a mention right away, with whatever else is pending
+        else:
+            st.deadline = min(now + self.debounce, st.first_at + self.max_wait)
+        st.wake.set()
+        if st.runner is None:
+            st.runner = self._spawn(self._run(mode, st))
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, mode: str, st: _ModeState):
+        """Moves the mode's batch into the ready queue once it is due and under the cap"""
+        try:
+            while st.pending:
+                wait = st.deadline - time.monotonic()
+                if wait > 0 or st.in_flight >= self.max_in_flight:
+                    st.wake.clear()
+                    try:
+                        await asyncio.wait_for(st.wake.wait(), wait if wait > 0 else None)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                self.thinks += 1
+                self.coalesced += st.pending - 1
+                st.pending = 0
+                st.in_flight += 1
+                st.dispatched += 1
+                self._ready.put_nowait((st.priority, next(self._order), mode, st.dispatched))
+        finally:
+            st.runner = None
+
+    async def _worker(self):
+        while True:
+            _, _, mode, seq = await self._ready.get()
+            st = self._modes[mode]
+            try:
+                result = await self.think(mode)
+                if seq < st.applied:
+                    self.superseded += 1
+                elif result is not None:
+                    st.applied = seq
+                    applied = self.apply(result)
+                    if inspect.isawaitable(applied):
+                        await applied
+            except Exception as e:
+                self.failures += 1
+                print(f"Think failed ({mode}): {e!r}")
+            finally:
+                st.in_flight -= 1
+                st.wake.set()
+                self._ready.task_done()
+
+    async def drain(self):
+        """Wait until nothing is pending, queued or running (tests, shutdown)"""
+        while any(st.pending or st.in_flight for st in self._modes.values()):
+            await asyncio.sleep(0.01)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"triggers": self.triggers, "mentions": self.mentions, "thinks": self.thinks,
+                "coalesced": self.coalesced, "superseded": self.superseded, "failures": self.failures,
+                "queued": self._ready.qsize() if self._ready else 0,
+                "pending": {m: st.pending for m, st in self._modes.items()},
+                "in_flight": {m: st.in_flight for m, st in self._modes.items()}}
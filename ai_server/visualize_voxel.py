@@ -1,24 +1,45 @@
 import json
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import time
 import os
 
-def visualize():
-    file_path = "latest_voxel.json"
-    
-    if not os.path.exists(file_path):
-        print("Waiting for data...")
-        return
+import requests
+
+SERVER_URL = os.getenv("AI_SERVER_URL", "http://127.0.0.1:8082")
+
+def load_snapshot(source=None):
+    """
+    Latest snapshot from the server (/v1/debug/voxel), or the last record of a
+    VoxelRecorder file (VOXEL_RECORD_PATH) when a .gz path is given.
+    """
+    if source and source.endswith(".gz"):
+        from voxel_recorder import read_records
+        if not os.path.exists(source):
+            return None
+        last = None
+        for last in read_records(source):
+            pass
+        return last
 
+    params = {"player_name": source} if source else None
+    resp = requests.get(f"{SERVER_URL}/v1/debug/voxel", params=params, timeout=5)
+    data = resp.json()
+    return None if "error" in data else data
+
+def visualize(source=None):
     try:
-        with open(file_path, "r") as f:
-            data = json.load(f)
+        data = load_snapshot(source)
     except Exception as e:
         print(f"Read error: {e}")
         return
 
+    if data is None:
+        print("Waiting for data...")
+        return
+
     grid_flat = data["grid"]
     width = data["width"]
     height = data["height"]
@@ -101,4 +122,5 @@ def visualize():
     plt.show()
 
 if __name__ == "__main__":
-    visualize()
+    # python visualize_voxel.py [player_name | voxel_record.jsonl.gz]
+    visualize(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,285 @@
+"""
+Compact binary encoding for voxel snapshots (/v1/mc/state/packed).
+
+The JSON snapshot carries ~9,800 ints per frame and every one of them goes
+through pydantic. This format carries the same grid as 2-bit cells (or RLE)
+behind a small fixed header and decodes straight into a uint8 ndarray.
+
+Layout (little-endian):
+
+    magic      4s   b"VXS1"
+    kind       B    FRAME_KEY | FRAME_DELTA
+    encoding   B    ENC_RAW | ENC_PACKED2 | ENC_RLE
+    radius     B
+    halfHeight B
+    origin     3i   x, y, z (block coords, floored)
+    seq        I    per-player frame counter (stale frames are dropped)
+    name       B + utf-8 bytes
+    dimension  B + utf-8 bytes
+    payload    ...  rest of the body
+
+Delta frames (FRAME_DELTA) carry the new origin in the header and this payload:
+
+    base_seq   I    seq of the frame the delta applies to
+    count      I
+    indices    count * H   flat cell indices in the new window
+    values     count * B
+
+The receiver shifts its previous grid by the origin change (cells entering
+the window become 0) and then writes `values` at `indices`. If base_seq is
+not the frame it holds, it answers 409 and the client sends a keyframe.
+Indices are u16, so deltas only exist for windows of at most
+MAX_DELTA_CELLS cells (radius 16 / halfHeight 4 is 9,801). Larger windows
+are sent as keyframes only, and a delta for one fails to decode.
+
+Cell values are the same as main.js encodeBlockToVoxelValue (0 air / 1 solid
+/ 2 liquid), so 2 bits per cell is enough.
+"""
+from __future__ import annotations
+
+import base64
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+
+MAGIC = b"VXS1"
+FRAME_KEY = 0
+FRAME_DELTA = 1
+
+ENC_RAW = 0      # 1 byte per cell
+ENC_PACKED2 = 1  # 4 cells per byte, first cell in the low bits
+ENC_RLE = 2      # (count u8, value u8) pairs
+
+_HEADER = struct.Struct("<4sBBBB3iI")
+_DELTA_HEADER = struct.Struct("<II")
+MAX_DELTA_CELLS = 1 << 16  # u16 cell indices
+
+
+class VoxelDecodeError(ValueError):
+    pass
+
+
+@dataclass
+class PackedFrame:
+    kind: int
+    encoding: int
+    radius: int
+    half_height: int
+    origin: tuple
+    seq: int
+    player: str
+    dimension: str
+    payload: memoryview
+
+    @property
+    def width(self) -> int:
+        return 2 * self.radius + 1
+
+    @property
+    def height(self) -> int:
+        return 2 * self.half_height + 1
+
+    @property
+    def cell_count(self) -> int:
+        return self.width * self.width * self.height
+
+
+def pack2(cells: np.ndarray) -> bytes:
+    """uint8 cells (0-3) -> 2-bit packed bytes"""
+    flat = np.ascontiguousarray(cells, dtype=np.uint8).ravel()
+    pad = (-flat.size) % 4
+    if pad:
+        flat = np.concatenate([flat, np.zeros(pad, dtype=np.uint8)])
+    q = flat.reshape(-1, 4) & 3
+    return (q[:, 0] | (q[:, 1] << 2) | (q[:, 2] << 4) | (q[:, 3] << 6)).astype(np.uint8).tobytes()
+
+
+def unpack2(data, count: int) -> np.ndarray:
+    b = np.frombuffer(data, dtype=np.uint8)
+    if b.size * 4 < count:
+        raise VoxelDecodeError(f"packed payload too short: {b.size} bytes for {count} cells")
+    out = np.empty((b.size, 4), dtype=np.uint8)
+    for k in range(4):
+        np.right_shift(b, 2 * k, out=out[:, k])
+    out &= 3
+    return out.reshape(-1)[:count]
+
+
+def rle_encode(cells: np.ndarray) -> bytes:
+    flat = np.ascontiguousarray(cells, dtype=np.uint8).ravel()
+    if flat.size == 0:
+        return b""
+    # Run boundaries, then split runs longer than 255
+    edges = np.flatnonzero(np.diff(flat)) + 1
+    starts = np.concatenate([[0], edges])
+    lengths = np.diff(np.concatenate([starts, [flat.size]]))
+    values = flat[starts]
+    reps = (lengths + 254) // 255
+    out_vals = np.repeat(values, reps)
+    out_lens = np.full(out_vals.size, 255, dtype=np.int64)
+    last = np.cumsum(reps) - 1
+    out_lens[last] = lengths - (reps - 1) * 255
+    pairs = np.empty((out_vals.size, 2), dtype=np.uint8)
+    pairs[:, 0] = out_lens
+    pairs[:, 1] = out_vals
+    return pairs.tobytes()
+
+
+def rle_decode(data, count: int) -> np.ndarray:
+    pairs = np.frombuffer(data, dtype=np.uint8)
+    if pairs.size % 2:
+        raise VoxelDecodeError("RLE payload has odd length")
+    pairs = pairs.reshape(-1, 2)
+    cells = np.repeat(pairs[:, 1], pairs[:, 0])
+    if cells.size != count:
+        raise VoxelDecodeError(f"RLE payload expands to {cells.size} cells, expected {count}")
+    return cells
+
+
+def _read_str(buf: memoryview, off: int):
+    if off >= len(buf):
+        raise VoxelDecodeError("truncated header")
+    n = buf[off]
+    end = off + 1 + n
+    if end > len(buf):
+        raise VoxelDecodeError("truncated header")
+    return bytes(buf[off + 1:end]).decode("utf-8"), end
+
+
+def parse_frame(body: bytes) -> PackedFrame:
+    """Parse the header; the payload is left undecoded (zero-copy view)"""
+    buf = memoryview(body)
+    if len(buf) < _HEADER.size:
+        raise VoxelDecodeError("body shorter than header")
+    magic, kind, encoding, radius, half_height, ox, oy, oz, seq = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise VoxelDecodeError(f"bad magic {magic!r}")
+    name, off = _read_str(buf, _HEADER.size)
+    dimension, off = _read_str(buf, off)
+    return PackedFrame(
+        kind=kind,
+        encoding=encoding,
+        radius=radius,
+        half_height=half_height,
+        origin=(ox, oy, oz),
+        seq=seq,
+        player=name,
+        dimension=dimension,
+        payload=buf[off:],
+    )
+
+
+def decode_cells(frame: PackedFrame) -> np.ndarray:
+    """Payload -> flat uint8 grid (dy outer, dz, dx inner; same as the JSON grid)"""
+    count = frame.cell_count
+    if frame.encoding == ENC_RAW:
+        cells = np.frombuffer(frame.payload, dtype=np.uint8)
+        if cells.size != count:
+            raise VoxelDecodeError(f"raw payload has {cells.size} cells, expected {count}")
+        return cells
+    if frame.encoding == ENC_PACKED2:
+        return unpack2(frame.payload, count)
+    if frame.encoding == ENC_RLE:
+        return rle_decode(frame.payload, count)
+    raise VoxelDecodeError(f"unknown encoding {frame.encoding}")
+
+
+def decode_delta(frame: PackedFrame):
+    """Delta payload -> (base_seq, indices uint16, values uint8)"""
+    payload = frame.payload
+    if frame.cell_count > MAX_DELTA_CELLS:
+        raise VoxelDecodeError(f"{frame.cell_count} cells is too many for u16 delta indices (max {MAX_DELTA_CELLS})")
+    if len(payload) < _DELTA_HEADER.size:
+        raise VoxelDecodeError("truncated delta header")
+    base_seq, count = _DELTA_HEADER.unpack_from(payload, 0)
+    off = _DELTA_HEADER.size
+    if len(payload) != off + count * 3:
+        raise VoxelDecodeError(f"delta payload size mismatch for {count} cells")
+    indices = np.frombuffer(payload, dtype="<u2", count=count, offset=off)
+    values = np.frombuffer(payload, dtype=np.uint8, count=count, offset=off + count * 2)
+    if count and int(indices.max()) >= frame.cell_count:
+        raise VoxelDecodeError("delta index out of range")
+    return base_seq, indices, values
+
+
+def shifted(grid: np.ndarray, shift) -> np.ndarray:
+    """Copy of a (Y, Z, X) grid with new[i] = old[i + shift]; cells entering the window are 0"""
+    out = np.zeros_like(grid)
+    dst = tuple(slice(max(0, -d), min(n, n - d)) for d, n in zip(shift, grid.shape))
+    src = tuple(slice(max(0, d), min(n, n + d)) for d, n in zip(shift, grid.shape))
+    if all(s.start < s.stop for s in dst):
+        out[dst] = grid[src]
+    return out
+
+
+def diff_frames(prev_grid: np.ndarray, prev_origin, grid: np.ndarray, origin):
+    """Changed cells of `grid` against `prev_grid` moved to `origin` (what the receiver will hold)"""
+    if grid.size > MAX_DELTA_CELLS:
+        raise ValueError(f"{grid.size} cells is too many for a delta frame; send a keyframe")
+    shift = (origin[1] - prev_origin[1], origin[2] - prev_origin[2], origin[0] - prev_origin[0])
+    base = shifted(prev_grid, shift)
+    indices = np.flatnonzero(base.ravel() != grid.ravel())
+    return indices.astype("<u2"), grid.ravel()[indices].astype(np.uint8)
+
+
+def decode_body(body: bytes, is_base64: bool = False) -> PackedFrame:
+    if is_base64:
+        try:
+            body = base64.b64decode(body, validate=True)
+        except Exception as e:
+            raise VoxelDecodeError(f"bad base64: {e}") from e
+    return parse_frame(body)
+
+
+def frame_to_snapshot(frame: PackedFrame, grid: np.ndarray) -> dict:
+    """Same shape as VoxelSnapshot.dict(), with grid as an ndarray"""
+    ox, oy, oz = frame.origin
+    return {
+        "player": {"name": frame.player, "pos": {"x": ox, "y": oy, "z": oz}, "rot": None,
+                   "dimension": frame.dimension},
+        "origin": {"x": ox, "y": oy, "z": oz},
+        "radius": frame.radius,
+        "halfHeight": frame.half_height,
+        "width": frame.width,
+        "height": frame.height,
+        "grid": grid,
+        "seq": frame.seq,
+    }
+
+
+def _pack_header(kind, encoding, origin, radius, half_height, player, dimension, seq) -> bytes:
+    name_b = player.encode("utf-8")[:255]
+    dim_b = dimension.encode("utf-8")[:255]
+    header = _HEADER.pack(MAGIC, kind, encoding, radius, half_height,
+                          int(origin[0]), int(origin[1]), int(origin[2]), seq & 0xFFFFFFFF)
+    return b"".join([header, bytes([len(name_b)]), name_b, bytes([len(dim_b)]), dim_b])
+
+
+def encode_frame(grid, origin, radius: int, half_height: int, player: str = "",
+                 dimension: str = "minecraft:overworld", seq: int = 0,
+                 encoding: int = ENC_PACKED2) -> bytes:
+    """Reference keyframe encoder (tests / benchmarks; main.js has its own)"""
+    cells = np.asarray(grid, dtype=np.uint8).ravel()
+    if encoding == ENC_RAW:
+        payload = cells.tobytes()
+    elif encoding == ENC_PACKED2:
+        payload = pack2(cells)
+    elif encoding == ENC_RLE:
+        payload = rle_encode(cells)
+    else:
+        raise ValueError(f"unknown encoding {encoding}")
+    return _pack_header(FRAME_KEY, encoding, origin, radius, half_height, player, dimension, seq) + payload
+
+
+def encode_delta(indices, values, origin, radius: int, half_height: int, base_seq: int, seq: int,
+                 player: str = "", dimension: str = "minecraft:overworld") -> bytes:
+    """Reference delta encoder (see diff_frames)"""
+    indices = np.asarray(indices, dtype="<u2")
+    values = np.asarray(values, dtype=np.uint8)
+    return b"".join([
+        _pack_header(FRAME_DELTA, ENC_RAW, origin, radius, half_height, player, dimension, seq),
+        _DELTA_HEADER.pack(base_seq & 0xFFFFFFFF, indices.size),
+        indices.tobytes(),
+        values.tobytes(),
+    ])
@@ -0,0 +1,154 @@
+"""
+Snapshot history off the ingestion path.
+
+SnapshotRing keeps the last N snapshots of every bot in memory (for
+/v1/debug/voxel/history). VoxelRecorder is the opt-in disk output: ingestion
+only appends to a bounded queue, and a background thread batches records,
+gzips them and appends them to one file as JSON lines:
+
+    {"t": ..., "player": {...}, "origin": {...}, "radius": 16, "halfHeight": 4,
+     "width": 33, "height": 9, "seq": 12, "encoding": "packed2", "grid": "<base64>"}
+
+`grid` is voxel_codec.pack2 of the flat (Y, Z, X) grid. Each batch is its own
+gzip member, which gzip.open() reads back as one stream (see read_records).
+
+Enable with VOXEL_RECORD_PATH=voxel_record.jsonl.gz.
+"""
+from __future__ import annotations
+
+import base64
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+import numpy as np
+
+import voxel_codec
+
+DEFAULT_RING_SIZE = int(os.getenv("VOXEL_RING_SIZE", "32"))
+
+
+def freeze(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a brain snapshot that later in-place grid updates cannot touch"""
+    grid = snapshot.get("grid")
+    grid = np.array(grid, dtype=np.uint8) if grid is not None else None
+    return dict(snapshot, grid=grid, t=time.time())
+
+
+class SnapshotRing:
+    def __init__(self, size: int = DEFAULT_RING_SIZE):
+        self.size = size
+        self._rings: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def push(self, name: str, snapshot: Dict[str, Any]):
+        with self._lock:
+            ring = self._rings.get(name)
+            if ring is None:
+                ring = self._rings[name] = deque(maxlen=self.size)
+            ring.append(snapshot)
+
+    def latest(self, name: str, n: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Oldest first"""
+        with self._lock:
+            ring = list(self._rings.get(name, ()))
+        return ring if n is None else ring[max(0, len(ring) - n):]
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._rings)
+
+    def remove(self, name: str):
+        with self._lock:
+            self._rings.pop(name, None)
+
+
+def encode_record(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    record = {k: v for k, v in snapshot.items() if k != "grid"}
+    record["encoding"] = "packed2"
+    record["grid"] = base64.b64encode(voxel_codec.pack2(snapshot["grid"])).decode("ascii")
+    return record
+
+
+def decode_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Record -> snapshot dict with a flat uint8 grid"""
+    count = record["width"] * record["width"] * record["height"]
+    grid = voxel_codec.unpack2(base64.b64decode(record["grid"]), count)
+    return dict(record, grid=grid)
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield decode_record(json.loads(line))
+
+
+class VoxelRecorder:
+    """
+    Appends snapshots to a gzipped JSON-lines file from a background thread.
+    submit() never blocks: when the queue is full the snapshot is dropped and counted.
+    """
+
+    def __init__(self, path: str, max_queue: int = 256, batch_size: int = 64, flush_interval: float = 2.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="voxel-recorder", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls) -> Optional["VoxelRecorder"]:
+        path = os.getenv("VOXEL_RECORD_PATH")
+        return cls(path) if path else None
+
+    def submit(self, snapshot: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(snapshot)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0):
+        """Flush what is queued and stop the thread"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = False  # flush interval elapsed
+            if item:
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            if batch:
+                self._write(batch)
+                batch = []
+            if item is None:
+                return
+            deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        lines = "".join(json.dumps(encode_record(s)) + "\n" for s in batch)
+        try:
+            with open(self.path, "ab") as f:
+                f.write(gzip.compress(lines.encode("utf-8"), compresslevel=6))
+            self.written += len(batch)
+        except OSError as e:
+            print(f"VoxelRecorder: write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "written": self.written, "dropped": self.dropped,
+                "queued": self._queue.qsize()}
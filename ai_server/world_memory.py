@@ -0,0 +1,102 @@
+"""
+Sparse long-term voxel memory for ParkourBrain.
+
+Every snapshot window is merged into 16x16x16 uint8 sections keyed by
+(dimension, chunkX, chunkZ, sectionY), so blocks the bot has seen stay
+available after they leave the +-16 block sensor window. Sections are kept in
+LRU order and the oldest ones are evicted once the memory cap is reached.
+
+Section arrays use the same (Y, Z, X) axis order and cell values as the
+snapshot grid; never-seen cells are UNKNOWN.
+"""
+from __future__ import annotations
+
+import os
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import numpy as np
+
+SECTION = 16
+UNKNOWN = 3  # fits the 2-bit cell encoding (0 air / 1 solid / 2 liquid)
+
+SectionKey = Tuple[str, int, int, int]
+
+DEFAULT_MAX_BYTES = int(float(os.getenv("WORLD_MEMORY_MB", "64")) * 1024 * 1024)
+
+
+def _section_ranges(lo: int, hi: int):
+    """Yield (section index, start, stop) covering world coords [lo, hi)"""
+    s = lo // SECTION
+    while s * SECTION < hi:
+        a = max(lo, s * SECTION)
+        b = min(hi, (s + 1) * SECTION)
+        yield s, a, b
+        s += 1
+
+
+class WorldMemory:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_sections = max(1, max_bytes // SECTION ** 3)
+        self.sections: "OrderedDict[SectionKey, np.ndarray]" = OrderedDict()
+        self.evictions = 0
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.sections) * SECTION ** 3
+
+    def _section(self, key: SectionKey, create: bool):
+        sec = self.sections.get(key)
+        if sec is not None:
+            self.sections.move_to_end(key)
+        elif create:
+            sec = np.full((SECTION, SECTION, SECTION), UNKNOWN, dtype=np.uint8)
+            self.sections[key] = sec
+            while len(self.sections) > self.max_sections:
+                self.sections.popitem(last=False)
+                self.evictions += 1
+        return sec
+
+    def merge(self, dimension: str, lo, grid: np.ndarray):
+        """
+        Write a (Y, Z, X) grid whose [0, 0, 0] cell is world block `lo` = (x, y, z).
+        The grid overwrites whatever was remembered for those blocks.
+        """
+        h, d, w = grid.shape
+        x0, y0, z0 = lo
+        for sy, ya, yb in _section_ranges(y0, y0 + h):
+            for cz, za, zb in _section_ranges(z0, z0 + d):
+                for cx, xa, xb in _section_ranges(x0, x0 + w):
+                    sec = self._section((dimension, cx, cz, sy), create=True)
+                    sec[ya - sy * SECTION:yb - sy * SECTION,
+                        za - cz * SECTION:zb - cz * SECTION,
+                        xa - cx * SECTION:xb - cx * SECTION] = \
+                        grid[ya - y0:yb - y0, za - z0:zb - z0, xa - x0:xb - x0]
+
+    def read_region(self, dimension: str, lo, shape) -> np.ndarray:
+        """(Y, Z, X) array of `shape` starting at world block `lo`; unseen cells are UNKNOWN"""
+        h, d, w = shape
+        x0, y0, z0 = lo
+        out = np.full(shape, UNKNOWN, dtype=np.uint8)
+        for sy, ya, yb in _section_ranges(y0, y0 + h):
+            for cz, za, zb in _section_ranges(z0, z0 + d):
+                for cx, xa, xb in _section_ranges(x0, x0 + w):
+                    sec = self._section((dimension, cx, cz, sy), create=False)
+                    if sec is None:
+                        continue
+                    out[ya - y0:yb - y0, za - z0:zb - z0, xa - x0:xb - x0] = \
+                        sec[ya - sy * SECTION:yb - sy * SECTION,
+                            za - cz * SECTION:zb - cz * SECTION,
+                            xa - cx * SECTION:xb - cx * SECTION]
+        return out
+
+    def get(self, dimension: str, x: int, y: int, z: int) -> int:
+        key = (dimension, x // SECTION, z // SECTION, y // SECTION)
+        sec = self.sections.get(key)
+        if sec is None:
+            return UNKNOWN
+        return int(sec[y % SECTION, z % SECTION, x % SECTION])
+
+    def stats(self) -> Dict[str, int]:
+        return {"sections": len(self.sections), "bytes": self.nbytes,
+                "max_sections": self.max_sections, "evictions": self.evictions}
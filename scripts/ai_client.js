@@ -34,12 +34,14 @@ async function sendReport() {
 
     const players = world.getAllPlayers().map(p => {
         const tags = p.getTags();
-        const pubTags = tags.filter(t => t.startsWith("pub:"));
+        // ghost_spectator.js の "ghost" タグは接頭辞なしなので pub に含めて送る (ターゲット除外用)
+        const pubTags = tags.filter(t => t.startsWith("pub:") || t === "ghost");
         const secTags = tags.filter(t => t.startsWith("sec:"));
 
         return {
             name: p.name,
             location: { x: Math.floor(p.location.x), y: Math.floor(p.location.y), z: Math.floor(p.location.z) },
+            rotation: p.getRotation(), // {x: pitch, y: yaw} -> "見られている" 判定用
             tags: { pub: pubTags, sec: secTags }
         };
     });
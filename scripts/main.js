@@ -5,12 +5,40 @@ import "./bot_manager.js"; // GameTestの登録
 import "./camera_director.js"; // 自動撮影カメラマン
 import "./ghost_spectator.js"; // ハイブリッド観戦モード
 
+// ===== Server config =====
+const SERVER_HOST = "http://127.0.0.1";
+const SERVER_PORT = 8082; // Port 8082 as per server.py (PORT)
+// server.py の WORKERS と同じ値にする。ワーカー i は SERVER_PORT + i で待ち受け、
+// ボットごとの視界・動作・tick は botWorker(名前) のワーカーへ送る (チャットやコマンドはワーカー 0 へ)
+const SERVER_WORKERS = 1;
+const SERVER = `${SERVER_HOST}:${SERVER_PORT}`;
+
+// server.py の bot_worker と同じ: 名前のコードポイント列の FNV-1a (32bit) をワーカー数で割った余り
+function botWorker(name) {
+    let h = 0x811C9DC5;
+    for (const ch of name) {
+        h = Math.imul(h ^ ch.codePointAt(0), 0x01000193) >>> 0;
+    }
+    return h % SERVER_WORKERS;
+}
+
+function botServer(name) {
+    return `${SERVER_HOST}:${SERVER_PORT + botWorker(name)}`;
+}
+
 // ===== Voxel Sensor config =====
-const VOXEL_ENDPOINT = "http://127.0.0.1:8082/v1/mc/state"; // Port 8082 as per server.py
+const VOXEL_ENDPOINT = "/v1/mc/state"; // on botServer(bot)
+const VOXEL_PACKED_ENDPOINT = "/v1/mc/state/packed";
+const VOXEL_ENCODING = "packed"; // "json" (旧形式) or "packed" (2bit + base64, voxel_codec.py)
+const VOXEL_KEYFRAME_EVERY = 25; // packed: 差分フレームの間に挟むキーフレーム間隔 (25 = 5秒)
+const VOXEL_MAX_DELTA_CELLS = 65536; // 差分フレームの index は u16 なので、これより大きい窓はキーフレームのみ
 const VOXEL_RADIUS = 16;       // XZ 平面の半径
 const VOXEL_HALF_HEIGHT = 4;   // 上下の高さ
 const VOXEL_INTERVAL_TICKS = 4; // 何tickごとに送るか（4 = 0.2秒ごと）
 const AI_TAG = "ai";           // センサーを付けたいプレイヤーのタグ
+const BOT_ROSTER_INTERVAL_TICKS = 20; // AI ボットの一覧を送る間隔 (1秒)。一覧にないボットの視界はサーバーが受け取らない
+const TICK_ENDPOINT = "/v1/mc/tick"; // on botServer(bot)
+const USE_TICK_ENDPOINT = true; // true: 視界+イベント送信と動作+コマンド受信を /v1/mc/tick の1往復で (false: 旧エンドポイント個別)
 // ===============================
 
 // センサーロジック: ブロックIDを整数に変換
@@ -96,16 +124,179 @@ function buildVoxelSnapshotForPlayer(player) {
     };
 }
 
+// ===== Packed encoding (see ai_server/voxel_codec.py) =====
+const VOXEL_MAGIC = [0x56, 0x58, 0x53, 0x31]; // "VXS1"
+const FRAME_KEY = 0;
+const FRAME_DELTA = 1;
+const ENC_RAW = 0;
+const ENC_PACKED2 = 1;
+const voxelSeq = new Map(); // player name -> frame counter
+const voxelLastSent = new Map(); // player name -> { seq, origin, grid, sinceKey }
+const voxelNeedKey = new Set(); // players whose next frame must be a keyframe (server answered 409)
+
+function utf8Bytes(str) {
+    const out = [];
+    for (const ch of str) {
+        let c = ch.codePointAt(0);
+        if (c < 0x80) out.push(c);
+        else if (c < 0x800) out.push(0xc0 | (c >> 6), 0x80 | (c & 63));
+        else if (c < 0x10000) out.push(0xe0 | (c >> 12), 0x80 | ((c >> 6) & 63), 0x80 | (c & 63));
+        else out.push(0xf0 | (c >> 18), 0x80 | ((c >> 12) & 63), 0x80 | ((c >> 6) & 63), 0x80 | (c & 63));
+    }
+    return out.slice(0, 255);
+}
+
+const B64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/";
+function base64Encode(bytes) {
+    let out = "";
+    let i = 0;
+    for (; i + 2 < bytes.length; i += 3) {
+        const n = (bytes[i] << 16) | (bytes[i + 1] << 8) | bytes[i + 2];
+        out += B64[n >> 18] + B64[(n >> 12) & 63] + B64[(n >> 6) & 63] + B64[n & 63];
+    }
+    const rest = bytes.length - i;
+    if (rest === 1) {
+        const n = bytes[i] << 16;
+        out += B64[n >> 18] + B64[(n >> 12) & 63] + "==";
+    } else if (rest === 2) {
+        const n = (bytes[i] << 16) | (bytes[i + 1] << 8);
+        out += B64[n >> 18] + B64[(n >> 12) & 63] + B64[(n >> 6) & 63] + "=";
+    }
+    return out;
+}
+
+// header + 2bit cells (4 cells / byte, first cell in the low bits)
+function encodeVoxelSnapshot(snapshot, kind, encoding, payload) {
+    const name = utf8Bytes(snapshot.player.name);
+    const dim = utf8Bytes(snapshot.player.dimension);
+    const headerSize = 4 + 4 + 12 + 4;
+    const buf = new Uint8Array(headerSize + 1 + name.length + 1 + dim.length + payload.length);
+    const view = new DataView(buf.buffer);
+
+    const seq = nextVoxelSeq(snapshot.player.name);
+
+    buf.set(VOXEL_MAGIC, 0);
+    view.setUint8(4, kind);
+    view.setUint8(5, encoding);
+    view.setUint8(6, snapshot.radius);
+    view.setUint8(7, snapshot.halfHeight);
+    view.setInt32(8, snapshot.origin.x, true);
+    view.setInt32(12, snapshot.origin.y, true);
+    view.setInt32(16, snapshot.origin.z, true);
+    view.setUint32(20, seq, true);
+
+    let off = headerSize;
+    buf[off++] = name.length;
+    buf.set(name, off); off += name.length;
+    buf[off++] = dim.length;
+    buf.set(dim, off); off += dim.length;
+    buf.set(payload, off);
+    return { seq, body: base64Encode(buf) };
+}
+
+function nextVoxelSeq(name) {
+    const seq = ((voxelSeq.get(name) ?? 0) + 1) >>> 0;
+    voxelSeq.set(name, seq);
+    return seq;
+}
+
+// 前回送信したグリッドを原点移動分ずらしたものと比較し、変わったセルだけ返す
+// (ずらして外から入ってきたセルは 0 扱い; サーバー側 ParkourBrain.apply_delta と同じ)
+function diffVoxelGrid(prev, snapshot) {
+    const w = snapshot.width;
+    const h = snapshot.height;
+    const sx = snapshot.origin.x - prev.origin.x;
+    const sy = snapshot.origin.y - prev.origin.y;
+    const sz = snapshot.origin.z - prev.origin.z;
+    const indices = [];
+    const values = [];
+    let idx = 0;
+    for (let iy = 0; iy < h; iy++) {
+        const py = iy + sy;
+        for (let iz = 0; iz < w; iz++) {
+            const pz = iz + sz;
+            for (let ix = 0; ix < w; ix++, idx++) {
+                const px = ix + sx;
+                const old = (py >= 0 && py < h && pz >= 0 && pz < w && px >= 0 && px < w)
+                    ? prev.grid[(py * w + pz) * w + px] : 0;
+                if (old !== snapshot.grid[idx]) {
+                    indices.push(idx);
+                    values.push(snapshot.grid[idx]);
+                }
+            }
+        }
+    }
+    return { indices, values };
+}
+
+function encodeVoxelDelta(snapshot, prev, diff) {
+    const n = diff.indices.length;
+    const payload = new Uint8Array(8 + n * 3);
+    const view = new DataView(payload.buffer);
+    view.setUint32(0, prev.seq, true);
+    view.setUint32(4, n, true);
+    for (let i = 0; i < n; i++) {
+        view.setUint16(8 + i * 2, diff.indices[i], true);
+        payload[8 + n * 2 + i] = diff.values[i];
+    }
+    return encodeVoxelSnapshot(snapshot, FRAME_DELTA, ENC_RAW, payload);
+}
+
+// キーフレーム or 差分フレームを選んでエンコード
+function encodePackedFrame(snapshot) {
+    const name = snapshot.player.name;
+    const prev = voxelLastSent.get(name);
+    let frame = null;
+    let sinceKey = 0;
+
+    if (prev && !voxelNeedKey.has(name) && prev.sinceKey < VOXEL_KEYFRAME_EVERY
+        && prev.grid.length === snapshot.grid.length && snapshot.grid.length <= VOXEL_MAX_DELTA_CELLS) {
+        const diff = diffVoxelGrid(prev, snapshot);
+        // 変化が多すぎる (テレポート等) ならキーフレームの方が小さい
+        if (diff.indices.length * 3 < snapshot.grid.length / 4) {
+            frame = encodeVoxelDelta(snapshot, prev, diff);
+            sinceKey = prev.sinceKey + 1;
+        }
+    }
+    if (!frame) {
+        frame = encodeVoxelSnapshot(snapshot, FRAME_KEY, ENC_PACKED2, pack2(snapshot.grid));
+        voxelNeedKey.delete(name);
+    }
+
+    voxelLastSent.set(name, { seq: frame.seq, origin: snapshot.origin, grid: snapshot.grid, sinceKey });
+    return frame.body;
+}
+
+function pack2(grid) {
+    const out = new Uint8Array(Math.ceil(grid.length / 4));
+    for (let i = 0; i < grid.length; i++) {
+        out[i >> 2] |= (grid[i] & 3) << ((i & 3) * 2);
+    }
+    return out;
+}
+
 // センサーロジック: 送信
 function postVoxelSnapshot(snapshot) {
-    const req = new HttpRequest(VOXEL_ENDPOINT);
+    const endpoint = VOXEL_ENCODING === "packed" ? VOXEL_PACKED_ENDPOINT : VOXEL_ENDPOINT;
+    const req = new HttpRequest(botServer(snapshot.player.name) + endpoint);
     req.method = HttpRequestMethod.Post;
-    req.headers = [["Content-Type", "application/json"]];
-    req.body = JSON.stringify(snapshot);
+    if (VOXEL_ENCODING === "packed") {
+        req.headers = [["Content-Type", "text/plain"]];
+        req.body = encodePackedFrame(snapshot);
+    } else {
+        req.headers = [["Content-Type", "application/json"]];
+        req.body = JSON.stringify(snapshot);
+    }
 
+    const name = snapshot.player.name;
     http
         .request(req)
+        .then((resp) => {
+            // 409 = サーバーが差分の基準フレームを持っていない / それ以外の失敗も念のため
+            if (resp.status !== 200) voxelNeedKey.add(name);
+        })
         .catch((err) => {
+            voxelNeedKey.add(name);
             // 頻繁に出るとうるさいのでwarn程度に
             // console.warn("[VoxelSensor] HTTP request failed", err);
         });
@@ -115,11 +306,32 @@ function postVoxelSnapshot(snapshot) {
 // 定期実行ループ
 let tickCounter = 0;
 
+const COMMAND_POLL_WAIT = 20; // /v1/mc/commands long-poll seconds
+let commandPollInFlight = false;
+let commandPollRetryAt = 0; // after a failed long-poll, wait a second before the next one
+const pendingBotEvents = new Map(); // bot name -> events to send with its next tick
+
 system.runInterval(() => {
     tickCounter++;
 
+    // 0. AI Bot Roster (every second, from the first tick): the server only keeps brains for these bots
+    if (tickCounter % BOT_ROSTER_INTERVAL_TICKS === 1) {
+        postBotRoster();
+    }
+
+    if (USE_TICK_ENDPOINT) {
+        // 1+2. Voxel Sensor (every 4 ticks) + Bot Motion (every 2 ticks) in one round trip per bot
+        if (tickCounter % 2 === 0) {
+            for (const p of world.getAllPlayers()) {
+                if (p.hasTag(AI_TAG)) {
+                    postTick(p, tickCounter % VOXEL_INTERVAL_TICKS === 0);
+                }
+            }
+        }
+    }
+
     // 1. Voxel Sensor (Every 4 ticks)
-    if (tickCounter % VOXEL_INTERVAL_TICKS === 0) {
+    if (!USE_TICK_ENDPOINT && tickCounter % VOXEL_INTERVAL_TICKS === 0) {
         const players = world.getAllPlayers();
         for (const p of players) {
             if (p.hasTag(AI_TAG)) {
@@ -132,7 +344,7 @@ system.runInterval(() => {
     }
 
     // 2. Bot Motion Polling (Every 2 ticks) - A* Movement
-    if (tickCounter % 2 === 0) {
+    if (!USE_TICK_ENDPOINT && tickCounter % 2 === 0) {
         const players = world.getAllPlayers();
         for (const p of players) {
             if (p.hasTag(AI_TAG)) {
@@ -141,15 +353,81 @@ system.runInterval(() => {
         }
     }
 
-    // 3. Global Command Polling (Every 20 ticks = 1 sec) - TP, Events
-    if (tickCounter % 20 === 0) {
+    // 3. Global Command Long-Poll - TP, Events
+    // One request stays open until the server has commands (or COMMAND_POLL_WAIT passes).
+    // It keeps running while bots tick: ticks only carry broadcast + bot/dimension commands,
+    // and commands for human players or dimensions without a bot come only through this poll.
+    // Both use the "minecraft" consumer, so each command arrives exactly once
+    if (!commandPollInFlight && tickCounter >= commandPollRetryAt) {
         pollGlobalCommands();
     }
 
 }, 1);
 
+// ai タグの付いたプレイヤーの一覧を全ワーカーに送る (いなくなったボットの brain はサーバーが捨てる)
+function postBotRoster() {
+    const bots = world.getAllPlayers().filter(p => p.hasTag(AI_TAG)).map(p => p.nameTag ?? p.name);
+    for (let i = 0; i < SERVER_WORKERS; i++) {
+        const req = new HttpRequest(`${SERVER_HOST}:${SERVER_PORT + i}/v1/mc/bots`);
+        req.method = HttpRequestMethod.Post;
+        req.headers = [["Content-Type", "application/json"]];
+        req.body = JSON.stringify({ bots });
+        http.request(req).catch(e => { }); // sent again next second
+    }
+}
+
+// 視界 (任意) + 溜まったイベントを送り、次の動作とコマンドを受け取る
+function postTick(player, withSnapshot) {
+    const name = player.nameTag ?? player.name;
+    // dimension: the server also returns commands addressed to this bot's dimension
+    // Events ride along and are forgotten only once the server has taken them (200);
+    // a tick that fails puts them back in front of any newer ones
+    const body = { player: name, dimension: player.dimension.id, events: pendingBotEvents.get(name) ?? [] };
+    pendingBotEvents.delete(name);
+
+    if (withSnapshot) {
+        try {
+            const snapshot = buildVoxelSnapshotForPlayer(player);
+            if (VOXEL_ENCODING === "packed") body.frame = encodePackedFrame(snapshot);
+            else body.snapshot = snapshot;
+        } catch (e) { }
+    }
+
+    const req = new HttpRequest(botServer(name) + TICK_ENDPOINT);
+    req.method = HttpRequestMethod.Post;
+    req.headers = [["Content-Type", "application/json"]];
+    req.body = JSON.stringify(body);
+
+    http.request(req).then(resp => {
+        if (resp.status !== 200) {
+            if (body.frame) voxelNeedKey.add(name);
+            requeueBotEvents(name, body.events);
+            return;
+        }
+        try {
+            const data = JSON.parse(resp.body);
+            // サーバーが差分の基準フレームを持っていない -> 次はキーフレーム
+            if (data.frame === "need_keyframe") voxelNeedKey.add(name);
+            if (data.move) executeBotAction(player, data.move);
+            for (const cmd of data.commands || []) {
+                processGlobalCommand(cmd);
+            }
+        } catch (e) { }
+    }).catch(e => {
+        if (body.frame) voxelNeedKey.add(name);
+        requeueBotEvents(name, body.events);
+    });
+}
+
+function requeueBotEvents(name, events) {
+    if (events.length === 0) return;
+    pendingBotEvents.set(name, events.concat(pendingBotEvents.get(name) ?? []));
+}
+
 function pollNextMove(player) {
-    const req = new HttpRequest("http://127.0.0.1:8082/v1/mc/next_move");
+    // Each AI bot has its own brain on the server, keyed like its snapshots / ticks
+    const name = player.nameTag ?? player.name;
+    const req = new HttpRequest(`${botServer(name)}/v1/mc/next_move?player_name=${encodeURIComponent(name)}`);
     req.method = HttpRequestMethod.Post;
     req.headers = [["Content-Type", "application/json"]];
     req.body = JSON.stringify({});
@@ -165,10 +443,13 @@ function pollNextMove(player) {
 }
 
 function pollGlobalCommands() {
-    const req = new HttpRequest("http://127.0.0.1:8082/v1/mc/commands");
+    const req = new HttpRequest(`${SERVER}/v1/mc/commands?wait=${COMMAND_POLL_WAIT}`);
     req.method = HttpRequestMethod.Get; // GET
+    req.timeout = COMMAND_POLL_WAIT + 5; // seconds; the server answers by COMMAND_POLL_WAIT
+    commandPollInFlight = true;
 
     http.request(req).then(resp => {
+        commandPollInFlight = false;
         if (resp.status === 200) {
             try {
                 const data = JSON.parse(resp.body);
@@ -177,8 +458,13 @@ function pollGlobalCommands() {
                     processGlobalCommand(cmd);
                 }
             } catch (e) { }
+        } else {
+            commandPollRetryAt = tickCounter + 20;
         }
-    }).catch(e => { });
+    }).catch(e => {
+        commandPollInFlight = false;
+        commandPollRetryAt = tickCounter + 20;
+    });
 }
 
 // Bot Action Execution (A* / Movement)
@@ -249,7 +535,19 @@ function processGlobalCommand(cmd) {
         }
     }
     else if (cmd.action === "chat") {
-        world.sendMessage(cmd.message);
+        // cmd.player: 発言した AI ボット (複数ボットをまとめて考えたとき)
+        world.sendMessage(cmd.player ? `§a[AI] ${cmd.player}: ${cmd.message}` : cmd.message);
+    }
+    else if ((cmd.action === "move" || cmd.action === "attack") && cmd.player) {
+        // 移動はサーバー側の追跡 (tick の move) が行う。ここでは向きと攻撃だけ
+        try {
+            const bot = world.getAllPlayers().find(p => p.name === cmd.player || p.nameTag === cmd.player);
+            const target = world.getAllPlayers().find(p => p.name === cmd.target);
+            if (bot && target) {
+                bot.lookAtEntity(target);
+                if (cmd.action === "attack") bot.attackEntity(target);
+            }
+        } catch (e) { }
     }
     else if (cmd.action === "title") {
         try {
@@ -325,19 +623,27 @@ world.afterEvents.entityHit.subscribe((event) => {
             attackerName = attacker.name;
         }
 
+        const victimName = victim.nameTag ?? victim.name;
         const payload = {
             type: "hit",
-            victim: victim.name,
+            victim: victimName,
             attacker: attackerName,
             timestamp: Date.now()
         };
 
-        sendEventToServer(payload);
+        if (USE_TICK_ENDPOINT) {
+            // Goes out with the bot's next tick (at most 2 ticks later)
+            const pending = pendingBotEvents.get(victimName) ?? [];
+            pending.push(payload);
+            pendingBotEvents.set(victimName, pending);
+        } else {
+            sendEventToServer(payload);
+        }
     }
 });
 
 function sendEventToServer(eventData) {
-    const req = new HttpRequest("http://127.0.0.1:8082/v1/mc/events");
+    const req = new HttpRequest(`${SERVER}/v1/mc/events`);
     req.method = HttpRequestMethod.Post;
     req.headers = [["Content-Type", "application/json"]];
     req.body = JSON.stringify(eventData);